@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# Time to the first GUI window, run headless with the Qt offscreen platform.
+# Every run starts a fresh interpreter (so nothing is imported yet) with an
+# empty home directory holding a plugin registry of the requested size.
+# Run from the repository root:
+#   python benchmarks/startup_bench.py [-n 5] [-p 0 50] [-o results.json]
+
+import argparse, json, os, shutil, subprocess, sys, tempfile, time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def make_registry(home, plugins, groups=5):
+  # Plugins spread over viewer and processing groups, a few without group
+  from tinydb import TinyDB
+  path = os.path.join(home, ".dcomex", "plugins")
+  os.makedirs(path, exist_ok=True)
+  db = TinyDB(os.path.join(path, "plugins.json"))
+  group_ids = []
+  for k in range(groups if plugins > 0 else 0):
+    group_ids.append(db.table("groups").insert({
+      "name": f"group{k}", "display": f"Group {k}", "type": "viewer" if k % 2 else "processing", "submenu": True,
+    }))
+  for k in range(plugins):
+    group = group_ids[k % len(group_ids)] if k % 4 else None
+    db.table("plugins").insert({
+      "name": f"plugin{k}", "display": f"Plugin {k}", "path": home, "settings": None,
+      "type": "python", "group": group, "viewer": k % 8 == 0,
+    })
+  db.close()
+
+def run_case(launched):
+  # Times are in ms since the parent launched the interpreter
+  def since():
+    return round((time.time() - launched) * 1000, 1)
+
+  result = {"interpreter_ms": since()}
+  os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+  sys.path.insert(0, ROOT)
+  from PyQt5.QtWidgets import QApplication
+  app = QApplication([])
+  result["qt_ms"] = since()
+
+  from dcomex.lib.mainwindow import MainWindow
+  result["import_ms"] = since()
+  result["viewer_imported"] = "dcomex.lib.viewer" in sys.modules
+
+  from PyQt5.QtCore import QObject, QEvent
+
+  class PaintWatcher(QObject):
+    # First time the window is painted, i.e. the user sees it
+    def eventFilter(self, obj, event):
+      if event.type() == QEvent.Paint and not "window_ms" in result:
+        result["window_ms"] = since()
+      return False
+
+  window = MainWindow()
+  watcher = PaintWatcher()
+  window.installEventFilter(watcher)
+  window.show()
+
+  # The first viewer tab is opened from the event loop
+  start = time.time()
+  while (window.tabs.count() == 0 or not "window_ms" in result) and time.time() - start < 60:
+    app.processEvents()
+  result["first_tab_ms"] = since()
+  result["modules"] = len(sys.modules)
+  return result
+
+def run_subprocess(plugins):
+  home = tempfile.mkdtemp(prefix="dcomex_bench_home_")
+  env = dict(os.environ, HOME=home, QT_QPA_PLATFORM="offscreen")
+  try:
+    make_registry(home, plugins)
+    cmd = [sys.executable, os.path.abspath(__file__), "--case", repr(time.time())]
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True, cwd=home)
+    if proc.returncode != 0:
+      return {"error": proc.stderr.strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+  finally:
+    shutil.rmtree(home, ignore_errors=True)
+
+def median(values):
+  values = sorted(values)
+  return values[len(values) // 2] if len(values) > 0 else None
+
+def main():
+  parser = argparse.ArgumentParser(description="GUI startup benchmark")
+  parser.add_argument("-n", dest="runs", type=int, default=5, help="Runs per registry size")
+  parser.add_argument("-p", dest="plugins", type=int, nargs="*", default=[0, 50], help="Number of installed plugins")
+  parser.add_argument("-o", dest="output", default=None, help="Write the results as json to this file")
+  parser.add_argument("--json", dest="json_output", action="store_true", help="Print the results as json")
+  parser.add_argument("--case", dest="case", type=float, default=None, help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if not args.case is None:
+    print(json.dumps(run_case(args.case)))
+    return
+
+  results = []
+  for plugins in args.plugins:
+    runs = [run_subprocess(plugins) for _ in range(args.runs)]
+    errors = [r["error"] for r in runs if "error" in r]
+    runs = [r for r in runs if not "error" in r]
+    result = {"plugins": plugins, "runs": len(runs)}
+    if len(errors) > 0:
+      result["error"] = errors[0]
+    for key in ("interpreter_ms", "qt_ms", "import_ms", "window_ms", "first_tab_ms", "modules"):
+      result[key] = median([r[key] for r in runs])
+    result["viewer_imported"] = any(r["viewer_imported"] for r in runs)
+    results.append(result)
+
+  report = {"python": sys.version.split()[0], "results": results}
+  if not args.output is None:
+    with open(args.output, "w") as json_file:
+      json.dump(report, json_file, indent=2)
+
+  if args.json_output:
+    print(json.dumps(report, indent=2))
+    return
+
+  print("{:<8} {:<8} {:<10} {:<12} {:<12} {:<14} {:<8}".format("Plugins", "Qt(ms)", "Import(ms)", "Window(ms)", "FirstTab(ms)", "ViewerEager", "Modules"))
+  for r in results:
+    if r["runs"] == 0:
+      print("{:<8} error: {}".format(r["plugins"], " ".join(r.get("error", []))))
+      continue
+    print("{:<8} {:<8} {:<10} {:<12} {:<12} {:<14} {:<8}".format(
+      r["plugins"], r["qt_ms"], r["import_ms"], r["window_ms"], r["first_tab_ms"], str(r["viewer_imported"]), r["modules"]))
+
+if __name__ == "__main__":
+  main()
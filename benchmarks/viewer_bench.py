@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# Viewer pipeline timings on synthetic NIfTI volumes, run headless with the
+# Qt offscreen platform. Every case runs in its own process (so the peak
+# memory is per case) with an empty home directory (so the caches are cold).
+# Run from the repository root:
+#   python benchmarks/viewer_bench.py [-s 128 256 512] [-k int16 float32 labels] [-o results.json]
+
+import argparse, json, os, resource, shutil, subprocess, sys, tempfile, time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+KINDS = ("int16", "float32", "labels")
+
+def make_volume(filename, size, kind):
+  # A sphere with an inner core, a small lesion and noise, built slab by slab
+  # so no float64 copy of the whole volume is made
+  import numpy as np
+  import nibabel as nb
+
+  dtype = {"int16": np.int16, "float32": np.float32, "labels": np.uint8}[kind]
+  data = np.empty((size, size, size), dtype=dtype)
+  rng = np.random.default_rng(size)
+  c = (np.arange(size, dtype=np.float32) - size / 2) / (size / 2)
+  xy = c[:, None] ** 2 + c[None, :] ** 2
+  for k in range(size):
+    r = np.sqrt(xy + c[k] ** 2)
+    lesion = ((c[:, None] - 0.3) ** 2 + c[None, :] ** 2 + (c[k] - 0.2) ** 2) < 0.01
+    if kind == "labels":
+      data[:, :, k] = (r < 0.8).astype(np.uint8) + (r < 0.4) + 2 * lesion
+    else:
+      values = 800.0 * (r < 0.8) + 400.0 * (r < 0.4) + 600.0 * lesion + rng.normal(0, 40, xy.shape)
+      data[:, :, k] = values.astype(dtype)
+  nb.save(nb.Nifti1Image(data, np.diag([1.0, 1.0, 1.0, 1.0])), filename)
+
+def percentiles(times):
+  times = sorted(times)
+  if len(times) == 0:
+    return {"median_ms": None, "p95_ms": None}
+  return {
+    "median_ms": round(times[len(times) // 2] * 1000, 3),
+    "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 3),
+  }
+
+def wait_pyramid(viewer, volume, timeout=300):
+  pyramid = viewer.pyramids.get(volume.uid)
+  if pyramid is None or pyramid.thread is None:
+    return None
+  start = time.perf_counter()
+  pyramid.thread.join(timeout)
+  return round(time.perf_counter() - start, 3)
+
+def run_case(filename, size, kind, slices):
+  os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+  from PyQt5.QtWidgets import QApplication
+  app = QApplication.instance() or QApplication([])
+
+  from dcomex.lib.workspace import Workspace
+  from dcomex.lib.viewer3d import Viewer3D
+
+  viewer = Viewer3D(Workspace())
+  viewer.resize(1200, 900)
+  viewer.show()
+  app.processEvents()
+
+  result = {"size": size, "kind": kind}
+  is_seg = kind == "labels"
+  indices = sorted(set(int(i) for i in [k * (size - 1) / max(slices - 1, 1) for k in range(slices)]))
+
+  # Label maps are shown as images in the 2D panels as well, like a user
+  # would need an image loaded to see the 3D panel
+  start = time.perf_counter()
+  viewer.load_image(filename)
+  result["load_s"] = round(time.perf_counter() - start, 3)
+  volume = viewer.images[0]
+  viewer.update_image_2d_points(reset=True)
+  viewer.scheduler.flush()
+  result["pyramid_s"] = wait_pyramid(viewer, volume)
+
+  # Slice reads and image conversion, without the slice cache
+  for panel, axis in viewer.panels_2d:
+    times = []
+    for i in indices:
+      start = time.perf_counter()
+      panel.render_slice(volume, axis, i)
+      times.append(time.perf_counter() - start)
+    result[f"render_axis{axis}"] = percentiles(times)
+
+  # Point changes through the scheduler down to the image items
+  times = []
+  for i in indices:
+    viewer.point = [i, i, i]
+    start = time.perf_counter()
+    viewer.update_image_2d_points()
+    viewer.scheduler.flush()
+    times.append(time.perf_counter() - start)
+  result["update_2d"] = percentiles(times)
+
+  # Scrolling through every slice as fast as events are processed
+  viewer.slice_cache.clear()
+  panel = viewer.top_left_panel
+  frames = viewer.scheduler.frames
+  start = time.perf_counter()
+  for i in range(size):
+    panel.scroll_bar.setValue(i)
+    app.processEvents()
+  viewer.scheduler.flush()
+  elapsed = time.perf_counter() - start
+  result["scroll"] = {
+    "slices_per_s": round(size / elapsed, 1),
+    "frames_per_s": round((viewer.scheduler.frames - frames) / elapsed, 1),
+    "cache_hits": viewer.slice_cache.hits,
+    "cache_misses": viewer.slice_cache.misses,
+  }
+
+  if is_seg:
+    start = time.perf_counter()
+    viewer.load_image(filename, is_seg=True)
+    result["seg_load_s"] = round(time.perf_counter() - start, 3)
+
+    seg = viewer.seg_image
+    data = seg.get_data()
+    times = []
+    for _ in range(3):
+      start = time.perf_counter()
+      viewer.bottom_left_panel.create_image(data)
+      times.append(time.perf_counter() - start)
+    result["create_image_3d"] = percentiles(times)
+
+    start = time.perf_counter()
+    viewer.update_image_3d_points(reset=True)
+    viewer.scheduler.flush()
+    result["render_3d_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+  viewer.release_volumes()
+  result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+  return result
+
+def run_subprocess(filename, size, kind, slices):
+  home = tempfile.mkdtemp(prefix="dcomex_bench_home_")
+  env = dict(os.environ, HOME=home, QT_QPA_PLATFORM="offscreen")
+  try:
+    cmd = [sys.executable, os.path.abspath(__file__), "--case", filename, str(size), kind, "--slices", str(slices)]
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+      return {"size": size, "kind": kind, "error": proc.stderr.strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+  finally:
+    shutil.rmtree(home, ignore_errors=True)
+
+def main():
+  parser = argparse.ArgumentParser(description="Viewer pipeline benchmark")
+  parser.add_argument("-s", dest="sizes", type=int, nargs="*", default=[128, 256, 512])
+  parser.add_argument("-k", dest="kinds", nargs="*", choices=KINDS, default=list(KINDS))
+  parser.add_argument("--slices", dest="slices", type=int, default=32, help="Slices sampled for the latencies")
+  parser.add_argument("--workdir", dest="workdir", default=None, help="Directory for the synthetic volumes (kept)")
+  parser.add_argument("-o", dest="output", default=None, help="Write the results as json to this file")
+  parser.add_argument("--json", dest="json_output", action="store_true", help="Print the results as json")
+  parser.add_argument("--case", dest="case", nargs=3, default=None, help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if not args.case is None:
+    filename, size, kind = args.case
+    print(json.dumps(run_case(filename, int(size), kind, args.slices)))
+    return
+
+  workdir = args.workdir if not args.workdir is None else tempfile.mkdtemp(prefix="dcomex_bench_")
+  os.makedirs(workdir, exist_ok=True)
+
+  results = []
+  try:
+    for size in args.sizes:
+      for kind in args.kinds:
+        filename = os.path.join(workdir, f"{kind}_{size}.nii")
+        if not os.path.isfile(filename):
+          make_volume(filename, size, kind)
+        results.append(run_subprocess(filename, size, kind, args.slices))
+  finally:
+    if args.workdir is None:
+      shutil.rmtree(workdir, ignore_errors=True)
+
+  report = {"python": sys.version.split()[0], "results": results}
+  if not args.output is None:
+    with open(args.output, "w") as json_file:
+      json.dump(report, json_file, indent=2)
+
+  if args.json_output:
+    print(json.dumps(report, indent=2))
+    return
+
+  print("{:<6} {:<8} {:<8} {:<10} {:<12} {:<12} {:<12} {:<10}".format("Size", "Kind", "Load(s)", "Slice(ms)", "Update(ms)", "Scroll(/s)", "Frames(/s)", "Peak(MB)"))
+  for r in results:
+    if "error" in r:
+      print("{:<6} {:<8} error: {}".format(r["size"], r["kind"], " ".join(r["error"])))
+      continue
+    print("{:<6} {:<8} {:<8} {:<10} {:<12} {:<12} {:<12} {:<10}".format(
+      r["size"], r["kind"], r["load_s"], r["render_axis2"]["median_ms"], r["update_2d"]["median_ms"],
+      r["scroll"]["slices_per_s"], r["scroll"]["frames_per_s"], r["peak_rss_mb"]))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# Memory footprint of workspace entries held as plain dicts (the JSON layout)
+# versus Data records. Run from the repository root:
+#   python benchmarks/workspace_memory.py [-n 10000 100000 500000]
+
+import argparse, gc, json, os, sys, tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from dcomex.lib.data import Data
+
+def make_json(count):
+  names = ["t1", "t1c", "t2", "fla", "seg", "mesh"]
+  items = []
+  for i in range(count):
+    name = names[i % len(names)]
+    dtype = "mesh" if name == "mesh" else "image"
+    items.append({
+      "name": name,
+      "type": dtype,
+      "subtype": "" if dtype == "mesh" else "nifti",
+      "ismultiple": False,
+      "value": f"/data/cohort/sub-{i // len(names):06d}/{name}.nii.gz"
+    })
+  return json.dumps({"data": items})
+
+def measure(build, text):
+  gc.collect()
+  tracemalloc.start()
+  entries = build(text)
+  gc.collect()
+  size, _ = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  del entries
+  return size
+
+def build_dicts(text):
+  return json.loads(text)["data"]
+
+def build_records(text):
+  return [Data.from_dict(d) for d in json.loads(text)["data"]]
+
+def main():
+  parser = argparse.ArgumentParser(description="Workspace entry memory benchmark")
+  parser.add_argument("-n", dest="counts", type=int, nargs="*", default=[10000, 100000, 500000])
+  parser.add_argument("--json", dest="json_output", action="store_true", help="Print the results as json")
+  args = parser.parse_args()
+
+  results = []
+  for count in args.counts:
+    text = make_json(count)
+    dicts = measure(build_dicts, text)
+    records = measure(build_records, text)
+    results.append({"entries": count, "dict_bytes": dicts, "record_bytes": records, "ratio": round(dicts / max(records, 1), 2)})
+
+  if args.json_output:
+    print(json.dumps(results, indent=2))
+    return
+
+  print("{:<10} {:<15} {:<15} {:<10}".format("Entries", "Dicts (MB)", "Records (MB)", "Ratio"))
+  for r in results:
+    print("{:<10} {:<15.2f} {:<15.2f} {:<10}".format(r["entries"], r["dict_bytes"] / 2**20, r["record_bytes"] / 2**20, r["ratio"]))
+
+if __name__ == "__main__":
+  main()
@@ -72,6 +72,61 @@ def parse_args(params=None):
   plugin_set.add_argument('-k', '--kwarg', dest='kwargs', action=UpdateAction, type=dict_load, default={}, help='Named set arguments for the plugin in yaml or json format')
 
 
+  #Handle dicom submodule
+  dicom = subparsers.add_parser('dicom', description='Index and convert DICOM series')
+  dicom_subparsers = dicom.add_subparsers(dest='action')
+
+  #Handle dicom index action
+  dicom_index = dicom_subparsers.add_parser('index', description='List the DICOM series found in a directory')
+  dicom_index.add_argument('path', metavar='path', type=str, help='The directory to search for DICOM files')
+  dicom_index.add_argument('-w', '--workers', dest='workers', type=int, default=None, help='Number of threads used to read headers')
+  dicom_index.add_argument('--no-cache', dest='no_cache', action='store_true', help='Ignore the cached series index')
+
+  #Handle dicom convert action
+  dicom_convert = dicom_subparsers.add_parser('convert', description='Convert the DICOM series found in a directory to NIfTI')
+  dicom_convert.add_argument('path', metavar='path', type=str, help='The directory to search for DICOM files')
+  dicom_convert.add_argument('output', metavar='output', type=str, help='The directory to save the NIfTI files to')
+  dicom_convert.add_argument('-w', '--workers', dest='workers', type=int, default=None, help='Number of threads used for reading and conversion')
+  dicom_convert.add_argument('--workspace', dest='workspace', type=str, default=None, help='Workspace file to add the converted images to')
+
+  #Handle workspace submodule
+  workspace = subparsers.add_parser('workspace', description='Manage workspace files')
+  workspace_subparsers = workspace.add_subparsers(dest='action')
+
+  #Handle workspace split action
+  workspace_split = workspace_subparsers.add_parser('split', description='Partition a workspace into shards by subject')
+  workspace_split.add_argument('workspace', metavar='workspace', type=str, help='The workspace file to split')
+  workspace_split.add_argument('shards', metavar='shards', type=int, help='The number of shards to create')
+  workspace_split.add_argument('-o', '--output', dest='output', type=str, default=None, help='Directory for the shard files. Defaults to the workspace directory')
+  workspace_split.add_argument('--by', dest='by', type=str, choices=['subject', 'cost'], default='subject', help='Balance shards by number of entries per subject or by estimated cost (file size) [subject, cost]')
+  workspace_split.add_argument('--pattern', dest='pattern', type=str, default=None, help='Regular expression extracting the subject from a file path, the first group is used if present. Defaults to the parent folder name')
+
+  #Handle workspace merge action
+  workspace_merge = workspace_subparsers.add_parser('merge', description='Merge workspace shards into one workspace')
+  workspace_merge.add_argument('output', metavar='output', type=str, help='The merged workspace file')
+  workspace_merge.add_argument('shards', metavar='shards', type=str, nargs='+', help='The shard workspace files')
+  workspace_merge.add_argument('-r', '--remap', dest='remaps', action='append', default=[], type=str, help='Remap a path prefix as OLD=NEW, can be repeated')
+  workspace_merge.add_argument('--prefer', dest='prefer', type=str, choices=['first', 'last'], default='first', help='Which shard wins when entries conflict, shards are ordered by file name [first, last]')
+  workspace_merge.add_argument('-v', '--verbose', dest='verbose', action='store_true', help='Print every conflicting entry')
+
+  #Handle workspace verify action
+  workspace_verify = workspace_subparsers.add_parser('verify', description='Check the files of a workspace against their stored fingerprints')
+  workspace_verify.add_argument('workspace', metavar='workspace', type=str, help='The workspace file to verify')
+  workspace_verify.add_argument('-w', '--workers', dest='workers', type=int, default=None, help='Number of threads used for hashing')
+  workspace_verify.add_argument('--rehash', dest='rehash', action='store_true', help='Hash every file again instead of trusting unchanged file stats')
+  workspace_verify.add_argument('--update', dest='update', action='store_true', help='Store the fingerprints of changed files, they are reported again on the next run otherwise')
+  workspace_verify.add_argument('-v', '--verbose', dest='verbose', action='store_true', help='Also print files which are unchanged')
+
+  #Handle qc submodule
+  qc = subparsers.add_parser('qc', description='Render QC montages (three orthogonal slices with segmentation overlay) and an HTML index')
+  qc.add_argument('input', metavar='input', type=str, help='A workspace file, or a CSV/TSV manifest with subject, image and segmentation columns')
+  qc.add_argument('-o', '--output', dest='output', type=str, default=None, help='Directory for the montages and index.html. Defaults to a qc folder next to the input')
+  qc.add_argument('-w', '--workers', dest='workers', type=int, default=None, help='Number of worker processes')
+  qc.add_argument('--pattern', dest='pattern', type=str, default=None, help='Regular expression extracting the subject from a file path, the first group is used if present. Defaults to the parent folder name')
+  qc.add_argument('--image', dest='image', type=str, default=None, help='Regular expression selecting the image entry of a subject by name or file name. Defaults to the first image')
+  qc.add_argument('--seg', dest='seg', type=str, default=None, help='Regular expression telling segmentation entries apart by name or file name. Defaults to "seg|label|mask"')
+  qc.add_argument('--size', dest='size', type=int, default=256, help='Size in pixels of the longest side of each slice. Defaults to 256')
+  qc.add_argument('--opacity', dest='opacity', type=float, default=0.5, help='Opacity of the segmentation overlay. Defaults to 0.5')
 
   #Handle process submodule
   process = subparsers.add_parser('run', description='Invoke the processing engine')
@@ -0,0 +1,59 @@
+from __future__ import print_function
+from .lib.dicom import DicomIndex, convert_series
+from .lib.workspace import Workspace
+from .lib.data import DataType, ImageType
+import os
+
+def handle_dicom(args):
+  action = args.action
+
+  if action == "index":
+    handle_index(args)
+  elif action == "convert":
+    handle_convert(args)
+  else:
+    print(f"Action '{action}' not handled!")
+
+def handle_index(args):
+  index = DicomIndex(args.path, workers=args.workers)
+  series = index.scan(use_cache=not args.no_cache)
+  print("{:<8} {:<10} {:<30} {:<8} {:<40}".format('Number','Modality','Description','Files','Series UID'))
+  print("{:<8} {:<10} {:<30} {:<8} {:<40}".format('------','--------','-----------','-----','----------'))
+  for s in series:
+    print("{:<8} {:<10} {:<30} {:<8} {:<40}".format(str(s['number']), s['modality'], s['description'][:30], len(s['files']), s['id']))
+
+def handle_convert(args):
+  index = DicomIndex(args.path, workers=args.workers)
+  series = index.scan()
+  if len(series) == 0:
+    print(f"No DICOM series found in '{args.path}'")
+    return
+
+  output_dir = os.path.abspath(args.output)
+  outputs = convert_series(series, output_dir, workers=args.workers)
+
+  for s in series:
+    filename = outputs.get(s["id"])
+    if not filename is None:
+      print(f"{s['id']} -> {filename}")
+
+  if not args.workspace is None:
+    workspace = Workspace()
+    if os.path.isfile(args.workspace):
+      workspace.load(args.workspace)
+
+    for s in series:
+      filename = outputs.get(s["id"])
+      if filename is None:
+        continue
+
+      name = s["description"] if s["description"] != "" else f"series_{s['number']}"
+      workspace.add({
+        "name": name,
+        "type": DataType.IMAGE.value,
+        "subtype": ImageType.NIFTI.value,
+        "ismultiple": False,
+        "value": filename
+      })
+
+    workspace.save(args.workspace)
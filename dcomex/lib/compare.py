@@ -0,0 +1,67 @@
+import numpy as np
+
+MODES = {"difference": "Difference", "ratio": "Ratio", "checkerboard": "Checkerboard"}
+TILE_SIZE = 16
+# Largest difference (in mm) between the affines of volumes on the same grid
+AFFINE_TOLERANCE = 1e-3
+
+def _window(volume):
+  if not volume.window is None:
+    return [float(w) for w in volume.window]
+  if not volume.range is None:
+    return [float(r) for r in volume.range]
+  return [0.0, 1.0]
+
+def same_grid(volume, other, tolerance=AFFINE_TOLERANCE):
+  if volume.shape != other.shape:
+    return False
+  if volume.affine is None or other.affine is None:
+    return True
+  return bool(np.allclose(volume.affine, other.affine, rtol=0, atol=tolerance))
+
+class VolumeComparison:
+  # Compares the shown volume with a reference volume on the same grid one
+  # slice at a time: only the two slices shown are read, so no difference
+  # volume is ever built and the slices go through the slice cache like any
+  # other slice
+  def __init__(self, volume, other, mode, tile=TILE_SIZE) -> None:
+    self.volume = volume
+    self.other = other
+    self.mode = mode
+    self.tile = tile
+
+  @property
+  def loading(self):
+    return self.volume.loading or self.other.loading
+
+  def key(self):
+    return (self.mode, self.other.uid)
+
+  def levels(self):
+    # Differences are centered on 0 and ratios on 1, the checkerboard keeps
+    # the window of the shown volume
+    lo, hi = _window(self.volume)
+    if self.mode == "difference":
+      span = max(hi - lo, 1e-6) / 2
+      return [-span, span]
+    if self.mode == "ratio":
+      return [0.0, 2.0]
+    return [lo, hi]
+
+  def slice(self, axis, index, frame=0):
+    a = np.asarray(self.volume.slice(axis, index, frame), dtype=np.float32)
+    b = np.asarray(self.other.slice(axis, index, min(frame, self.other.frames - 1)), dtype=np.float32)
+    if self.mode == "difference":
+      return a - b
+    if self.mode == "ratio":
+      out = np.zeros_like(a)
+      np.divide(a, b, out=out, where=b != 0)
+      return out
+
+    # The reference is mapped into the window of the shown volume so both
+    # sets of tiles are displayed with the same levels
+    lo, hi = _window(self.volume)
+    rlo, rhi = _window(self.other)
+    b = (b - rlo) * ((hi - lo) / max(rhi - rlo, 1e-6)) + lo
+    tiles = ((np.arange(a.shape[0]) // self.tile)[:, None] + (np.arange(a.shape[1]) // self.tile)[None, :]) % 2 == 1
+    return np.where(tiles, b, a)
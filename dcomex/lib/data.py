@@ -1,4 +1,4 @@
-import enum, os
+import enum, sys
 
 class DataType(enum.Enum):
   IMAGE = 'image'
@@ -52,13 +52,91 @@ class ScalarType(enum.Enum):
     
     return None
 
+_UNSET = object()
+
 class Data:
-  def __init__(self, name: str, dtype: DataType, is_array: bool, file_fmt: str, file_path: str, scalar_dtype: ScalarType) -> None:
-    self.name = name
-    self.dtype = dtype
-    self.is_array = is_array
-    self.file_fmt = file_fmt
-    self.file_path = os.path.join(file_path)
-    self.scalar_dtype = scalar_dtype
-    self.items = []
-  
\ No newline at end of file
+  # Workspace entry, the known keys live in slots and anything else a plugin
+  # output carries (display, required, ...) is kept in `extra`. Slots of keys
+  # the entry does not have are left unassigned, so they are not saved
+  __slots__ = ("name", "type", "subtype", "ismultiple", "value", "extra")
+  FIELDS = ("name", "type", "subtype", "ismultiple", "value")
+
+  # Entries compare equal to their dicts and are changed in place, so they
+  # are not hashable (like the dicts they replace)
+  __hash__ = None
+
+  def __init__(self, name: str = _UNSET, type: str = _UNSET, subtype: str = _UNSET, ismultiple: bool = _UNSET, value=_UNSET, extra: dict = None) -> None:
+    for k, v in zip(self.FIELDS, (name, type, subtype, ismultiple, value)):
+      if not v is _UNSET:
+        setattr(self, k, _intern(v) if k != "value" else v)
+    self.extra = extra if extra else None
+
+  @classmethod
+  def from_dict(cls, data):
+    if isinstance(data, Data):
+      return data
+
+    extra = None
+    for k in data:
+      if not k in cls.FIELDS:
+        if extra is None:
+          extra = {}
+        extra[_intern(k)] = data[k]
+
+    return cls(*[data.get(k, _UNSET) for k in cls.FIELDS], extra)
+
+  def to_dict(self) -> dict:
+    data = {}
+    for k in self.FIELDS:
+      v = getattr(self, k, _UNSET)
+      if not v is _UNSET:
+        data[k] = v
+    if not self.extra is None:
+      data.update(self.extra)
+    return data
+
+  def get(self, key, default=None):
+    if key in self.FIELDS:
+      return getattr(self, key, default)
+    if not self.extra is None:
+      return self.extra.get(key, default)
+    return default
+
+  def keys(self):
+    keys = [k for k in self.FIELDS if hasattr(self, k)]
+    if not self.extra is None:
+      keys.extend(self.extra.keys())
+    return keys
+
+  def __getitem__(self, key):
+    if key in self.FIELDS and hasattr(self, key):
+      return getattr(self, key)
+    if (not self.extra is None) and key in self.extra:
+      return self.extra[key]
+    raise KeyError(key)
+
+  def __setitem__(self, key, value):
+    if key in self.FIELDS:
+      setattr(self, key, value)
+    else:
+      if self.extra is None:
+        self.extra = {}
+      self.extra[key] = value
+
+  def __contains__(self, key):
+    if key in self.FIELDS:
+      return hasattr(self, key)
+    return (not self.extra is None) and key in self.extra
+
+  def __eq__(self, other):
+    if isinstance(other, Data):
+      other = other.to_dict()
+    return self.to_dict() == other
+
+  def __repr__(self):
+    return f"Data({self.to_dict()})"
+
+def _intern(value):
+  if isinstance(value, str):
+    return sys.intern(value)
+  return value
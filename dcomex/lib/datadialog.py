@@ -1,18 +1,22 @@
-import typing, copy
+import typing
 from PyQt5.QtWidgets import QWidget, QPushButton, QVBoxLayout, QTableView, QDialog
 from PyQt5.QtWidgets import QHBoxLayout, QLabel, QLineEdit, QComboBox, QCheckBox, QListWidget
 from PyQt5.QtWidgets import QFileDialog, QMessageBox, QDateTimeEdit
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QSize
 from PyQt5.QtGui import QIntValidator, QDoubleValidator
-from .data import DataType, ScalarType, ImageType
+from .data import DataType, ScalarType, ImageType, Data
 from .qtdata import TableModel
+from .thumbnails import thumbnail_provider, THUMB_SIZE
 from .workspace import Workspace
 
 class DataDialog(QDialog):
   def __init__(self, workspace: Workspace, parent: typing.Optional[QWidget] = None) -> None:
     super().__init__(parent)
     self._workspace = workspace
-    self._data = copy.deepcopy(self._workspace.data)
+    # Entries are shared with the workspace until the first edit, edits
+    # replace whole entries so copying the list is enough (copy-on-write)
+    self._data = self._workspace.data
+    self._data_copied = False
     self.setMinimumSize(700, 500)
     self.setWindowTitle("Data Store")
     self.setWindowModality(Qt.WindowModality.ApplicationModal)
@@ -25,13 +29,44 @@ class DataDialog(QDialog):
     self.setLayout(self._layout)
 
   def build_table(self):
-    items, headers = self.load_table_data()
-    self.model = TableModel(items, headers, self)
+    filter_layout = QHBoxLayout()
+    filter_label = QLabel("Filter", self)
+    self.filter_field = QLineEdit(self)
+    self.filter_field.textChanged.connect(self.on_filter_changed)
+    filter_layout.addWidget(filter_label)
+    filter_layout.addWidget(self.filter_field)
+    self._layout.addLayout(filter_layout)
+
+    headers = ["Name", "Type", "Sub Type", "Value"]
+    # Thumbnails are asked for only by the rows in view and filled in when
+    # they are rendered
+    provider = thumbnail_provider()
+    self.model = TableModel(self._data, headers, self, row_data=self.table_row, decoration=provider.icon)
+    provider.ready.connect(self.on_thumbnail_ready)
     self.view = QTableView()
     self.view.setModel(self.model)
+    self.view.setIconSize(QSize(THUMB_SIZE // 2, THUMB_SIZE // 2))
+    self.view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+    self.view.setSortingEnabled(True)
     self._layout.addWidget(self.view)
 
+  def table_row(self, d):
+    return [d.get("name"), d.get("type"), d.get("subtype"), d.get("value")]
+
+  def on_thumbnail_ready(self, filename):
+    self.model.decorations_changed()
+
+  def on_filter_changed(self, text):
+    self.model.set_filter(text)
+
+  def copy_data(self):
+    if not self._data_copied:
+      self._data = list(self._data)
+      self._data_copied = True
+
   def save_current_data(self, data, index=None):
+    self.copy_data()
+    data = Data.from_dict(data)
     if index is None:
       self._data.append(data)
     else:
@@ -40,19 +75,7 @@ class DataDialog(QDialog):
     self.refresh_table()
 
   def refresh_table(self):
-    items, headers = self.load_table_data()
-    self.model.deleteLater()
-    self.model = TableModel(data=items, headers=headers, parent=self)
-    self.view.setModel(self.model)
-
-  def load_table_data(self):
-    _data = self._data
-    items = []
-    for d in _data:
-      items.append([d.get("name"), d.get("type"), d.get("subtype"), d.get("value")])
-
-    headers = ["Name", "Type", "Sub Type", "Value"]
-    return items, headers
+    self.model.set_records(self._data)
 
   def build_buttons(self):
     widget = QWidget(self)
@@ -91,6 +114,7 @@ class DataDialog(QDialog):
 
   def save_data(self):
     self._workspace.data = self._data
+    self._data_copied = False
     self.show_msg("Data successfully updated!")
 
   def on_add_file_clicked(self):
@@ -103,10 +127,11 @@ class DataDialog(QDialog):
     result = QMessageBox.question(self, "Remove Item!", "Are you sure you want to remove item(s) ?",QMessageBox.Yes| QMessageBox.No)
     if result == QMessageBox.Yes:
       indexes = self.view.selectedIndexes()
-      idxs = []
+      idxs = set()
       for idx in indexes:
-        idxs.append(idx.row())
-      
+        idxs.add(self.model.source_row(idx.row()))
+
+      self.copy_data()
       idxs = sorted(idxs, reverse=True)
       for idx in idxs:
         self._data.pop(idx)
@@ -116,9 +141,9 @@ class DataDialog(QDialog):
   def on_edit_selected_clicked(self):
     indexes = self.view.selectedIndexes()
     if len(indexes) > 0:
-      index = indexes[0].row()
+      index = self.model.source_row(indexes[0].row())
       data = self._data[index]
-      if not isinstance(data, dict):
+      if not isinstance(data, (dict, Data)):
         return
 
       dtype = data.get("type")
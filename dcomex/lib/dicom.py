@@ -0,0 +1,295 @@
+import os, json, hashlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import nibabel as nb
+import pydicom
+
+CACHE_BASE = os.path.join(os.path.expanduser("~"), ".dcomex", "cache", "dicom")
+NIFTI_EXTENSIONS = (".nii", ".nii.gz", ".img", ".hdr", ".mgz")
+
+# Only these tags are parsed while indexing, pixel data is never touched
+GROUPING_TAGS = [
+  "PatientID",
+  "StudyInstanceUID",
+  "SeriesInstanceUID",
+  "SeriesNumber",
+  "SeriesDescription",
+  "Modality",
+  "InstanceNumber",
+  "Rows",
+  "Columns",
+  "ImagePositionPatient",
+  "ImageOrientationPatient",
+]
+
+def read_header(filename):
+  try:
+    ds = pydicom.dcmread(filename, stop_before_pixels=True, specific_tags=GROUPING_TAGS)
+  except Exception:
+    return None
+
+  uid = ds.get("SeriesInstanceUID")
+  if uid is None:
+    return None
+
+  def _list(value):
+    if value is None:
+      return None
+    return [float(v) for v in value]
+
+  def _int(value):
+    try:
+      return int(value)
+    except Exception:
+      return None
+
+  return {
+    "file": filename,
+    "patient_id": str(ds.get("PatientID", "")),
+    "study_uid": str(ds.get("StudyInstanceUID", "")),
+    "series_uid": str(uid),
+    "series_number": _int(ds.get("SeriesNumber")),
+    "description": str(ds.get("SeriesDescription", "")),
+    "modality": str(ds.get("Modality", "")),
+    "instance": _int(ds.get("InstanceNumber")),
+    "rows": _int(ds.get("Rows")),
+    "columns": _int(ds.get("Columns")),
+    "position": _list(ds.get("ImagePositionPatient")),
+    "orientation": _list(ds.get("ImageOrientationPatient")),
+  }
+
+def is_dicom_file(filename):
+  # Single files given where a series is expected, NIfTI files are never read
+  if not os.path.isfile(filename) or filename.lower().endswith(NIFTI_EXTENSIONS):
+    return False
+  return not read_header(filename) is None
+
+def slice_normal(orientation):
+  row = np.array(orientation[:3])
+  col = np.array(orientation[3:])
+  return np.cross(row, col)
+
+class DicomIndex:
+  def __init__(self, root, cache_dir=CACHE_BASE, workers=None) -> None:
+    self.root = os.path.abspath(root)
+    self.cache_dir = cache_dir
+    self.workers = workers
+    key = hashlib.sha1(self.root.encode("utf-8")).hexdigest()
+    self.cache_file = os.path.join(cache_dir, f"index_{key}.json")
+    self.dirs = {}
+
+  def load_cache(self):
+    if not os.path.isfile(self.cache_file):
+      return {}
+
+    try:
+      with open(self.cache_file, "r") as json_file:
+        data = json.load(json_file)
+      if data.get("root") == self.root:
+        return data.get("dirs", {})
+    except Exception as ex:
+      print(f"Error loading dicom index cache:\n{ex}")
+
+    return {}
+
+  def save_cache(self):
+    os.makedirs(self.cache_dir, exist_ok=True)
+    tmp_file = self.cache_file + ".tmp"
+    with open(tmp_file, "w") as json_file:
+      json.dump({"root": self.root, "dirs": self.dirs}, json_file)
+    os.replace(tmp_file, self.cache_file)
+
+  def _scan_dir(self, path, cached):
+    try:
+      mtime = os.stat(path).st_mtime_ns
+    except OSError:
+      return path, None, False
+
+    if (not cached is None) and cached.get("mtime_ns") == mtime:
+      return path, cached, False
+
+    files, subdirs = [], []
+    try:
+      with os.scandir(path) as it:
+        for entry in it:
+          if entry.is_dir(follow_symlinks=False):
+            subdirs.append(entry.path)
+          elif entry.is_file():
+            files.append(entry.path)
+    except OSError:
+      return path, None, False
+
+    return path, {"mtime_ns": mtime, "subdirs": sorted(subdirs), "files": sorted(files), "headers": []}, True
+
+  def scan(self, use_cache=True):
+    cached = self.load_cache() if use_cache else {}
+    self.dirs = {}
+    changed = []
+
+    with ThreadPoolExecutor(max_workers=self.workers) as pool:
+      level = [self.root]
+      while len(level) > 0:
+        results = pool.map(lambda p: self._scan_dir(p, cached.get(p)), level)
+        level = []
+        for path, info, is_changed in results:
+          if info is None:
+            continue
+          self.dirs[path] = info
+          level.extend(info["subdirs"])
+          if is_changed:
+            changed.append(path)
+
+      files = [f for d in changed for f in self.dirs[d]["files"]]
+      headers = pool.map(read_header, files)
+
+      by_dir = {}
+      for hdr in headers:
+        if not hdr is None:
+          by_dir.setdefault(os.path.dirname(hdr["file"]), []).append(hdr)
+
+      for d in changed:
+        self.dirs[d]["headers"] = by_dir.get(d, [])
+
+    if use_cache:
+      self.save_cache()
+
+    return self.series()
+
+  def headers(self):
+    for d in sorted(self.dirs):
+      for hdr in self.dirs[d].get("headers", []):
+        yield hdr
+
+  def series(self):
+    groups = {}
+    for hdr in self.headers():
+      orient = hdr.get("orientation")
+      orient = None if orient is None else tuple(round(v, 4) for v in orient)
+      key = (hdr["series_uid"], hdr.get("rows"), hdr.get("columns"), orient)
+      groups.setdefault(key, []).append(hdr)
+
+    series = []
+    counts = {}
+    for key in sorted(groups, key=lambda k: (k[0], str(k[1:]))):
+      items = groups[key]
+      uid = key[0]
+      counts[uid] = counts.get(uid, 0) + 1
+      first = items[0]
+
+      orient = first.get("orientation")
+      if (not orient is None) and all(not i.get("position") is None for i in items):
+        normal = slice_normal(orient)
+        items = sorted(items, key=lambda i: (float(np.dot(normal, i["position"])), i.get("instance") or 0))
+      else:
+        items = sorted(items, key=lambda i: (i.get("instance") or 0, i["file"]))
+
+      series.append({
+        "id": uid if counts[uid] == 1 else f"{uid}.{counts[uid]}",
+        "uid": uid,
+        "patient_id": first.get("patient_id"),
+        "study_uid": first.get("study_uid"),
+        "number": first.get("series_number"),
+        "description": first.get("description"),
+        "modality": first.get("modality"),
+        "rows": first.get("rows"),
+        "columns": first.get("columns"),
+        "files": [i["file"] for i in items],
+        "positions": [i.get("position") for i in items],
+        "orientation": orient,
+      })
+
+    return series
+
+  def mtime(self):
+    if len(self.dirs) == 0:
+      return 0
+    return max(d["mtime_ns"] for d in self.dirs.values())
+
+def series_affine(series, datasets):
+  ds = datasets[0]
+  orient = series.get("orientation") or [1, 0, 0, 0, 1, 0]
+  row = np.array(orient[:3], dtype=float)
+  col = np.array(orient[3:], dtype=float)
+  spacing = [float(v) for v in ds.get("PixelSpacing", [1, 1])]
+
+  positions = series.get("positions") or []
+  first = positions[0] if len(positions) > 0 else None
+  last = positions[-1] if len(positions) > 0 else None
+  if first is None:
+    first = [0.0, 0.0, 0.0]
+
+  if len(datasets) > 1 and (not last is None):
+    step = (np.array(last, dtype=float) - np.array(first, dtype=float)) / (len(datasets) - 1)
+  else:
+    step = np.cross(row, col) * float(ds.get("SliceThickness", 1) or 1)
+
+  # pixel_array is indexed [row, column], rows advance along the column cosine
+  affine = np.eye(4)
+  affine[:3, 0] = col * spacing[0]
+  affine[:3, 1] = row * spacing[1]
+  affine[:3, 2] = step
+  affine[:3, 3] = first
+
+  # DICOM patient space is LPS, NIfTI expects RAS
+  affine[:2, :] *= -1
+  return affine
+
+def series_to_nifti(series, filename):
+  datasets = [pydicom.dcmread(f) for f in series["files"]]
+  slices = []
+  scaled = False
+  for ds in datasets:
+    arr = ds.pixel_array
+    slope = float(ds.get("RescaleSlope", 1) or 1)
+    inter = float(ds.get("RescaleIntercept", 0) or 0)
+    if slope != 1 or inter != 0:
+      arr = arr * slope + inter
+      scaled = True
+    slices.append(arr)
+
+  data = np.stack(slices, axis=-1)
+  if scaled:
+    data = data.astype(np.float32)
+
+  img = nb.Nifti1Image(data, series_affine(series, datasets))
+  img.header.set_xyzt_units("mm")
+  nb.save(img, filename)
+  return filename
+
+def convert_series(series, output_dir, workers=None):
+  os.makedirs(output_dir, exist_ok=True)
+
+  def _convert(s):
+    name = str(s["id"]).replace(os.sep, "_")
+    filename = os.path.join(output_dir, f"{name}.nii.gz")
+    try:
+      return s["id"], series_to_nifti(s, filename)
+    except Exception as ex:
+      print(f"Error converting series {s['id']}:\n{ex}")
+      return s["id"], None
+
+  with ThreadPoolExecutor(max_workers=workers) as pool:
+    return dict(pool.map(_convert, series))
+
+def dicom_to_nifti(path, workers=None, cache_dir=CACHE_BASE):
+  index = DicomIndex(path, cache_dir=cache_dir, workers=workers)
+  series = index.scan()
+  mtime = index.mtime()
+  output_dir = os.path.join(cache_dir, "nifti", os.path.basename(index.cache_file)[6:-5])
+
+  outputs = {}
+  pending = []
+  for s in series:
+    name = str(s["id"]).replace(os.sep, "_")
+    filename = os.path.join(output_dir, f"{name}.nii.gz")
+    if os.path.isfile(filename) and os.stat(filename).st_mtime_ns >= mtime:
+      outputs[s["id"]] = filename
+    else:
+      pending.append(s)
+
+  if len(pending) > 0:
+    outputs.update(convert_series(pending, output_dir, workers))
+
+  # Largest series first, it is the one used where a single image is expected
+  ordered = sorted(series, key=lambda s: (-len(s["files"]), s.get("number") or 0, s["id"]))
+  return [outputs[s["id"]] for s in ordered if not outputs.get(s["id"]) is None]
@@ -0,0 +1,304 @@
+import os, json, hashlib, mmap, threading, atexit
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+INDEX_FILE = os.path.join(os.path.expanduser("~"), ".dcomex", "cache", "fingerprints.json")
+CHUNK_SIZE = 8 << 20
+# Seconds new fingerprints of the shared index wait before they are saved
+SAVE_DELAY = 5.0
+ALGORITHM = f"blake2b-tree-{CHUNK_SIZE}"
+
+def stat_key(st):
+  return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+def hash_file(filename, pool=None, chunk_size=CHUNK_SIZE):
+  # Chunks are hashed independently (hashlib releases the GIL) and the chunk
+  # digests are hashed again, so large files are read in parallel
+  size = os.path.getsize(filename)
+  top = hashlib.blake2b(digest_size=32)
+  top.update(str(size).encode("utf-8"))
+  if size == 0:
+    return top.hexdigest()
+
+  with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+    view = memoryview(mm)
+
+    def _chunk(offset):
+      return hashlib.blake2b(view[offset:offset + chunk_size], digest_size=32).digest()
+
+    offsets = range(0, size, chunk_size)
+    if pool is None or len(offsets) == 1:
+      digests = [_chunk(o) for o in offsets]
+    else:
+      digests = list(pool.map(_chunk, offsets))
+
+    view.release()
+
+  for d in digests:
+    top.update(d)
+  return top.hexdigest()
+
+@contextmanager
+def file_lock(filename):
+  # Lock shared with the other processes writing the same file, where the
+  # platform has no flock the atomic replace is all there is
+  if fcntl is None:
+    yield
+    return
+
+  os.makedirs(os.path.dirname(filename), exist_ok=True)
+  with open(f"{filename}.lock", "a") as lock_file:
+    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+class FingerprintIndex:
+  def __init__(self, filename=INDEX_FILE, workers=None) -> None:
+    self.filename = filename
+    self.workers = workers
+    self.entries = {}
+    self.paths = {}
+    self.lock = threading.Lock()
+    self.save_lock = threading.Lock()
+    self.dirty = False
+    self.touched = set()
+    self.removed = set()
+    self._pool = None
+    self.entries, self.paths = self.read()
+
+  def read(self):
+    if not os.path.isfile(self.filename):
+      return {}, {}
+
+    try:
+      with open(self.filename, "r") as json_file:
+        data = json.load(json_file)
+      if data.get("algorithm") == ALGORITHM:
+        return data.get("entries", {}), data.get("paths", {})
+    except Exception as ex:
+      print(f"Error loading fingerprint index:\n{ex}")
+    return {}, {}
+
+  def save(self):
+    # Other processes may have saved the index since it was read, so the
+    # file is read again and only the changes made here are merged into it
+    if not self.dirty:
+      return
+
+    with self.save_lock, file_lock(self.filename):
+      entries, paths = self.read()
+      with self.lock:
+        for key in self.removed:
+          entries.pop(key, None)
+        entries.update(self.entries)
+        for path in self.touched:
+          paths[path] = self.paths[path]
+        self.entries, self.paths = entries, paths
+        self.touched, self.removed = set(), set()
+        self.dirty = False
+        data = {"algorithm": ALGORITHM, "entries": dict(entries), "paths": dict(paths)}
+
+      tmp_file = f"{self.filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+      with open(tmp_file, "w") as json_file:
+        json.dump(data, json_file)
+      os.replace(tmp_file, self.filename)
+
+  def pool(self):
+    with self.lock:
+      if self._pool is None:
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+      return self._pool
+
+  def close(self):
+    self.save()
+    if not self._pool is None:
+      self._pool.shutdown()
+      self._pool = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.close()
+
+  def lookup(self, path):
+    try:
+      st = os.stat(path)
+    except OSError:
+      return None
+    return self.entries.get(stat_key(st))
+
+  def status(self, path):
+    path = os.path.abspath(path)
+    try:
+      st = os.stat(path)
+    except OSError:
+      return "missing"
+
+    if os.path.isdir(path):
+      statuses = [self.status(p) for p in self._dir_files(path)]
+      if all(s == "ok" for s in statuses):
+        return "ok"
+      if all(s == "new" for s in statuses):
+        return "new"
+      return "changed"
+
+    key = stat_key(st)
+    prev = self.paths.get(path)
+    if prev == key and key in self.entries:
+      return "ok"
+    if prev is None:
+      return "new"
+    return "changed"
+
+  def _dir_files(self, path):
+    files = []
+    for root, dirs, names in os.walk(path):
+      dirs.sort()
+      for name in sorted(names):
+        files.append(os.path.join(root, name))
+    return files
+
+  def fingerprint(self, path, rehash=False):
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+      top = hashlib.blake2b(digest_size=32)
+      for f in self._dir_files(path):
+        digest = self.fingerprint(f, rehash)
+        if digest is None:
+          return None
+        top.update(os.path.relpath(f, path).encode("utf-8"))
+        top.update(digest.encode("utf-8"))
+      return top.hexdigest()
+
+    try:
+      st = os.stat(path)
+    except OSError:
+      return None
+
+    key = stat_key(st)
+    if not rehash:
+      digest = self.entries.get(key)
+      if not digest is None:
+        if self.paths.get(path) != key:
+          with self.lock:
+            self.paths[path] = key
+            self.touched.add(path)
+            self.dirty = True
+        return digest
+
+    digest = hash_file(path, self.pool())
+    self._record(path, key, digest)
+    return digest
+
+  def _record(self, path, key, digest):
+    with self.lock:
+      prev = self.paths.get(path)
+      if (not prev is None) and prev != key:
+        self.entries.pop(prev, None)
+        self.removed.add(prev)
+      self.entries[key] = digest
+      self.paths[path] = key
+      self.touched.add(path)
+      self.dirty = True
+
+  def verify(self, path, rehash=False, update=False):
+    # Status against the stored fingerprint: files whose stats changed are
+    # hashed again and only reported as changed when the content differs.
+    # Changed files keep their stored fingerprint unless update is set, so
+    # they are reported again on the next run
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+      statuses = []
+      top = hashlib.blake2b(digest_size=32)
+      for f in self._dir_files(path):
+        status, digest = self.verify(f, rehash, update)
+        if digest is None:
+          return "missing", None
+        statuses.append(status)
+        top.update(os.path.relpath(f, path).encode("utf-8"))
+        top.update(digest.encode("utf-8"))
+
+      if all(s == "ok" for s in statuses):
+        return "ok", top.hexdigest()
+      if all(s == "new" for s in statuses):
+        return "new", top.hexdigest()
+      return "changed", top.hexdigest()
+
+    try:
+      st = os.stat(path)
+    except OSError:
+      return "missing", None
+
+    key = stat_key(st)
+    prev_key = self.paths.get(path)
+    prev = self.entries.get(prev_key)
+    if (not rehash) and prev_key == key and (not prev is None):
+      return "ok", prev
+
+    digest = None if rehash else self.entries.get(key)
+    if digest is None:
+      try:
+        digest = hash_file(path, self.pool())
+      except OSError:
+        return "missing", None
+
+    status = "new" if prev is None else ("ok" if prev == digest else "changed")
+    if status != "changed" or update:
+      self._record(path, key, digest)
+    return status, digest
+
+_shared_index = None
+_shared_lock = threading.Lock()
+_save_timer = None
+
+def shared_index():
+  # One index per process for the background caches, files are hashed
+  # outside its lock so workers only wait on each other for the lookups
+  global _shared_index
+  with _shared_lock:
+    if _shared_index is None:
+      _shared_index = FingerprintIndex()
+    return _shared_index
+
+def save_fingerprints():
+  # Saves the new fingerprints of the shared index now, batch jobs call it
+  # when they are done and it runs at exit
+  global _save_timer
+  with _shared_lock:
+    if not _save_timer is None:
+      _save_timer.cancel()
+      _save_timer = None
+    index = _shared_index
+  if not index is None:
+    try:
+      index.save()
+    except Exception as ex:
+      print(f"Error saving fingerprint index:\n{ex}")
+
+def _schedule_save():
+  # New fingerprints are saved together a moment later instead of reading
+  # and writing the index file for every file
+  global _save_timer
+  with _shared_lock:
+    if _save_timer is None:
+      _save_timer = threading.Timer(SAVE_DELAY, save_fingerprints)
+      _save_timer.daemon = True
+      _save_timer.start()
+
+atexit.register(save_fingerprints)
+
+def fingerprint_file(path):
+  # Shared entry point for caches keyed by file content
+  index = shared_index()
+  digest = index.fingerprint(path)
+  if index.dirty:
+    _schedule_save()
+  return digest
@@ -3,10 +3,18 @@ import typing
 from PyQt5.QtWidgets import QWidget, QPushButton, QVBoxLayout, QDialog, QGridLayout
 from PyQt5.QtWidgets import QHBoxLayout, QLabel, QLineEdit, QComboBox, QCheckBox
 from PyQt5.QtWidgets import QMessageBox, QDateTimeEdit
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QSize, QPoint, pyqtSignal
 from PyQt5.QtGui import QIntValidator, QDoubleValidator
 from .data import DataType, ScalarType
 from .workspace import Workspace
+from .thumbnails import thumbnail_provider, entry_file, THUMB_SIZE
+
+class ThumbnailComboBox(QComboBox):
+  popup_shown = pyqtSignal()
+
+  def showPopup(self):
+    super().showPopup()
+    self.popup_shown.emit()
 
 class InputDialog(QDialog):
   def __init__(self, workspace: Workspace, input_information: dict, has_outputs: bool = False, parent: typing.Optional[QWidget] = None) -> None:
@@ -19,6 +27,9 @@ class InputDialog(QDialog):
     self.setMinimumSize(700, 500)
     self.setWindowTitle("Processing Input Information")
     self.setWindowModality(Qt.WindowModality.ApplicationModal)
+    self.thumbnails = thumbnail_provider()
+    self.thumbnails.ready.connect(self.on_thumbnail_ready)
+    self.thumbnail_items = {}
     self.build_ui()
 
   def build_ui(self):
@@ -51,14 +62,23 @@ class InputDialog(QDialog):
       is_required = data.get("required", False)
 
       if f_type != DataType.SCALAR.value:
-        field = QComboBox(self)
+        field = ThumbnailComboBox(self)
         layout.addWidget(field, row, 1)
         options = self._workspace.get_data_type(f_type, s_type, is_mult)
         if not is_required:
           field.addItem("[N/A]", userData={"value": None})
 
+        field.setIconSize(QSize(THUMB_SIZE // 2, THUMB_SIZE // 2))
         for opt in options:
+          info = entry_file(opt)
+          if not info is None:
+            self.thumbnail_items.setdefault(info[0], []).append((field, field.count()))
           field.addItem(opt.get("name"), userData=opt)
+
+        field.currentIndexChanged.connect(lambda index, f=field: self.update_icons(f, [index]))
+        field.popup_shown.connect(lambda f=field: self.update_visible_icons(f))
+        field.view().verticalScrollBar().valueChanged.connect(lambda value, f=field: self.update_visible_icons(f))
+        self.update_icons(field, [field.currentIndex()])
       
         self.fields[k] = field
       else:
@@ -93,6 +113,27 @@ class InputDialog(QDialog):
     self._layout.addLayout(layout)
     self._layout.addStretch(1)
 
+  def update_icons(self, field, rows):
+    # Thumbnails that are not rendered yet are requested in the background,
+    # only for the items shown: the current one and those in the open popup
+    for i in rows:
+      if 0 <= i < field.count():
+        icon = self.thumbnails.icon(field.itemData(i))
+        if not icon is None:
+          field.setItemIcon(i, icon)
+
+  def update_visible_icons(self, field):
+    view = field.view()
+    first = view.indexAt(QPoint(0, 0)).row()
+    last = view.indexAt(QPoint(0, view.viewport().height() - 1)).row()
+    if last < 0:
+      last = field.count() - 1
+    self.update_icons(field, range(max(first, 0), last + 1))
+
+  def on_thumbnail_ready(self, filename):
+    for field, i in self.thumbnail_items.get(filename, []):
+      self.update_icons(field, [i])
+
   def build_buttons(self):
     widget = QWidget(self)
     layout = QHBoxLayout()
@@ -0,0 +1,188 @@
+import os, json, colorsys
+import numpy as np
+
+COLORS_FILE = os.path.join(os.path.expanduser("~"), ".dcomex", "label_colors.json")
+MAX_LUT_SIZE = 1 << 20
+
+DEFAULT_COLORS = {
+  0: [0, 0, 0, 0],
+  1: [255, 0, 0, 255],
+  2: [0, 255, 0, 255],
+  3: [0, 0, 255, 255],
+}
+
+def default_color(label):
+  if label in DEFAULT_COLORS:
+    return list(DEFAULT_COLORS[label])
+  # Golden angle steps keep neighbouring labels apart in hue
+  h = (label * 0.618033988749895) % 1.0
+  r, g, b = colorsys.hsv_to_rgb(h, 0.75, 1.0)
+  return [int(r * 255), int(g * 255), int(b * 255), 255]
+
+def as_labels(data):
+  # Label volumes are used as lookup indices, floats are rounded once and
+  # integer data is never copied
+  data = np.asarray(data)
+  if data.dtype.kind == "b":
+    return data.view(np.uint8)
+  if data.dtype.kind in "iu":
+    return data
+  if data.dtype.kind == "f":
+    data = np.rint(data)
+  return data.astype(np.intp, copy=False)
+
+def label_dtype(mi, ma):
+  # Smallest unsigned dtype holding every label, None with negative labels
+  if mi < 0:
+    return None
+  for dtype in (np.uint8, np.uint16, np.uint32):
+    if ma <= np.iinfo(dtype).max:
+      return np.dtype(dtype)
+  return None
+
+def compact_labels(raw, scale=None, step=16, cancelled=None):
+  # Label maps are often stored as int16 or float, they are rewritten in the
+  # smallest unsigned dtype in slabs along the last raw axis (contiguous in
+  # NIfTI files), scale is only given for scaled data. Returns the compact
+  # array (None when raw is already compact or has negative labels) and the
+  # bounding box of the labelled voxels in raw axes (None without any)
+  def read(k):
+    index = (slice(None), slice(None), slice(k, k + step))
+    slab = np.asarray(raw[index])
+    if not scale is None:
+      slab = scale(slab)
+    if slab.dtype.kind == "f":
+      slab = np.nan_to_num(slab, nan=0.0, posinf=0.0, neginf=0.0)
+    return index, as_labels(slab)
+
+  mi, ma = 0, 0
+  found = [np.zeros(raw.shape[a], dtype=bool) for a in range(3)]
+  for k in range(0, raw.shape[2], step):
+    if (not cancelled is None) and cancelled():
+      return None, None
+    _, slab = read(k)
+    if slab.size == 0:
+      continue
+    mi, ma = min(mi, int(slab.min())), max(ma, int(slab.max()))
+    nz = slab != 0
+    for a in range(3):
+      hit = nz.any(axis=tuple(d for d in range(nz.ndim) if d != a))
+      if a == 2:
+        found[2][k:k + step] |= hit
+      else:
+        found[a] |= hit
+
+  bbox = None
+  if found[2].any():
+    bbox = []
+    for f in found:
+      idx = np.nonzero(f)[0]
+      bbox.append((int(idx[0]), int(idx[-1]) + 1))
+
+  dtype = label_dtype(mi, ma)
+  if dtype is None or (scale is None and raw.dtype.kind in "ub" and raw.dtype.itemsize <= dtype.itemsize):
+    return None, bbox
+
+  out = np.empty(raw.shape, dtype=dtype, order="F" if raw.flags.f_contiguous else "C")
+  for k in range(0, raw.shape[2], step):
+    if (not cancelled is None) and cancelled():
+      return None, None
+    index, slab = read(k)
+    out[index] = slab
+  return out, bbox
+
+def label_counts(data):
+  data = as_labels(data)
+  if data.size == 0:
+    return {}
+  if data.max() < MAX_LUT_SIZE and (data.dtype.kind == "u" or data.min() >= 0):
+    counts = np.bincount(data.ravel())
+    labels = np.nonzero(counts)[0]
+    return {int(k): int(counts[k]) for k in labels}
+  labels, counts = np.unique(data, return_counts=True)
+  return {int(k): int(c) for k, c in zip(labels, counts)}
+
+class LabelColorTable:
+  def __init__(self, filename=COLORS_FILE) -> None:
+    self.filename = filename
+    self.custom = {}
+    # Bumped on every color change, part of the keys of cached colored slices
+    self.version = 0
+    self.lut = np.array([default_color(k) for k in range(256)], dtype=np.ubyte)
+    self.load()
+
+  def load(self):
+    if self.filename is None or not os.path.isfile(self.filename):
+      return
+    try:
+      with open(self.filename, "r") as json_file:
+        data = json.load(json_file)
+      for k in data:
+        self.set_color(int(k), data[k], save=False)
+    except Exception as ex:
+      print(f"Error loading label colors:\n{ex}")
+
+  def save(self):
+    if self.filename is None:
+      return
+    os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+    tmp_file = f"{self.filename}.tmp"
+    with open(tmp_file, "w") as json_file:
+      json.dump({str(k): self.custom[k] for k in sorted(self.custom)}, json_file)
+    os.replace(tmp_file, self.filename)
+
+  def ensure(self, label):
+    size = len(self.lut)
+    if label < size:
+      return
+    new_size = max(label + 1, size * 2)
+    extra = np.array([default_color(k) for k in range(size, new_size)], dtype=np.ubyte)
+    self.lut = np.concatenate([self.lut, extra])
+
+  def color(self, label):
+    if label < 0:
+      return [0, 0, 0, 0]
+    if label >= MAX_LUT_SIZE:
+      return list(self.custom.get(label, default_color(label)))
+    self.ensure(label)
+    return [int(c) for c in self.lut[label]]
+
+  def set_color(self, label, color, save=True):
+    color = [int(c) for c in color]
+    if len(color) == 3:
+      color.append(255)
+    self.custom[label] = color
+    if label < MAX_LUT_SIZE:
+      self.ensure(label)
+      self.lut[label] = color
+    self.version += 1
+    if save:
+      self.save()
+
+  def reset_color(self, label, save=True):
+    self.custom.pop(label, None)
+    if label < MAX_LUT_SIZE:
+      self.ensure(label)
+      self.lut[label] = default_color(label)
+    self.version += 1
+    if save:
+      self.save()
+
+  def apply(self, data):
+    # One gather over the label volume, negative labels stay transparent
+    data = as_labels(data)
+    if data.size == 0 or data.dtype == np.uint8:
+      return np.take(self.lut, data, axis=0)
+
+    ma = int(data.max())
+    if ma >= MAX_LUT_SIZE:
+      # Very sparse label ids are compacted to a small table first
+      labels, inverse = np.unique(data, return_inverse=True)
+      lut = np.array([self.color(int(k)) for k in labels], dtype=np.ubyte)
+      return lut[inverse.reshape(data.shape)]
+    self.ensure(ma)
+    rgba = np.take(self.lut, data, axis=0, mode="clip")
+    # Clipping would show them with the (editable) background color
+    if data.dtype.kind == "i" and int(data.min()) < 0:
+      rgba[data < 0] = 0
+    return rgba
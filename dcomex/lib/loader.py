@@ -0,0 +1,210 @@
+import threading
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+_active = {}
+
+class LoaderSignals(QObject):
+  opened = pyqtSignal()
+  progress = pyqtSignal(int)
+  completed = pyqtSignal(list)
+  cancelled = pyqtSignal()
+  errored = pyqtSignal(str)
+  finished = pyqtSignal()
+
+class VolumeLoader(QRunnable):
+  def __init__(self, volume) -> None:
+    super().__init__()
+    self.setAutoDelete(False)
+    self.volume = volume
+    self.signals = LoaderSignals()
+    self.is_cancelled = False
+    self.is_opened = False
+    self.subscribers = 0
+    self.last_percent = -1
+    self.is_started = False
+    self.result = None
+    self.lock = threading.Lock()
+
+  @classmethod
+  def shared(cls, volume):
+    # Viewers asking for a volume that is already loading share its loader.
+    # New loaders are not started, the caller connects the signals and then
+    # calls start(). _active is only changed on the GUI thread
+    loader = _active.get(volume.uid)
+    if loader is None or not loader.result is None:
+      loader = cls(volume)
+      loader.signals.finished.connect(loader.on_finished)
+      _active[volume.uid] = loader
+    return loader
+
+  @classmethod
+  def active(cls, volume):
+    return _active.get(volume.uid)
+
+  def cancel(self):
+    self.is_cancelled = True
+
+  def subscribe(self):
+    self.subscribers += 1
+
+  def unsubscribe(self):
+    # A viewer cancelling a shared load only detaches itself, the load is
+    # stopped when the last viewer waiting for it leaves
+    self.subscribers = max(0, self.subscribers - 1)
+    if self.subscribers == 0:
+      self.is_cancelled = True
+
+  def on_opened(self):
+    self.is_opened = True
+    self.signals.opened.emit()
+
+  def on_progress(self, loaded, total):
+    # Only whole percent changes are sent to the GUI thread
+    percent = int(loaded * 100 / total) if total > 0 else 100
+    if percent != self.last_percent:
+      self.last_percent = percent
+      self.signals.progress.emit(percent)
+
+  def run(self):
+    # The result is kept so a viewer connecting after it was sent still
+    # gets it from start()
+    signal, args = self.load()
+    with self.lock:
+      self.result = (signal, args)
+      signal.emit(*args)
+    self.signals.finished.emit()
+
+  def on_finished(self):
+    if _active.get(self.volume.uid) is self:
+      _active.pop(self.volume.uid)
+
+  def load(self):
+    try:
+      done = self.volume.load(progress=self.on_progress, cancelled=lambda: self.is_cancelled, opened=self.on_opened)
+      if (not done) or self.is_cancelled:
+        return self.signals.cancelled, ()
+
+      # The full range needs a pass over the data, it is done here as well
+      self.volume.complete()
+      if self.is_cancelled:
+        return self.signals.cancelled, ()
+      self.signals.progress.emit(100)
+      return self.signals.completed, (self.volume.range,)
+    except Exception as ex:
+      print(f"Error loading {self.volume.filename}:\n{ex}")
+      return self.signals.errored, (str(ex),)
+
+  def start(self, pool=None):
+    # Starting a shared loader again replays its result, if it has one
+    with self.lock:
+      if not self.is_started:
+        self.is_started = True
+        pool = QThreadPool.globalInstance() if pool is None else pool
+        pool.start(self)
+      elif not self.result is None:
+        signal, args = self.result
+        signal.emit(*args)
+
+class MeshSignals(QObject):
+  completed = pyqtSignal(object)
+  cancelled = pyqtSignal()
+  errored = pyqtSignal(str)
+
+class MeshBuilder(QRunnable):
+  def __init__(self, volume, budget=None) -> None:
+    super().__init__()
+    self.setAutoDelete(False)
+    self.volume = volume
+    self.budget = budget
+    self.signals = MeshSignals()
+    self.is_cancelled = False
+
+  def cancel(self):
+    self.is_cancelled = True
+
+  def run(self):
+    from .mesh import volume_meshes, TRIANGLE_BUDGET
+    try:
+      budget = TRIANGLE_BUDGET if self.budget is None else self.budget
+      meshes = volume_meshes(self.volume, budget, cancelled=lambda: self.is_cancelled)
+      if meshes is None or self.is_cancelled:
+        self.signals.cancelled.emit()
+      else:
+        self.signals.completed.emit(meshes)
+    except Exception as ex:
+      print(f"Error building meshes for {self.volume.filename}:\n{ex}")
+      self.signals.errored.emit(str(ex))
+
+  def start(self, pool=None):
+    pool = QThreadPool.globalInstance() if pool is None else pool
+    pool.start(self)
+
+class MeshFileLoader(QRunnable):
+  def __init__(self, filename=None, budget=None, mesh=None) -> None:
+    # Reads a mesh file, or only decimates an already read mesh again
+    super().__init__()
+    self.setAutoDelete(False)
+    self.filename = filename
+    self.budget = budget
+    self.mesh = mesh
+    self.signals = MeshSignals()
+    self.is_cancelled = False
+
+  def cancel(self):
+    self.is_cancelled = True
+
+  def run(self):
+    from .mesh import read_stl, decimate
+    try:
+      mesh = self.mesh
+      if mesh is None:
+        mesh = read_stl(self.filename)
+      if self.is_cancelled:
+        self.signals.cancelled.emit()
+        return
+
+      shown = mesh
+      if not self.budget is None:
+        shown = decimate(mesh[0], mesh[1], self.budget)
+      if self.is_cancelled:
+        self.signals.cancelled.emit()
+        return
+      self.signals.completed.emit({"mesh": mesh, "shown": shown})
+    except Exception as ex:
+      print(f"Error loading mesh {self.filename}:\n{ex}")
+      self.signals.errored.emit(str(ex))
+
+  def start(self, pool=None):
+    pool = QThreadPool.globalInstance() if pool is None else pool
+    pool.start(self)
+
+class ProjectionSignals(QObject):
+  completed = pyqtSignal(object)
+  cancelled = pyqtSignal()
+  errored = pyqtSignal(str)
+
+class ProjectionBuilder(QRunnable):
+  def __init__(self, projection) -> None:
+    super().__init__()
+    self.setAutoDelete(False)
+    self.projection = projection
+    self.signals = ProjectionSignals()
+    self.is_cancelled = False
+
+  def cancel(self):
+    self.is_cancelled = True
+
+  def run(self):
+    try:
+      done = self.projection.build(cancelled=lambda: self.is_cancelled)
+      if (not done) or self.is_cancelled:
+        self.signals.cancelled.emit()
+      else:
+        self.signals.completed.emit(self.projection)
+    except Exception as ex:
+      print(f"Error projecting {self.projection.volume.filename}:\n{ex}")
+      self.signals.errored.emit(str(ex))
+
+  def start(self, pool=None):
+    pool = QThreadPool.globalInstance() if pool is None else pool
+    pool.start(self)
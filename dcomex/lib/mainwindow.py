@@ -1,14 +1,13 @@
 import typing
 from PyQt5.QtWidgets import QWidget, QMainWindow, QAction, QDockWidget, QFileDialog, QVBoxLayout
 from PyQt5.QtWidgets import QMenuBar, QMessageBox, QProgressBar, QStatusBar, QLabel, QTabWidget
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from .workspace import Workspace
 from .datadialog import DataDialog
 from .inputdialog import InputDialog
 from .plugindialog import PluginDialog
 from .plugin_manager import PluginGroupType, PluginManager
 from .qtplugin import QtPlugin as Plugin
-from .viewer3d import Viewer3D
 
 class MainWindow(QMainWindow):
   def __init__(self, parent: typing.Optional[QWidget] = None) -> None:
@@ -17,8 +16,8 @@ class MainWindow(QMainWindow):
     self._current_workspace = Workspace()
     self._plugin_manager = PluginManager()
     self._current_plugins = []
+    self._initial_tab = True
     self.build_ui()
-    self.on_3d_view_open()
 
   def build_ui(self):
     self.setMinimumSize(700, 700)
@@ -38,6 +37,8 @@ class MainWindow(QMainWindow):
       if index < self.tabs.count():
         widget = self.tabs.widget(index)
         self.tabs.removeTab(index)
+        if hasattr(widget, "release_volumes"):
+          widget.release_volumes()
         widget.deleteLater()
 
   def build_menu(self):
@@ -57,10 +58,17 @@ class MainWindow(QMainWindow):
     self.m_view = None
     self.m_window = None
 
-    self.build_view_menu(menuBar)
-    self.build_process_menu(menuBar)
+    self.build_plugin_menus(menuBar)
     # self.build_window_menu(menuBar)
 
+  def build_plugin_menus(self, menuBar: QMenuBar):
+    groups, plugins = self._plugin_manager.registry()
+    by_group = {}
+    for d in plugins:
+      by_group.setdefault(d.get("group"), []).append(d)
+    self.build_view_menu(menuBar, groups, by_group)
+    self.build_process_menu(menuBar, groups, by_group)
+
   def build_status_bar(self):
     statusBar = QStatusBar(self)
     statusBar.setSizeGripEnabled(False)
@@ -93,19 +101,19 @@ class MainWindow(QMainWindow):
     m_exit.triggered.connect(self.close)
     m_file.addAction(m_exit)
 
-  def build_process_menu(self, menuBar: QMenuBar):
+  def build_process_menu(self, menuBar: QMenuBar, groups, by_group):
     if self.m_process is None:
       self.m_process = menuBar.addMenu("&Process")
 
     self.m_process.clear()
-    p_grps = self._plugin_manager.find_group_by_type(PluginGroupType.PROCESSING.value)
+    p_grps = [g for g in groups if g.get("type") == PluginGroupType.PROCESSING.value]
     p_grps = [{"is_none": True}] + p_grps
     for grp in p_grps:
       sm = self.m_process
       if bool(grp.get("submenu")):
         sm = self.m_process.addMenu(grp.get("display"))
       
-      pms = self._plugin_manager.find_plugin_by_group(None) if "is_none" in grp else self._plugin_manager.find_plugin_by_group(grp.doc_id)
+      pms = by_group.get(None if "is_none" in grp else grp.doc_id, [])
 
       for d in pms:
         if (d.get("group") is None) and (d.get("viewer") == True):
@@ -115,7 +123,7 @@ class MainWindow(QMainWindow):
         act.triggered.connect(self.on_process_clicked(d.doc_id))
         sm.addAction(act)
   
-  def build_view_menu(self, menuBar: QMenuBar):
+  def build_view_menu(self, menuBar: QMenuBar, groups, by_group):
     if self.m_view is None:
       self.m_view = menuBar.addMenu("&Viewer")
 
@@ -124,9 +132,13 @@ class MainWindow(QMainWindow):
     self.m_view.addAction(act_vw_3d_nifti)
     act_vw_3d_nifti.triggered.connect(self.on_3d_view_open)
 
+    act_vw_mesh = QAction('Mesh 3D', self)
+    self.m_view.addAction(act_vw_mesh)
+    act_vw_mesh.triggered.connect(self.on_mesh_view_open)
+
     self.m_view.addSeparator()
 
-    p_grps = self._plugin_manager.find_group_by_type(PluginGroupType.VIEWER.value)
+    p_grps = [g for g in groups if g.get("type") == PluginGroupType.VIEWER.value]
     p_grps = [{"is_none": True}] + p_grps
 
     for grp in p_grps:
@@ -134,7 +146,7 @@ class MainWindow(QMainWindow):
       if bool(grp.get("submenu")):
         sm = self.m_view.addMenu(grp.get("display"))
       
-      pms = self._plugin_manager.find_plugin_by_group(None) if "is_none" in grp else self._plugin_manager.find_plugin_by_group(grp.doc_id)
+      pms = by_group.get(None if "is_none" in grp else grp.doc_id, [])
 
       for d in pms:
         if d.get("group") is None and (d.get("viewer") is None or d.get("viewer") == False):
@@ -144,10 +156,22 @@ class MainWindow(QMainWindow):
         act.triggered.connect(self.on_process_clicked(d.doc_id))
         sm.addAction(act)
 
+  def paintEvent(self, event):
+    super().paintEvent(event)
+    # The viewer modules (pyqtgraph, OpenGL, nibabel) are only imported with
+    # the first viewer tab, which is opened once the window has been drawn
+    if self._initial_tab:
+      self._initial_tab = False
+      QTimer.singleShot(0, self.on_3d_view_open)
+
   def on_3d_view_open(self):
     cnt = self.tabs.count() + 1
     self.build_3d_viewer(f"Volume 3D {cnt}")
 
+  def on_mesh_view_open(self):
+    cnt = self.tabs.count() + 1
+    self.build_mesh_viewer(f"Mesh 3D {cnt}")
+
   def build_window_menu(self, menuBar: QMenuBar):
     m_windows = menuBar.addMenu("&Windows")
 
@@ -172,14 +196,18 @@ class MainWindow(QMainWindow):
     self._current_workspace.save(filename)
 
   def build_3d_viewer(self, name: str):
+    from .viewer3d import Viewer3D
     self.viewer_3d = Viewer3D(self._current_workspace, self)
     self.tabs.addTab(self.viewer_3d, name)
 
   def build_2d_viewer(self):
     pass
 
-  def build_mesh_viewer(self):
-    pass
+  def build_mesh_viewer(self, name: str):
+    from .meshviewer import MeshViewer
+    self.mesh_viewer = MeshViewer(self._current_workspace, self)
+    self.tabs.addTab(self.mesh_viewer, name)
+    self.tabs.setCurrentWidget(self.mesh_viewer)
 
   def show_data_dialog(self):
     d = DataDialog(workspace=self._current_workspace)
@@ -188,8 +216,7 @@ class MainWindow(QMainWindow):
   def show_plugin_dialog(self):
     d = PluginDialog(plugin_manager=self._plugin_manager)
     d.exec()
-    self.build_process_menu(self.menuBar())
-    self.build_view_menu(self.menuBar())
+    self.build_plugin_menus(self.menuBar())
 
   def show_pipeline_dialog(self):
     pass
@@ -252,7 +279,7 @@ class MainWindow(QMainWindow):
     for k in data:
       output = data[k]
       output["name"] = k
-      self._current_workspace.data.append(output)
+      self._current_workspace.add(output)
     
     self._current_workspace.save()
     self.show_msg("Processing completed!")
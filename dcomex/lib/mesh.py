@@ -0,0 +1,220 @@
+import os
+import numpy as np
+from scipy import ndimage
+from .fingerprint import fingerprint_file
+from .labels import as_labels
+
+CACHE_BASE = os.path.join(os.path.expanduser("~"), ".dcomex", "cache", "mesh")
+TRIANGLE_BUDGET = 300000
+MESH_VERSION = 1
+
+# For a face normal along axis a, the two in-plane axes in right-handed order
+_PLANE_AXES = {0: (1, 2), 1: (2, 0), 2: (0, 1)}
+
+def voxel_surface(mask, offset=(0, 0, 0)):
+  # Boundary faces between inside and outside voxels, two triangles each.
+  # Vertices are on voxel corners, voxel (i, j, k) spans [i, i+1] etc.
+  padded = np.pad(mask, 1)
+  quads = []
+  for a in range(3):
+    lo = [slice(None)] * 3
+    hi = [slice(None)] * 3
+    lo[a] = slice(None, -1)
+    hi[a] = slice(1, None)
+    inside_lo = padded[tuple(lo)]
+    inside_hi = padded[tuple(hi)]
+    u, v = _PLANE_AXES[a]
+
+    for outward, faces in ((True, inside_lo & ~inside_hi), (False, inside_hi & ~inside_lo)):
+      idx = np.nonzero(faces)
+      if len(idx[0]) == 0:
+        continue
+      base = np.zeros((len(idx[0]), 3), dtype=np.int32)
+      base[:, a] = idx[a]
+      base[:, u] = idx[u] - 1
+      base[:, v] = idx[v] - 1
+
+      du = np.zeros(3, dtype=np.int32)
+      dv = np.zeros(3, dtype=np.int32)
+      du[u] = 1
+      dv[v] = 1
+      corners = [base, base + du, base + du + dv, base + dv]
+      if not outward:
+        corners = corners[::-1]
+      quads.append(np.stack(corners, axis=1))
+
+  if len(quads) == 0:
+    return np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.int32)
+
+  quads = np.concatenate(quads)
+  corners = quads.reshape(-1, 3)
+  shape = np.array(mask.shape, dtype=np.int64) + 1
+  keys = (corners[:, 0].astype(np.int64) * shape[1] + corners[:, 1]) * shape[2] + corners[:, 2]
+  keys, inverse = np.unique(keys, return_inverse=True)
+  inverse = inverse.reshape(-1, 4).astype(np.int32)
+
+  verts = np.empty((len(keys), 3), dtype=np.float32)
+  verts[:, 2] = keys % shape[2]
+  verts[:, 1] = (keys // shape[2]) % shape[1]
+  verts[:, 0] = keys // (shape[1] * shape[2])
+  verts += np.asarray(offset, dtype=np.float32)
+
+  faces = np.concatenate([inverse[:, [0, 1, 2]], inverse[:, [0, 2, 3]]])
+  return verts, faces
+
+def cluster_vertices(verts, faces, cell):
+  # Vertex clustering: vertices falling in the same grid cell are merged into
+  # their mean, collapsed and duplicated triangles are dropped
+  cells = np.floor((verts - verts.min(axis=0)) / cell).astype(np.int64)
+  dims = cells.max(axis=0) + 1
+  keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+  _, inverse = np.unique(keys, return_inverse=True)
+  inverse = inverse.reshape(-1)
+  count = inverse.max() + 1
+
+  weights = np.bincount(inverse, minlength=count).astype(np.float32)
+  new_verts = np.stack([np.bincount(inverse, weights=verts[:, k], minlength=count) for k in range(3)], axis=1)
+  new_verts = (new_verts / weights[:, None]).astype(np.float32)
+
+  f = inverse[faces]
+  keep = (f[:, 0] != f[:, 1]) & (f[:, 1] != f[:, 2]) & (f[:, 0] != f[:, 2])
+  f = f[keep]
+  _, first = np.unique(np.sort(f, axis=1), axis=0, return_index=True)
+  f = f[np.sort(first)]
+  return new_verts, f.astype(np.int32)
+
+def decimate(verts, faces, budget):
+  if len(faces) <= budget or len(faces) == 0:
+    return verts, faces
+
+  # Triangle counts fall roughly with the square of the cell size, which
+  # starts from the average edge length
+  sample = faces[:: max(1, len(faces) // 10000)]
+  edge = float(np.linalg.norm(verts[sample[:, 0]] - verts[sample[:, 1]], axis=1).mean())
+  cell = max(edge, 1e-6) * np.sqrt(len(faces) / budget)
+  while True:
+    v, f = cluster_vertices(verts, faces, cell)
+    if len(f) <= budget or len(v) <= 4:
+      break
+    cell *= 1.25
+
+  used = np.unique(f)
+  remap = np.full(len(v), -1, dtype=np.int32)
+  remap[used] = np.arange(len(used), dtype=np.int32)
+  return v[used], remap[f]
+
+def label_meshes(data, labels=None, budget=TRIANGLE_BUDGET, cancelled=None):
+  # Surfaces of every non zero label, the triangle budget is shared by the
+  # labels in proportion to their surface
+  data = as_labels(data)
+  if labels is None:
+    labels = [int(k) for k in np.unique(data) if k > 0]
+  labels = [k for k in sorted(labels) if k > 0]
+  if len(labels) == 0:
+    return {}
+
+  if data.min() >= 0:
+    boxes = ndimage.find_objects(data, max_label=max(labels))
+  else:
+    boxes = [None] * max(labels)
+
+  meshes = {}
+  for label in labels:
+    if (not cancelled is None) and cancelled():
+      return None
+    box = boxes[label - 1]
+    if box is None:
+      box = tuple(slice(0, s) for s in data.shape)
+    mask = np.asarray(data[box]) == label
+    if not mask.any():
+      continue
+    meshes[label] = voxel_surface(mask, [b.start for b in box])
+
+  total = sum(len(f) for _, f in meshes.values())
+  if total > budget:
+    for label in meshes:
+      v, f = meshes[label]
+      share = max(64, int(budget * len(f) / total))
+      meshes[label] = decimate(v, f, share)
+  return meshes
+
+def cache_file(digest, budget, cache_dir=CACHE_BASE):
+  return os.path.join(cache_dir, f"{digest}_{budget}_v{MESH_VERSION}.npz")
+
+def load_meshes(filename):
+  meshes = {}
+  with np.load(filename) as data:
+    for name in data.files:
+      if name.startswith("v_"):
+        label = int(name[2:])
+        meshes[label] = (data[name], data[f"f_{label}"])
+  return meshes
+
+def save_meshes(filename, meshes):
+  os.makedirs(os.path.dirname(filename), exist_ok=True)
+  arrays = {}
+  for label, (v, f) in meshes.items():
+    arrays[f"v_{label}"] = v
+    arrays[f"f_{label}"] = f
+  tmp_file = f"{filename}.{os.getpid()}.tmp"
+  with open(tmp_file, "wb") as f:
+    np.savez_compressed(f, **arrays)
+  os.replace(tmp_file, filename)
+
+def volume_meshes(volume, budget=TRIANGLE_BUDGET, cache_dir=CACHE_BASE, cancelled=None):
+  # Meshes of a segmentation volume, cached by the file fingerprint
+  filename = None
+  try:
+    filename = cache_file(fingerprint_file(volume.filename), budget, cache_dir)
+  except Exception as ex:
+    print(f"Error fingerprinting {volume.filename}:\n{ex}")
+
+  if (not filename is None) and os.path.isfile(filename):
+    try:
+      return load_meshes(filename)
+    except Exception as ex:
+      print(f"Error loading meshes {filename}:\n{ex}")
+
+  labels = list(volume.labels) if not volume.labels is None else None
+  meshes = label_meshes(volume.get_data(), labels, budget, cancelled)
+  if meshes is None:
+    return None
+
+  if not filename is None:
+    try:
+      save_meshes(filename, meshes)
+    except Exception as ex:
+      print(f"Error saving meshes {filename}:\n{ex}")
+  return meshes
+
+STL_DTYPE = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attr", "<u2")])
+
+def is_binary_stl(filename):
+  size = os.path.getsize(filename)
+  if size < 84:
+    return False
+  with open(filename, "rb") as f:
+    f.seek(80)
+    count = int(np.frombuffer(f.read(4), dtype="<u4")[0])
+  return size == 84 + count * STL_DTYPE.itemsize
+
+def index_triangles(corners):
+  # Identical corner coordinates become one vertex, compared as raw 12 byte
+  # records which is much faster than np.unique(axis=0)
+  # (adding 0 turns -0.0 into 0.0 so both give the same key)
+  corners = (np.asarray(corners, dtype=np.float32) + np.float32(0)).reshape(-1, 3)
+  keys = corners.view(np.dtype((np.void, corners.dtype.itemsize * 3))).ravel()
+  _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+  return corners[first], inverse.reshape(-1, 3).astype(np.int32)
+
+def read_stl(filename):
+  # Binary files are memory-mapped, ASCII files go through numpy-stl
+  if is_binary_stl(filename):
+    if os.path.getsize(filename) == 84:
+      return np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.int32)
+    records = np.memmap(filename, dtype=STL_DTYPE, mode="r", offset=84)
+    return index_triangles(records["vertices"])
+
+  from stl import mesh as stl_mesh
+  data = stl_mesh.Mesh.from_file(filename)
+  return index_triangles(data.vectors)
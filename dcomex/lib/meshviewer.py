@@ -0,0 +1,156 @@
+import os
+import numpy as np
+from PyQt5.QtWidgets import QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QGridLayout
+from PyQt5.QtWidgets import QLabel, QComboBox, QFileDialog, QMessageBox
+from PyQt5.QtCore import Qt
+from pyqtgraph.opengl import GLViewWidget, GLMeshItem, MeshData
+from .loader import MeshFileLoader
+from .inputdialog import InputDialog
+from .misc import QHLine
+
+BUDGETS = [("50k", 50000), ("200k", 200000), ("500k", 500000), ("1M", 1000000), ("Full", None)]
+
+class MeshViewer(QWidget):
+  def __init__(self, workspace, parent=None) -> None:
+    super().__init__(parent)
+    self.workspace = workspace
+    self.filename = None
+    self.mesh = None
+    self.shown = None
+    self.mesh_item = None
+    self.loader = None
+    self.budget = 500000
+    self.build_ui()
+
+  def build_ui(self):
+    self.main_layout = QHBoxLayout()
+    self.setLayout(self.main_layout)
+
+    self.viewer = GLViewWidget(self)
+    self.viewer.setCameraPosition(distance=200)
+    self.main_layout.addWidget(self.viewer, stretch=1)
+    self.build_side_panel()
+
+  def build_side_panel(self):
+    self.side_panel = QWidget(self)
+    self.side_panel.setMinimumWidth(200)
+    self.side_panel.setMaximumWidth(200)
+    self.side_layout = QVBoxLayout()
+
+    btn_load = QPushButton('Load Mesh', self)
+    btn_load.clicked.connect(self.on_load_mesh)
+    self.side_layout.addWidget(btn_load)
+
+    btn_open = QPushButton('Open File', self)
+    btn_open.clicked.connect(self.on_open_file)
+    self.side_layout.addWidget(btn_open)
+
+    budget_layout = QHBoxLayout()
+    budget_layout.addWidget(QLabel('Triangles: ', self))
+    self.budget_combo = QComboBox(self)
+    for name, value in BUDGETS:
+      self.budget_combo.addItem(name, value)
+    self.budget_combo.setCurrentIndex([b for _, b in BUDGETS].index(self.budget))
+    self.budget_combo.currentIndexChanged.connect(self.on_budget_changed)
+    budget_layout.addWidget(self.budget_combo, stretch=1)
+    self.side_layout.addLayout(budget_layout)
+
+    i_info_title = QLabel('Information')
+    self.side_layout.addWidget(i_info_title, alignment=Qt.AlignCenter)
+    self.side_layout.addWidget(QHLine())
+
+    info_layout = QGridLayout()
+    self.i_name_value = QLabel('N/A', self)
+    self.i_name_value.setWordWrap(True)
+    self.i_triangles_value = QLabel('N/A', self)
+    self.i_vertices_value = QLabel('N/A', self)
+    self.i_shown_value = QLabel('N/A', self)
+    for row, (name, field) in enumerate((('File: ', self.i_name_value), ('Triangles: ', self.i_triangles_value), ('Vertices: ', self.i_vertices_value), ('Shown: ', self.i_shown_value))):
+      info_layout.addWidget(QLabel(name, self), row, 0, alignment=Qt.AlignRight)
+      info_layout.addWidget(field, row, 1)
+    self.side_layout.addLayout(info_layout)
+
+    self.status = QLabel('', self)
+    self.side_layout.addWidget(self.status)
+
+    self.side_layout.addStretch(1)
+    self.side_panel.setLayout(self.side_layout)
+    self.main_layout.addWidget(self.side_panel)
+
+  def on_load_mesh(self):
+    dialog = InputDialog(self.workspace, {"raw_input": {"type": "mesh", "display": "Select mesh"}}, False, self)
+    if dialog.exec():
+      data = dialog.get_last_input_data()
+      if "raw_input" in data:
+        self.load_mesh(data.get("raw_input"))
+
+  def on_open_file(self):
+    filename, filt = QFileDialog.getOpenFileName(self, caption="Open Mesh", filter="STL (*.stl)")
+    if filename == "":
+      return
+    self.load_mesh(filename)
+
+  def on_budget_changed(self):
+    self.budget = self.budget_combo.currentData()
+    if not self.mesh is None:
+      self.start_loader(MeshFileLoader(self.filename, self.budget, mesh=self.mesh), 'Decimating...')
+
+  def load_mesh(self, filename):
+    self.filename = filename
+    self.mesh = None
+    self.start_loader(MeshFileLoader(filename, self.budget), 'Loading...')
+
+  def start_loader(self, loader, text):
+    # Reading and decimation run on the thread pool, only the latest request
+    # is shown
+    if not self.loader is None:
+      self.loader.cancel()
+    loader.signals.completed.connect(lambda result: self.on_mesh_loaded(loader, result))
+    loader.signals.errored.connect(lambda error: self.on_mesh_failed(loader, error))
+    self.loader = loader
+    self.status.setText(text)
+    loader.start()
+
+  def on_mesh_loaded(self, loader, result):
+    if not loader is self.loader:
+      return
+    self.loader = None
+    self.status.setText('')
+    self.mesh = result["mesh"]
+    self.shown = result["shown"]
+    self.update_info()
+    self.update_mesh()
+    # The budget may have changed while the file was read
+    if loader.budget != self.budget:
+      self.start_loader(MeshFileLoader(self.filename, self.budget, mesh=self.mesh), 'Decimating...')
+
+  def on_mesh_failed(self, loader, error):
+    if not loader is self.loader:
+      return
+    self.loader = None
+    self.status.setText('')
+    QMessageBox.critical(self, "Error", f"Unable to load {loader.filename}:\n{error}")
+
+  def update_info(self):
+    verts, faces = self.mesh
+    self.i_name_value.setText(os.path.basename(self.filename))
+    self.i_name_value.setToolTip(self.filename)
+    self.i_triangles_value.setText(f"{len(faces):,}")
+    self.i_vertices_value.setText(f"{len(verts):,}")
+    self.i_shown_value.setText(f"{len(self.shown[1]):,}")
+
+  def update_mesh(self):
+    verts, faces = self.shown
+    if not self.mesh_item is None:
+      self.viewer.removeItem(self.mesh_item)
+      self.mesh_item = None
+    if len(faces) == 0:
+      return
+
+    # The mesh is centered on the origin so the camera orbits around it
+    lo, hi = verts.min(axis=0), verts.max(axis=0)
+    center = (lo + hi) / 2.0
+    md = MeshData(vertexes=np.asarray(verts - center, dtype=np.float32), faces=faces)
+    self.mesh_item = GLMeshItem(meshdata=md, smooth=False, shader='shaded', color=(0.8, 0.8, 0.8, 1.0), glOptions='opaque')
+    self.viewer.addItem(self.mesh_item)
+    self.viewer.setCameraPosition(distance=float(np.linalg.norm(hi - lo)) * 1.5)
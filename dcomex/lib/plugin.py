@@ -1,6 +1,6 @@
 from datetime import datetime
 import os, subprocess, json, pathlib, threading, sys, tempfile, re
-from .data import DataType, ScalarType
+from .data import DataType, ScalarType, ImageType
 from .utils import executionCode
 from .plugin_manager import PluginType
 
@@ -178,17 +178,69 @@ class Plugin:
 
     return {}
 
+  def prepare_inputs(self):
+    # Inputs with DICOM folders converted to NIfTI, None (after reporting
+    # the error) when a folder holds no series that could be converted or a
+    # single DICOM file is given. Runs on the input worker in the GUI
+    input_data = dict(self.input_data)
+    in_info = self.input_information()
+    for k in in_info:
+      info = in_info[k]
+      value = self.input_data.get(k)
+      if info.get("type") != DataType.IMAGE.value or info.get("subtype") != ImageType.NIFTI.value:
+        continue
+
+      values = value if isinstance(value, list) else [value]
+      if not any(os.path.isdir(str(v)) or os.path.isfile(str(v)) for v in values if not v is None):
+        continue
+
+      from .dicom import dicom_to_nifti, is_dicom_file
+      converted = []
+      for v in values:
+        if (not v is None) and is_dicom_file(str(v)):
+          self.on_error(f"'{v}' is a single DICOM file, choose the folder of its series for input '{k}'")
+          return None
+        if (not v is None) and os.path.isdir(str(v)):
+          try:
+            series = dicom_to_nifti(str(v))
+          except Exception as ex:
+            self.on_error(f"Error converting DICOM folder '{v}' for input '{k}':\n{ex}")
+            return None
+          if len(series) == 0:
+            self.on_error(f"No DICOM series could be converted from '{v}' for input '{k}'")
+            return None
+          converted.extend(series)
+        else:
+          converted.append(v)
+
+      if bool(info.get("ismultiple")):
+        input_data[k] = converted
+      else:
+        input_data[k] = converted[0]
+
+    return input_data
+
   def run(self) -> dict:
+    return self.on_prepare_inputs()
+
+  def on_prepare_inputs(self): # to be handled by inhered class and call _inputs_prepared when done
+    return self._inputs_prepared(self.prepare_inputs())
+
+  def _inputs_prepared(self, input_data):
+    if input_data is None:
+      self.on_finished()
+      return
+
     if "type" in self._data:
       p_type = self._data.get("type")
       if p_type == PluginType.PYTHON.value:
-        return self.run_python()
+        return self.run_python(input_data)
       elif p_type == PluginType.EXECUTABLE.value:
-        return self.run_executable()
+        return self.run_executable(input_data)
 
-  def run_executable(self):
+  def run_executable(self, input_data=None):
     kwargs = self.settings.get("kwargs", {})
-    kwargs.update(self.input_data)
+    kwargs.update(self.input_data if input_data is None else input_data)
 
     comms = self.settings.get("commands", [])
     comm = self.settings.get("command")
@@ -257,9 +309,9 @@ class Plugin:
   def on_executable_run(self, command):
     subprocess.run(command)
 
-  def run_python(self):
+  def run_python(self, input_data=None):
     kwargs = self.settings.get("kwargs", {})
-    kwargs.update(self.input_data)
+    kwargs.update(self.input_data if input_data is None else input_data)
     data_path = self._data.get("path")
     p = pathlib.Path(data_path)
     if not p.exists():
@@ -1,6 +1,7 @@
 import enum, os
 from .data import DataType, ScalarType
 from tinydb import TinyDB, Query
+from tinydb.table import Document
 
 
 class PluginType(enum.Enum):
@@ -121,4 +122,12 @@ class PluginManager:
 
   def find_group_by_name(self, name):
     q = Query()
-    return self.groups.search(q.name==name)
\ No newline at end of file
+    return self.groups.search(q.name==name)
+
+  def registry(self):
+    # Groups and plugins from a single read of the database file, every
+    # table query reads the whole file again
+    data = self.db.storage.read() or {}
+    groups = [Document(v, doc_id=int(k)) for k, v in data.get("groups", {}).items()]
+    plugins = [Document(v, doc_id=int(k)) for k, v in data.get("plugins", {}).items()]
+    return groups, plugins
\ No newline at end of file
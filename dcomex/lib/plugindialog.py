@@ -1,4 +1,4 @@
-import typing, copy
+import typing
 from PyQt5.QtWidgets import QWidget, QPushButton, QVBoxLayout, QTableView, QDialog
 from PyQt5.QtWidgets import QHBoxLayout, QLabel, QLineEdit, QComboBox
 from PyQt5.QtWidgets import QFileDialog, QMessageBox, QTabWidget, QCheckBox
@@ -40,17 +40,21 @@ class PluginDialog(QDialog):
     self.setLayout(self._layout)
 
   def build_plugins_table(self):
-    items, headers = self.load_plugin_table_data()
-    self.plugins_model = TableModel(items, headers, self)
+    headers = ["Name", "Display", "Type", "Group", "Settings Path", "Data Path"]
+    self.plugins_model = TableModel(self._plugin_manager.get_plugins(), headers, self, row_data=self.plugin_table_row)
     self.plugins_view = QTableView()
     self.plugins_view.setModel(self.plugins_model)
+    self.plugins_view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+    self.plugins_view.setSortingEnabled(True)
     self._plugins_layout.addWidget(self.plugins_view)
 
   def build_groups_table(self):
-    items, headers = self.load_group_table_data()
-    self.groups_model = TableModel(items, headers, self)
+    headers = ["Name", "Display", "Type"]
+    self.groups_model = TableModel(self._plugin_manager.get_groups(), headers, self, row_data=self.group_table_row)
     self.groups_view = QTableView()
     self.groups_view.setModel(self.groups_model)
+    self.groups_view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+    self.groups_view.setSortingEnabled(True)
     self._groups_layout.addWidget(self.groups_view)
 
   def save_current_plugin_data(self, data, index=None):
@@ -70,40 +74,22 @@ class PluginDialog(QDialog):
     self.refresh_group_table()
 
   def refresh_plugin_table(self):
-    items, headers = self.load_plugin_table_data()
-    self.plugins_model.deleteLater()
-    self.plugins_model = TableModel(data=items, headers=headers, parent=self)
-    self.plugins_view.setModel(self.plugins_model)
+    self.plugins_model.set_records(self._plugin_manager.get_plugins())
 
   def refresh_group_table(self):
-    items, headers = self.load_group_table_data()
-    self.groups_model.deleteLater()
-    self.groups_model = TableModel(data=items, headers=headers, parent=self)
-    self.groups_view.setModel(self.groups_model)
+    self.groups_model.set_records(self._plugin_manager.get_groups())
 
-  def load_plugin_table_data(self):
-    _data = self._plugin_manager.get_plugins()
-    items = []
-    for d in _data:
-      i_type = d.get("type")
+  def plugin_table_row(self, d):
+    i_type = d.get("type")
+    if not i_type is None:
+      i_type = PluginType.get_item_by_value(i_type)
       if not i_type is None:
-        i_type = PluginType.get_item_by_value(i_type)
-        if not i_type is None:
-          i_type = i_type.name
-
-      items.append([d.get("name"), d.get("display"), i_type, d.get("group", ""), d.get("settings"), d.get("path"), d.doc_id])
-
-    headers = ["Name", "Display", "Type", "Group", "Settings Path", "Data Path"]
-    return items, headers
+        i_type = i_type.name
 
-  def load_group_table_data(self):
-    _data = self._plugin_manager.get_groups()
-    items = []
-    for d in _data:
-      items.append([d.get("name"), d.get("display"), d.get("type"), d.doc_id])
+    return [d.get("name"), d.get("display"), i_type, d.get("group", ""), d.get("settings"), d.get("path")]
 
-    headers = ["Name", "Display", "Type"]
-    return items, headers
+  def group_table_row(self, d):
+    return [d.get("name"), d.get("display"), d.get("type")]
 
   def build_plugins_buttons(self):
     widget = QWidget(self)
@@ -165,13 +151,11 @@ class PluginDialog(QDialog):
     result = QMessageBox.question(self, "Remove Plugin!", "Are you sure you want to remove plugin(s) ?",QMessageBox.Yes| QMessageBox.No)
     if result == QMessageBox.Yes:
       indexes = self.plugins_view.selectedIndexes()
-      idxs = []
+      doc_ids = set()
       for idx in indexes:
-        idxs.append(idx.row())
-      
-      idxs = sorted(idxs, reverse=True)
-      for idx in idxs:
-        doc_id = self.plugins_model._data[idx][-1]
+        doc_ids.add(self.plugins_model.record(idx.row()).doc_id)
+
+      for doc_id in doc_ids:
         self._plugin_manager.remove_plugin(doc_id)
       
       self.refresh_plugin_table()
@@ -180,13 +164,11 @@ class PluginDialog(QDialog):
     result = QMessageBox.question(self, "Remove Plugin Group!", "Are you sure you want to remove plugin group(s) ?",QMessageBox.Yes| QMessageBox.No)
     if result == QMessageBox.Yes:
       indexes = self.groups_view.selectedIndexes()
-      idxs = []
+      doc_ids = set()
       for idx in indexes:
-        idxs.append(idx.row())
-      
-      idxs = sorted(idxs, reverse=True)
-      for idx in idxs:
-        doc_id = self.groups_model._data[idx][-1]
+        doc_ids.add(self.groups_model.record(idx.row()).doc_id)
+
+      for doc_id in doc_ids:
         self._plugin_manager.remove_group(doc_id)
       
       self.refresh_group_table()
@@ -194,8 +176,7 @@ class PluginDialog(QDialog):
   def on_edit_selected_plugin_clicked(self):
     indexes = self.plugins_view.selectedIndexes()
     if len(indexes) > 0:
-      index = indexes[0].row()
-      doc_id = self.plugins_model._data[index][-1]
+      doc_id = self.plugins_model.record(indexes[0].row()).doc_id
       data = self._plugin_manager.get_plugin(doc_id)
       index = doc_id
       if not isinstance(data, dict):
@@ -206,8 +187,7 @@ class PluginDialog(QDialog):
   def on_edit_selected_group_clicked(self):
     indexes = self.groups_view.selectedIndexes()
     if len(indexes) > 0:
-      index = indexes[0].row()
-      doc_id = self.groups_model._data[index][-1]
+      doc_id = self.groups_model.record(indexes[0].row()).doc_id
       data = self._plugin_manager.get_group(doc_id)
       index = doc_id
       if not isinstance(data, dict):
@@ -0,0 +1,94 @@
+import numpy as np
+
+MODES = {"mip": "MIP", "minip": "MinIP", "mean": "Mean"}
+BLOCK_SIZE = 8
+PROJECTION_BUDGET = 512 << 20
+
+def _take(data, axis, start, stop):
+  index = [slice(None)] * 3
+  index[axis] = slice(start, stop)
+  return data[tuple(index)]
+
+def _reduce(data, axis, mode):
+  if mode == "mip":
+    return np.max(data, axis=axis)
+  if mode == "minip":
+    return np.min(data, axis=axis)
+  return np.sum(data, axis=axis, dtype=np.float32)
+
+def _combine(a, b, mode):
+  if a is None:
+    return b
+  if mode == "mip":
+    return np.maximum(a, b)
+  if mode == "minip":
+    return np.minimum(a, b)
+  return a + b
+
+class VolumeProjection:
+  # Projections along one display axis are built from partial projections of
+  # blocks of BLOCK_SIZE slices: the full projection and any slab only
+  # combine the blocks inside it and read the few slices at its edges, so a
+  # slab following the cursor is updated without a pass over the volume
+  def __init__(self, volume, axis, mode, frame=0, block=BLOCK_SIZE) -> None:
+    self.volume = volume
+    self.axis = axis
+    self.mode = mode
+    self.frame = frame
+    self.block = block
+    self.depth = volume.shape[axis]
+    self.blocks = None
+
+  @property
+  def nbytes(self):
+    return 0 if self.blocks is None else self.blocks.nbytes
+
+  def ready(self):
+    return not self.blocks is None
+
+  def _data(self):
+    return self.volume.frame(self.frame)
+
+  def _project(self, data, start, stop):
+    # Only one chunk of slices is scaled at a time
+    return _reduce(self.volume.scale(np.asarray(_take(data, self.axis, start, stop))), self.axis, self.mode)
+
+  def build(self, cancelled=None):
+    data = self._data()
+    blocks = None
+    count = (self.depth + self.block - 1) // self.block
+    for k in range(count):
+      if (not cancelled is None) and cancelled():
+        return False
+      part = self._project(data, k * self.block, (k + 1) * self.block)
+      if blocks is None:
+        blocks = np.empty((count,) + part.shape, dtype=part.dtype)
+      blocks[k] = part
+    self.blocks = blocks
+    return True
+
+  def slab_range(self, index, thickness=0):
+    # Slab of thickness slices centered on index, the whole axis for 0
+    if thickness <= 0 or thickness >= self.depth:
+      return 0, self.depth
+    start = min(max(index - thickness // 2, 0), self.depth - thickness)
+    return start, start + thickness
+
+  def project(self, start=0, stop=None):
+    stop = self.depth if stop is None else stop
+    b = self.block
+    first, last = -(-start // b), stop // b
+    out = None
+    if first < last:
+      data = self._data() if (start < first * b or last * b < stop) else None
+      out = _reduce(self.blocks[first:last], 0, self.mode)
+      if start < first * b:
+        out = _combine(out, self._project(data, start, first * b), self.mode)
+      if last * b < stop:
+        out = _combine(out, self._project(data, last * b, stop), self.mode)
+    else:
+      out = self._project(self._data(), start, stop)
+
+    if self.mode == "mean":
+      out = out / np.float32(max(stop - start, 1))
+    return out
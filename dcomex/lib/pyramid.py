@@ -0,0 +1,145 @@
+import os, threading
+import numpy as np
+from .fingerprint import fingerprint_file
+
+CACHE_BASE = os.path.join(os.path.expanduser("~"), ".dcomex", "cache", "pyramid")
+MIN_VOXELS = 128 ** 3
+MIN_SIZE = 64
+SLAB_SIZE = 32
+
+def cache_dir_for(workspace_file=None):
+  # Pyramids are kept next to the workspace when there is one, so they move
+  # with the data, otherwise in the user cache
+  if not workspace_file is None:
+    return os.path.join(os.path.dirname(os.path.abspath(workspace_file)), ".dcomex_cache", "pyramid")
+  return CACHE_BASE
+
+def reduce2(data, is_seg=False):
+  # Halves every axis: labels are subsampled, intensities are block averaged
+  if is_seg:
+    return data[::2, ::2, ::2]
+
+  pad = [(0, s % 2) for s in data.shape]
+  if any(p[1] > 0 for p in pad):
+    data = np.pad(data, pad, mode="edge")
+
+  sh = data.shape
+  out = data.reshape(sh[0] // 2, 2, sh[1] // 2, 2, sh[2] // 2, 2).mean(axis=(1, 3, 5), dtype=np.float32)
+  if data.dtype.kind in "iub":
+    out = np.rint(out)
+  return out.astype(data.dtype, copy=False)
+
+class VolumePyramid:
+  def __init__(self, volume, cache_dir=None, min_size=MIN_SIZE) -> None:
+    self.volume = volume
+    self.cache_dir = cache_dir if not cache_dir is None else CACHE_BASE
+    self.min_size = min_size
+    self.levels = {}
+    self.digest = None
+    self.cancelled = False
+    self.thread = None
+
+  def factors(self):
+    return sorted(self.levels)
+
+  def ready(self, factor):
+    return factor in self.levels
+
+  def level(self, factor):
+    return self.levels.get(factor)
+
+  def interactive_factor(self, size=256):
+    # Smallest ready level whose largest side fits in size voxels
+    levels = self.levels
+    factors = sorted(levels)
+    if len(factors) == 0:
+      return 1
+    for f in factors:
+      if max(levels[f].shape) <= size:
+        return f
+    return factors[-1]
+
+  def slice(self, axis, index, factor):
+    data = self.levels[factor]
+    index = min(index // factor, data.shape[axis] - 1)
+    if axis == 0:
+      data = data[index, :, :]
+    elif axis == 1:
+      data = data[:, index, :]
+    else:
+      data = data[:, :, index]
+    return self.volume.scale(data)
+
+  def _cache_file(self, factor):
+    # Label levels are stored in the compact label dtype
+    kind = "labels" if self.volume.is_seg else "img"
+    return os.path.join(self.cache_dir, f"{self.digest}_{kind}_{factor}.npy")
+
+  def _reduce(self, source, axis):
+    # The source is read in slabs along the axis that is contiguous on disk
+    shape = [(s + 1) // 2 for s in source.shape]
+    out = np.empty(shape, dtype=source.dtype)
+    for k in range(0, source.shape[axis], SLAB_SIZE):
+      if self.cancelled:
+        return None
+      index = [slice(None)] * 3
+      index[axis] = slice(k, k + SLAB_SIZE)
+      slab = reduce2(np.asarray(source[tuple(index)]), self.volume.is_seg)
+      index[axis] = slice(k // 2, k // 2 + slab.shape[axis])
+      out[tuple(index)] = slab
+    return out
+
+  def _save(self, filename, data):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp_file = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, "wb") as f:
+      np.save(f, data)
+    os.replace(tmp_file, filename)
+
+  def build(self):
+    try:
+      self.digest = fingerprint_file(self.volume.filename)
+    except Exception as ex:
+      print(f"Error fingerprinting {self.volume.filename}:\n{ex}")
+
+    source = self.volume._volume()
+    axes = self.volume.axes
+    axis = axes.index(2) if 2 in axes else 2
+    factor = 1
+    while max(source.shape) > self.min_size and not self.cancelled:
+      factor *= 2
+      filename = self._cache_file(factor) if not self.digest is None else None
+      level = None
+      if (not filename is None) and os.path.isfile(filename):
+        try:
+          level = np.load(filename, mmap_mode="r")
+        except Exception as ex:
+          print(f"Error loading pyramid level {filename}:\n{ex}")
+
+      if level is None:
+        level = self._reduce(source, axis)
+        if level is None:
+          return
+        if not filename is None:
+          try:
+            self._save(filename, level)
+            level = np.load(filename, mmap_mode="r")
+          except Exception as ex:
+            print(f"Error saving pyramid level {filename}:\n{ex}")
+
+      # Levels are published with one assignment of a new dict, the GUI
+      # thread never sees the dict change or a level before it is complete
+      self.levels = {**self.levels, factor: level}
+      source = level
+
+  def start(self):
+    self.thread = threading.Thread(target=self.build, daemon=True)
+    self.thread.start()
+    return self.thread
+
+  def cancel(self):
+    self.cancelled = True
+
+def needs_pyramid(volume, min_voxels=MIN_VOXELS):
+  sh = volume.shape
+  return sh[0] * sh[1] * sh[2] >= min_voxels
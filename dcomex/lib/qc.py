@@ -0,0 +1,243 @@
+import os, re, csv, html, json, hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from .data import DataType
+from .workspace import iter_workspace_entries, entry_paths, entry_subject
+
+SEG_PATTERN = r"seg|label|mask"
+PANEL_SIZE = 256
+OPACITY = 0.5
+NIFTI_EXTENSIONS = (".nii", ".nii.gz", ".img", ".hdr", ".mgz")
+
+def is_nifti(path):
+  return path.lower().endswith(NIFTI_EXTENSIONS) and os.path.isfile(path)
+
+def workspace_subjects(filename, pattern=None, image_pattern=None, seg_pattern=SEG_PATTERN):
+  # Image entries grouped by subject, segmentations are told apart by name
+  groups = OrderedDict()
+  for entry in iter_workspace_entries(filename):
+    if entry.get("type") != DataType.IMAGE.value or entry.get("ismultiple"):
+      continue
+    paths = entry_paths(entry)
+    if len(paths) == 0 or not is_nifti(paths[0]):
+      continue
+    subject = entry_subject(entry, pattern)
+    if subject is None:
+      continue
+
+    text = f"{entry.get('name') or ''} {os.path.basename(paths[0])}"
+    group = groups.setdefault(subject, {"images": [], "segs": []})
+    if re.search(seg_pattern, text, re.IGNORECASE):
+      group["segs"].append(paths[0])
+    elif image_pattern is None or re.search(image_pattern, text, re.IGNORECASE):
+      group["images"].append(paths[0])
+
+  subjects = []
+  for subject, group in groups.items():
+    if len(group["images"]) == 0:
+      continue
+    seg = group["segs"][0] if len(group["segs"]) > 0 else None
+    subjects.append({"subject": subject, "image": group["images"][0], "segmentation": seg})
+  return subjects
+
+def manifest_subjects(filename):
+  # CSV (or TSV) with subject, image and an optional segmentation column,
+  # relative paths are relative to the manifest
+  base = os.path.dirname(os.path.abspath(filename))
+  delimiter = "\t" if filename.lower().endswith(".tsv") else ","
+  subjects = []
+  with open(filename, "r", newline="") as csv_file:
+    for k, row in enumerate(csv.DictReader(csv_file, delimiter=delimiter)):
+      row = {str(key).strip().lower(): (value or "").strip() for key, value in row.items() if not key is None}
+      image = row.get("image", "")
+      if image == "":
+        continue
+      seg = row.get("segmentation", row.get("seg", ""))
+      subjects.append({
+        "subject": row.get("subject") or f"subject_{k + 1}",
+        "image": os.path.join(base, image),
+        "segmentation": os.path.join(base, seg) if seg != "" else None,
+      })
+  return subjects
+
+def focus_point(volume, seg=None, step=16):
+  # Center of the labelled voxels, the volume center without labels. Only
+  # the labelled bounding box is read, in slabs of the compact label data
+  from .labels import as_labels
+  if not seg is None:
+    data = seg.frame_view(0)
+    box = seg.bbox if not seg.bbox is None else [(0, n) for n in data.shape[:3]]
+    count, sums = 0, np.zeros(3)
+    for k in range(box[2][0], box[2][1], step):
+      slab = data[box[0][0]:box[0][1], box[1][0]:box[1][1], k:min(k + step, box[2][1])]
+      mask = as_labels(seg.scale(slab)) > 0
+      count += int(np.count_nonzero(mask))
+      for a in range(3):
+        hits = mask.sum(axis=tuple(d for d in range(3) if d != a))
+        start = k if a == 2 else box[a][0]
+        sums[a] += float(np.dot(hits, np.arange(start, start + len(hits))))
+    if count > 0:
+      return [int(round(c / count)) for c in sums]
+  return [s // 2 for s in volume.shape]
+
+def to_gray(data, window):
+  lo, hi = float(window[0]), float(window[1])
+  gray = (np.nan_to_num(np.asarray(data, dtype=np.float32), nan=lo) - lo) * (255.0 / max(hi - lo, 1e-6))
+  return np.clip(gray, 0, 255).astype(np.uint8)
+
+def resample(data, zooms, size):
+  # Nearest neighbour to size pixels on the longest side with the physical
+  # aspect ratio
+  w, h = data.shape[0] * zooms[0], data.shape[1] * zooms[1]
+  scale = size / max(w, h, 1e-6)
+  out = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+  ix = ((np.arange(out[0]) + 0.5) * data.shape[0] / out[0]).astype(np.intp)
+  iy = ((np.arange(out[1]) + 0.5) * data.shape[1] / out[1]).astype(np.intp)
+  return data[np.ix_(ix, iy)]
+
+def render_panel(volume, seg, axis, index, window, color_table, opacity=OPACITY, size=PANEL_SIZE):
+  # Same slicing and label colors as the viewer panels
+  rgb = np.repeat(to_gray(volume.slice(axis, index), window)[:, :, None], 3, axis=2).astype(np.float32)
+  if not seg is None:
+    rgba = color_table.apply(seg.slice(axis, index))
+    alpha = rgba[:, :, 3:4].astype(np.float32) * (opacity / 255.0)
+    rgb = rgb * (1.0 - alpha) + rgba[:, :, :3] * alpha
+  zooms = [z for k, z in enumerate(volume.zooms) if k != axis]
+  rgb = resample(rgb.astype(np.uint8), zooms, size)
+  # Columns are x in the viewer, image rows are y
+  return np.ascontiguousarray(rgb.transpose(1, 0, 2))
+
+def montage(panels, gap=4):
+  height = max(p.shape[0] for p in panels)
+  width = sum(p.shape[1] for p in panels) + gap * (len(panels) - 1)
+  out = np.zeros((height, width, 3), dtype=np.uint8)
+  x = 0
+  for p in panels:
+    y = (height - p.shape[0]) // 2
+    out[y:y + p.shape[0], x:x + p.shape[1]] = p
+    x += p.shape[1] + gap
+  return out
+
+def safe_name(text):
+  # Subjects differing only in replaced characters keep apart through a
+  # short hash of the raw name
+  text = str(text)
+  name = re.sub(r"[^\w.-]+", "_", text).strip("_")
+  if name != text:
+    name = f"{name or 'subject'}_{hashlib.sha1(text.encode('utf-8')).hexdigest()[:8]}"
+  return name
+
+def unique_names(subjects):
+  # File and anchor names, repeated subjects get an index suffix. Names are
+  # compared case insensitively for case insensitive file systems
+  names, used = [], set()
+  for subject in subjects:
+    name = base = safe_name(subject)
+    k = 1
+    while name.lower() in used:
+      k += 1
+      name = f"{base}_{k}"
+    used.add(name.lower())
+    names.append(name)
+  return names
+
+def render_subject(job):
+  # Runs in a worker process, everything it needs is in the job
+  from matplotlib import image as mpimg
+  from .volume import Volume
+  from .labels import LabelColorTable
+  from .stats import volume_stats
+  from .fingerprint import save_fingerprints
+
+  result = {"subject": job["subject"], "name": job["name"], "image": job["image"], "segmentation": job.get("segmentation"), "png": None, "error": None, "warning": None}
+  try:
+    volume = Volume(job["image"])
+    stats = volume_stats(volume)
+    window = stats.window() if not stats is None else volume.data_range()
+    result["window"] = [float(w) for w in window]
+
+    seg = None
+    if not job.get("segmentation") is None:
+      seg = Volume(job["segmentation"], is_seg=True)
+      if seg.shape != volume.shape:
+        result["warning"] = f"Segmentation shape {seg.shape} differs from image shape {volume.shape}"
+        seg = None
+      else:
+        seg.complete()
+        result["labels"] = {str(k): v for k, v in seg.labels.items() if k != 0}
+
+    point = focus_point(volume, seg)
+    result["point"] = point
+    table = LabelColorTable()
+    panels = [render_panel(volume, seg, axis, point[axis], window, table, job["opacity"], job["size"]) for axis in (2, 1, 0)]
+    filename = os.path.join(job["output"], f"{job['name']}.png")
+    mpimg.imsave(filename, montage(panels))
+    result["png"] = filename
+  except Exception as ex:
+    result["error"] = str(ex)
+  finally:
+    # atexit does not run in pool workers, the index is saved per subject
+    save_fingerprints()
+  return result
+
+def write_index(results, output_dir):
+  rows = []
+  for r in results:
+    name = html.escape(str(r["subject"]))
+    if r["error"] is None:
+      img = f'<img src="{html.escape(os.path.basename(r["png"]))}" loading="lazy">'
+    else:
+      img = f'<p class="error">{html.escape(r["error"])}</p>'
+    notes = []
+    if not r.get("warning") is None:
+      notes.append(f'<p class="warning">{html.escape(r["warning"])}</p>')
+    labels = r.get("labels")
+    if not labels is None:
+      text = ", ".join(f"{k}: {v}" for k, v in labels.items()) if len(labels) > 0 else "no labels"
+      notes.append(f"<p>Labels (voxels): {html.escape(text)}</p>")
+    files = [r["image"]] + ([r["segmentation"]] if r.get("segmentation") else [])
+    notes.append("<p class=\"files\">" + "<br>".join(html.escape(f) for f in files) + "</p>")
+    rows.append(f'<div class="subject" id="{html.escape(r["name"])}"><h3>{name}</h3>{img}{"".join(notes)}</div>')
+
+  failed = sum(1 for r in results if not r["error"] is None)
+  page = f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>QC</title>
+<style>
+body {{ font-family: sans-serif; background: #222; color: #ddd; }}
+.subject {{ margin: 0 0 24px 0; }}
+.subject h3 {{ margin: 4px 0; }}
+.files {{ font-size: 11px; color: #999; }}
+.error {{ color: #f66; }}
+.warning {{ color: #fc6; }}
+</style></head><body>
+<h2>{len(results)} subjects, {failed} failed</h2>
+{"".join(rows)}
+</body></html>
+"""
+  filename = os.path.join(output_dir, "index.html")
+  tmp_file = f"{filename}.tmp"
+  with open(tmp_file, "w") as html_file:
+    html_file.write(page)
+  os.replace(tmp_file, filename)
+
+  with open(os.path.join(output_dir, "qc.json"), "w") as json_file:
+    json.dump(results, json_file, indent=2)
+  return filename
+
+def run_qc(subjects, output_dir, workers=None, size=PANEL_SIZE, opacity=OPACITY, progress=None):
+  # One subject per task in a process pool, no display is needed
+  os.makedirs(output_dir, exist_ok=True)
+  names = unique_names(s["subject"] for s in subjects)
+  jobs = [dict(s, name=name, output=output_dir, size=size, opacity=opacity) for s, name in zip(subjects, names)]
+  results = []
+  with ProcessPoolExecutor(max_workers=workers) as pool:
+    futures = [pool.submit(render_subject, job) for job in jobs]
+    for future in as_completed(futures):
+      result = future.result()
+      results.append(result)
+      if not progress is None:
+        progress(result, len(results), len(jobs))
+
+  results.sort(key=lambda r: str(r["subject"]))
+  return results
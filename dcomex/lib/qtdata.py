@@ -1,39 +1,140 @@
-from PyQt5.QtCore import QAbstractTableModel, Qt, QSize
+from PyQt5.QtCore import QAbstractTableModel, Qt, QSize, QModelIndex
 from datetime import datetime
 
 class TableModel(QAbstractTableModel):
-  def __init__(self, data, headers=None, parent=None) -> None:
+  BATCH_SIZE = 256
+
+  def __init__(self, data, headers=None, parent=None, row_data=None, decoration=None) -> None:
     super().__init__(parent)
+    # data holds the source records, row_data maps one record to its column
+    # values and is only evaluated for rows the view actually asks for, the
+    # same goes for decoration which gives the icon of the first column
     self._data = data
     self._headers = headers
+    self._row_data = row_data
+    self._decoration = decoration
+    self._index = None
+    self._filter = ""
+    self._sort = None
+    self._loaded = min(self.BATCH_SIZE, self._size())
+
+  def _size(self):
+    if not self._index is None:
+      return len(self._index)
+    return len(self._data)
+
+  def _row(self, source_row):
+    record = self._data[source_row]
+    if self._row_data is None:
+      return record
+    return self._row_data(record)
+
+  def source_row(self, row):
+    if not self._index is None:
+      return self._index[row]
+    return row
+
+  def record(self, row):
+    return self._data[self.source_row(row)]
+
+  def set_records(self, data):
+    self.beginResetModel()
+    self._data = data
+    self._build_index()
+    self._loaded = min(self.BATCH_SIZE, self._size())
+    self.endResetModel()
+
+  def refresh(self):
+    self.set_records(self._data)
+
+  def set_filter(self, text):
+    self._filter = str(text).strip().lower()
+    self.refresh()
+
+  def sort(self, column, order=Qt.AscendingOrder):
+    if column < 0:
+      self._sort = None
+    else:
+      self._sort = (column, order)
+    self.refresh()
+
+  def _build_index(self):
+    if self._filter == "" and self._sort is None:
+      self._index = None
+      return
+
+    rows = range(len(self._data))
+    if self._filter != "":
+      flt = self._filter
+      rows = [r for r in rows if any(flt in str(v).lower() for v in self._row(r) if not v is None)]
+
+    if not self._sort is None:
+      column, order = self._sort
+
+      def key(r):
+        value = self._row(r)[column]
+        if value is None:
+          return (2, "")
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+          return (0, value)
+        return (1, str(value).lower())
+
+      rows = sorted(rows, key=key, reverse=(order == Qt.DescendingOrder))
+
+    self._index = list(rows)
+
+  def canFetchMore(self, parent=QModelIndex()):
+    if parent.isValid():
+      return False
+    return self._loaded < self._size()
+
+  def fetchMore(self, parent=QModelIndex()):
+    if parent.isValid():
+      return
+    count = min(self.BATCH_SIZE, self._size() - self._loaded)
+    if count <= 0:
+      return
+    self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+    self._loaded += count
+    self.endInsertRows()
+
+  def decorations_changed(self):
+    if self._loaded > 0:
+      self.dataChanged.emit(self.index(0, 0), self.index(self._loaded - 1, 0), [Qt.DecorationRole])
 
   def data(self, index, role):
+    if role == Qt.DecorationRole:
+      if self._decoration is None or index.column() != 0:
+        return None
+      return self._decoration(self.record(index.row()))
+
     if role == Qt.DisplayRole:
-      # See below for the nested-list data structure.
-      # .row() indexes into the outer list,
-      # .column() indexes into the sub-list
-      value = self._data[index.row()][index.column()]
+      row = self._row(self.source_row(index.row()))
+      if index.column() >= len(row):
+        return None
+
+      value = row[index.column()]
       if isinstance(value, datetime):
         return value.isoformat()
 
       if isinstance(value, list):
         return str(value)
-      
+
       return value
 
   def rowCount(self, index=None):
-    # The length of the outer list.
-    return len(self._data)
+    # Rows are handed to the view in batches through fetchMore
+    return self._loaded
 
   def columnCount(self, index=None):
     # The following takes the first sub-list, and returns
     # the length (only works if all rows are an equal length)
     if not self._headers is None:
       return len(self._headers)
-      
+
     if len(self._data) > 0:
-      return len(self._data[0])
-    
+      return len(self._row(0))
+
     return 0
 
   def headerData(self, section: int, orientation: Qt.Orientation, role: int=Qt.DisplayRole):
@@ -60,5 +161,5 @@ class TableModel(QAbstractTableModel):
     if orientation == Qt.Vertical:
       if role == Qt.DisplayRole:
         return str(section + 1)
-      
-    return super().headerData(section, orientation, role)
\ No newline at end of file
+
+    return super().headerData(section, orientation, role)
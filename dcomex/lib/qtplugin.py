@@ -52,6 +52,22 @@ class QtWorker(QThread):
   def get_output(self):
     return self.output
 
+class QtInputWorker(QThread):
+  # DICOM folders are converted here so large series do not block the GUI
+  prepared = pyqtSignal(object)
+
+  def __init__(self, prepare):
+    QThread.__init__(self)
+    self.prepare = prepare
+
+  def run(self):
+    try:
+      input_data = self.prepare()
+    except Exception as ex:
+      print(f"Error preparing plugin inputs:\n{ex}")
+      input_data = None
+    self.prepared.emit(input_data)
+
 class QtPlugin(QtCore.QObject, Plugin):
   completed = QtCore.pyqtSignal(dict)
   errored = QtCore.pyqtSignal(str)
@@ -60,6 +76,7 @@ class QtPlugin(QtCore.QObject, Plugin):
   def __init__(self, data, manager, parent=None, **kwargs) -> None:
     QtCore.QObject.__init__(self, parent=parent)
     Plugin.__init__(self, data=data, manager=manager, kwargs=kwargs)
+    self.input_worker = None
 
   def on_error(self, error): # to be handled by inhered class
     self.last_error = error
@@ -72,6 +89,16 @@ class QtPlugin(QtCore.QObject, Plugin):
   def on_finished(self): # to be handled by inhered class
     self.finished.emit()
 
+  def on_prepare_inputs(self): # to be handled by inhered class and call _inputs_prepared when done
+    self.input_worker = QtInputWorker(self.prepare_inputs)
+    self.input_worker.prepared.connect(self._inputs_prepared)
+    self.input_worker.start()
+
+  def terminate(self):
+    if (not self.input_worker is None) and self.input_worker.isRunning():
+      self.input_worker.terminate()
+    Plugin.terminate(self)
+
   def on_python_run(self, function_name, executable, modules, args, kwargs): # to be handled by inhered class and call _process_completed when done
     if not self.worker is None:
       self.worker.deleteLater()
@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict, deque
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+class RenderScheduler(QObject):
+  frameRendered = pyqtSignal(float)
+
+  def __init__(self, interval=16, parent=None) -> None:
+    super().__init__(parent)
+    # Targets marked dirty between two frames are rendered once, with the
+    # reset flags of all the requests combined
+    self.interval = interval
+    self.dirty = OrderedDict()
+    self.frames = 0
+    self.requests = 0
+    self.frame_times = deque(maxlen=120)
+    self.last_frame = 0.0
+    self.timer = QTimer(self)
+    self.timer.setSingleShot(True)
+    self.timer.timeout.connect(self.flush)
+
+  def mark_dirty(self, target, callback, reset=False):
+    self.requests += 1
+    if target in self.dirty:
+      _, prev_reset = self.dirty[target]
+      reset = reset or prev_reset
+    self.dirty[target] = (callback, reset)
+
+    if not self.timer.isActive():
+      # The first change after an idle period is drawn right away, later
+      # ones wait for the next frame
+      elapsed = (time.perf_counter() - self.last_frame) * 1000.0
+      self.timer.start(int(max(0, self.interval - elapsed)))
+
+  def cancel(self, target):
+    self.dirty.pop(target, None)
+
+  def flush(self):
+    self.timer.stop()
+    if len(self.dirty) == 0:
+      return
+
+    dirty = self.dirty
+    self.dirty = OrderedDict()
+
+    start = time.perf_counter()
+    for target, (callback, reset) in dirty.items():
+      try:
+        callback(reset)
+      except Exception as ex:
+        print(f"Error rendering {type(target).__name__}:\n{ex}")
+
+    self.last_frame = time.perf_counter()
+    elapsed = (self.last_frame - start) * 1000.0
+    self.frames += 1
+    self.frame_times.append(elapsed)
+    self.frameRendered.emit(elapsed)
+
+  def frame_time(self):
+    # Average render time in milliseconds over the recent frames
+    if len(self.frame_times) == 0:
+      return 0.0
+    return sum(self.frame_times) / len(self.frame_times)
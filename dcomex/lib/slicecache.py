@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+
+class SliceCache:
+  def __init__(self, budget=256 << 20) -> None:
+    # Keys are (volume uid, axis, index, ...) tuples, values numpy arrays
+    self.budget = budget
+    self.size = 0
+    self.items = OrderedDict()
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def contains(self, key):
+    with self.lock:
+      return key in self.items
+
+  def get(self, key, loader=None):
+    with self.lock:
+      item = self.items.get(key)
+      if not item is None:
+        self.items.move_to_end(key)
+        self.hits += 1
+        return item
+      self.misses += 1
+
+    if loader is None:
+      return None
+
+    item = loader()
+    self.put(key, item)
+    return item
+
+  def put(self, key, item):
+    nbytes = getattr(item, "nbytes", 0)
+    if nbytes > self.budget:
+      return
+
+    with self.lock:
+      old = self.items.pop(key, None)
+      if not old is None:
+        self.size -= getattr(old, "nbytes", 0)
+
+      self.items[key] = item
+      self.size += nbytes
+      while self.size > self.budget and len(self.items) > 0:
+        _, old = self.items.popitem(last=False)
+        self.size -= getattr(old, "nbytes", 0)
+
+  def remove(self, uid):
+    self.remove_if(lambda key: key[0] == uid)
+
+  def remove_if(self, predicate):
+    with self.lock:
+      for key in [k for k in self.items if predicate(k)]:
+        self.size -= getattr(self.items.pop(key), "nbytes", 0)
+
+  def clear(self):
+    with self.lock:
+      self.items.clear()
+      self.size = 0
+
+class SlicePrefetcher(threading.Thread):
+  def __init__(self, cache: SliceCache) -> None:
+    threading.Thread.__init__(self, daemon=True)
+    self.cache = cache
+    self.jobs = OrderedDict()
+    self.cond = threading.Condition()
+    self.stopped = False
+
+  def request(self, owner, jobs):
+    # jobs is a list of (key, loader) in the order they should be loaded, a
+    # new request from the same owner replaces the pending one
+    with self.cond:
+      self.jobs.pop(owner, None)
+      if len(jobs) > 0:
+        self.jobs[owner] = list(jobs)
+      self.cond.notify()
+
+  def cancel(self, owner):
+    self.request(owner, [])
+
+  def stop(self):
+    with self.cond:
+      self.stopped = True
+      self.jobs.clear()
+      self.cond.notify()
+
+  def _next_job(self):
+    with self.cond:
+      while len(self.jobs) == 0 and not self.stopped:
+        self.cond.wait()
+      if self.stopped:
+        return None
+
+      # Round robin over the owners so every panel gets its next slice
+      owner, jobs = self.jobs.popitem(last=False)
+      job = jobs.pop(0)
+      if len(jobs) > 0:
+        self.jobs[owner] = jobs
+      return job
+
+  def run(self):
+    while True:
+      job = self._next_job()
+      if job is None:
+        return
+
+      key, loader = job
+      if self.cache.contains(key):
+        continue
+
+      try:
+        self.cache.put(key, loader())
+      except Exception as ex:
+        print(f"Error prefetching slice {key}: {ex}")
@@ -0,0 +1,239 @@
+import os, json, threading
+import numpy as np
+from .fingerprint import shared_index, fingerprint_file, stat_key, file_lock
+
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".dcomex", "cache", "stats.json")
+STATS_VERSION = 2
+SLAB_SIZE = 16
+STORED_BINS = 128
+PERCENTILE_STEP = 0.5
+WINDOW = (0.5, 99.5)
+
+_cache_lock = threading.Lock()
+_cache = {}
+
+class Histogram:
+  # Counts every value in one pass without knowing the range first: integers
+  # of up to 16 bits get one bin per value, anything else is binned by the
+  # top 16 bits of its float32 pattern (sign flipped so the bins are ordered),
+  # i.e. about 0.4% relative precision whatever the outliers are
+  def __init__(self, dtype) -> None:
+    dtype = np.dtype(dtype)
+    self.exact = dtype.kind in "iub" and dtype.itemsize <= 2
+    self.offset = 0
+    if self.exact and dtype.kind in "iu":
+      self.offset = int(np.iinfo(dtype).min)
+    size = 1 << (8 * dtype.itemsize) if self.exact else 1 << 16
+    self.counts = np.zeros(size, dtype=np.int64)
+
+  def keys(self, values):
+    if self.exact:
+      return (values.astype(np.int32) - self.offset).ravel()
+    bits = np.asarray(values, dtype=np.float32).ravel().view(np.uint32)
+    bits = np.where(bits >> 31, ~bits, bits | np.uint32(0x80000000))
+    return (bits >> 16).astype(np.intp)
+
+  def add(self, values):
+    if values.size > 0:
+      self.counts += np.bincount(self.keys(values), minlength=len(self.counts))
+
+  def edge(self, k):
+    # Lower bound of bin k, bin k + 1 starts where it ends
+    if self.exact:
+      return float(k + self.offset)
+    bits = np.array([min(k, 0xffff) << 16], dtype=np.uint32)
+    bits = np.where(bits >> 31, bits ^ np.uint32(0x80000000), ~bits)
+    return float(bits.view(np.float32)[0])
+
+  def centers(self):
+    k = np.nonzero(self.counts)[0]
+    return k, np.array([(self.edge(i) + self.edge(i + 1)) / 2.0 for i in k])
+
+  def percentiles(self, ps, mi, ma):
+    # Linear interpolation inside the bin holding each percentile
+    cum = np.cumsum(self.counts)
+    total = cum[-1]
+    out = []
+    for p in ps:
+      target = total * p / 100.0
+      k = min(int(np.searchsorted(cum, target, side="left")), len(cum) - 1)
+      before = cum[k - 1] if k > 0 else 0
+      frac = (target - before) / self.counts[k] if self.counts[k] > 0 else 0.0
+      lo, hi = self.edge(k), self.edge(k + 1)
+      out.append(min(max(lo + frac * (hi - lo), mi), ma))
+    return out
+
+class IntensityStats:
+  def __init__(self, data=None) -> None:
+    data = {} if data is None else data
+    self.min = data.get("min", 0.0)
+    self.max = data.get("max", 0.0)
+    self.mean = data.get("mean", 0.0)
+    self.std = data.get("std", 0.0)
+    self.count = data.get("count", 0)
+    self.nonfinite = data.get("nonfinite", 0)
+    # Percentiles every PERCENTILE_STEP from 0 to 100
+    self.quantiles = list(data.get("quantiles", []))
+    hist = data.get("histogram", {})
+    self.hist_edges = list(hist.get("edges", []))
+    self.hist_counts = list(hist.get("counts", []))
+
+  def to_dict(self):
+    return {
+      "min": self.min,
+      "max": self.max,
+      "mean": self.mean,
+      "std": self.std,
+      "count": self.count,
+      "nonfinite": self.nonfinite,
+      "quantiles": self.quantiles,
+      "histogram": {"edges": self.hist_edges, "counts": self.hist_counts},
+    }
+
+  def range(self):
+    return [self.min, self.max]
+
+  def percentile(self, p):
+    if len(self.quantiles) == 0:
+      return self.min if p < 50 else self.max
+    grid = np.linspace(0.0, 100.0, len(self.quantiles))
+    return float(np.interp(p, grid, self.quantiles))
+
+  def window(self, lo=WINDOW[0], hi=WINDOW[1]):
+    # Robust display window, min/max when the percentiles collapse (e.g.
+    # images that are mostly background)
+    w = [self.percentile(lo), self.percentile(hi)]
+    if w[1] <= w[0]:
+      return self.range()
+    return w
+
+def compute_stats(volume, step=SLAB_SIZE, cancelled=None):
+  # One pass over slabs along the last raw axis (contiguous in NIfTI files),
+  # nothing larger than a slab is converted to float
+  raw = volume.raw
+  if raw is None:
+    volume.reload()
+    raw = volume.raw
+  if raw.ndim > 3:
+    raw = raw[(Ellipsis,) + (0,) * (raw.ndim - 3)]
+
+  dtype = np.dtype(np.float32) if volume.is_scaled() else raw.dtype
+  if dtype.kind == "b":
+    dtype = np.dtype(np.uint8)
+  hist = Histogram(dtype)
+  mi, ma = None, None
+  total, total_sq, count, nonfinite = 0.0, 0.0, 0, 0
+  for k in range(0, raw.shape[2], step):
+    if (not cancelled is None) and cancelled():
+      return None
+    slab = volume.scale(np.asarray(raw[:, :, k:k + step]))
+    if slab.dtype.kind == "b":
+      slab = slab.view(np.uint8)
+    if slab.dtype.kind == "f":
+      finite = np.isfinite(slab)
+      if not finite.all():
+        nonfinite += int(slab.size - np.count_nonzero(finite))
+        slab = slab[finite]
+    if slab.size == 0:
+      continue
+
+    smi, sma = slab.min(), slab.max()
+    mi = smi if mi is None else min(mi, smi)
+    ma = sma if ma is None else max(ma, sma)
+    total += float(np.sum(slab, dtype=np.float64))
+    total_sq += float(np.sum(np.square(slab, dtype=np.float64)))
+    count += slab.size
+    hist.add(slab)
+
+  stats = IntensityStats()
+  stats.count = count
+  stats.nonfinite = nonfinite
+  if count == 0:
+    return stats
+
+  stats.min, stats.max = float(mi), float(ma)
+  stats.mean = total / count
+  stats.std = float(np.sqrt(max(total_sq / count - stats.mean ** 2, 0.0)))
+  grid = np.arange(0.0, 100.0 + PERCENTILE_STEP / 2, PERCENTILE_STEP)
+  stats.quantiles = hist.percentiles(grid, stats.min, stats.max)
+  stats.quantiles[0], stats.quantiles[-1] = stats.min, stats.max
+
+  # A coarse linear histogram is kept for reports, bin centers can lie just
+  # outside the data range and are clipped so every value is counted
+  keys, centers = hist.centers()
+  centers = np.clip(centers, stats.min, stats.max)
+  counts, edges = np.histogram(centers, bins=STORED_BINS, range=(stats.min, max(stats.max, stats.min + 1e-6)), weights=hist.counts[keys])
+  stats.hist_counts = [int(c) for c in counts]
+  stats.hist_edges = [float(e) for e in edges]
+  return stats
+
+def _cache_key(digest, is_seg=False):
+  return f"{digest}_{'seg' if is_seg else 'img'}_v{STATS_VERSION}"
+
+def _load_cache(filename):
+  # The parsed file is kept until the file changes, callers hold _cache_lock
+  try:
+    key = stat_key(os.stat(filename))
+  except OSError:
+    return {}
+  cached = _cache.get(filename)
+  if not cached is None and cached[0] == key:
+    return cached[1]
+  try:
+    with open(filename, "r") as json_file:
+      data = json.load(json_file)
+  except Exception as ex:
+    print(f"Error loading intensity statistics:\n{ex}")
+    return {}
+  _cache[filename] = (key, data)
+  return data
+
+def _save_entry(filename, key, stats):
+  with _cache_lock, file_lock(filename):
+    data = dict(_load_cache(filename))
+    data[key] = stats.to_dict()
+    tmp_file = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, "w") as json_file:
+      json.dump(data, json_file)
+    os.replace(tmp_file, filename)
+    _cache[filename] = (stat_key(os.stat(filename)), data)
+
+def cached_stats(filename, is_seg=False, cache_file=CACHE_FILE):
+  # Only files whose fingerprint is already indexed are looked up, nothing
+  # is hashed or read here so it can be used before a volume is loaded
+  try:
+    digest = shared_index().lookup(filename)
+  except Exception as ex:
+    print(f"Error looking up {filename}:\n{ex}")
+    return None
+  if digest is None:
+    return None
+  with _cache_lock:
+    data = _load_cache(cache_file).get(_cache_key(digest, is_seg))
+  return None if data is None else IntensityStats(data)
+
+def volume_stats(volume, cache_file=CACHE_FILE, cancelled=None):
+  # Statistics of a volume, cached by the file fingerprint. Files already
+  # in the index are found by their stats, only new files are hashed
+  key = None
+  try:
+    digest = shared_index().lookup(volume.filename)
+    if digest is None:
+      digest = fingerprint_file(volume.filename)
+    key = _cache_key(digest, volume.is_seg)
+  except Exception as ex:
+    print(f"Error fingerprinting {volume.filename}:\n{ex}")
+
+  if not key is None:
+    with _cache_lock:
+      data = _load_cache(cache_file).get(key)
+    if not data is None:
+      return IntensityStats(data)
+
+  stats = compute_stats(volume, cancelled=cancelled)
+  if (not stats is None) and (not key is None):
+    try:
+      _save_entry(cache_file, key, stats)
+    except Exception as ex:
+      print(f"Error saving intensity statistics:\n{ex}")
+  return stats
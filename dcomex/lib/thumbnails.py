@@ -0,0 +1,214 @@
+import os, threading
+import numpy as np
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QPointF, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QPainter, QColor, QPolygonF, QPixmap, QIcon
+from .data import DataType
+from .fingerprint import fingerprint_file
+from .stats import cached_stats
+
+CACHE_BASE = os.path.join(os.path.expanduser("~"), ".dcomex", "cache", "thumbnails")
+THUMB_SIZE = 64
+THUMB_VERSION = 1
+MESH_TRIANGLES = 10000
+MAX_WORKERS = 2
+
+IMAGE_EXTENSIONS = (".nii", ".nii.gz", ".img", ".hdr", ".mgz")
+MESH_EXTENSIONS = (".stl",)
+
+def entry_file(entry):
+  # File a thumbnail is made of and its kind, None for entries without one
+  # (scalars, folders, DICOM series, ...)
+  if entry is None:
+    return None
+  value = entry.get("value")
+  if isinstance(value, list):
+    value = value[0] if len(value) > 0 else None
+  if not isinstance(value, str):
+    return None
+
+  name = value.lower()
+  dtype = entry.get("type")
+  if dtype == DataType.IMAGE.value and name.endswith(IMAGE_EXTENSIONS):
+    kind = "image"
+  elif dtype == DataType.MESH.value and name.endswith(MESH_EXTENSIONS):
+    kind = "mesh"
+  else:
+    return None
+  if not os.path.isfile(value):
+    return None
+  return value, kind
+
+def mid_slice(filename):
+  # Middle axial slice in the orientation the viewer shows, only that slice
+  # is read from the file
+  import nibabel as nb
+  from .volume import display_orientation
+  img = nb.load(filename, mmap=True)
+  axes, flips = display_orientation(img.affine)
+  shape = img.shape
+  index = [slice(None)] * 3 + [0] * (len(shape) - 3)
+  index[axes[2]] = shape[axes[2]] // 2
+  data = np.asarray(img.dataobj[tuple(index)], dtype=np.float32)
+
+  rest = [a for a in range(3) if a != axes[2]]
+  if rest != [axes[0], axes[1]]:
+    data = data.T
+  data = data[::-1 if flips[0] else 1, ::-1 if flips[1] else 1]
+  zooms = img.header.get_zooms()
+  return data, (float(zooms[axes[0]]), float(zooms[axes[1]]))
+
+def fit(data, zooms, size):
+  # Nearest neighbour resampling into a size x size box, keeping the
+  # physical aspect ratio
+  w, h = data.shape[0] * zooms[0], data.shape[1] * zooms[1]
+  scale = size / max(w, h, 1e-6)
+  out = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+  ix = ((np.arange(out[0]) + 0.5) * data.shape[0] / out[0]).astype(np.intp)
+  iy = ((np.arange(out[1]) + 0.5) * data.shape[1] / out[1]).astype(np.intp)
+  return data[np.ix_(ix, iy)]
+
+def image_thumbnail(filename, size=THUMB_SIZE):
+  data, zooms = mid_slice(filename)
+  stats = cached_stats(filename)
+  if not stats is None:
+    lo, hi = stats.window()
+  else:
+    finite = data[np.isfinite(data)]
+    lo, hi = np.percentile(finite, [0.5, 99.5]) if finite.size > 0 else (0.0, 1.0)
+  scaled = (np.nan_to_num(data, nan=lo) - lo) * (255.0 / max(hi - lo, 1e-6))
+  gray = np.clip(fit(scaled, zooms, size), 0, 255).astype(np.uint8)
+
+  # Columns are x in the viewer, QImage rows are y
+  gray = np.ascontiguousarray(gray.T)
+  return QImage(gray.data, gray.shape[1], gray.shape[0], gray.strides[0], QImage.Format_Grayscale8).copy()
+
+def mesh_thumbnail(filename, size=THUMB_SIZE):
+  # Orthographic view along the thinnest axis, triangles are shaded by how
+  # much they face the viewer and drawn back to front
+  from .mesh import read_stl, decimate
+  verts, faces = read_stl(filename)
+  verts, faces = decimate(verts, faces, MESH_TRIANGLES)
+  image = QImage(size, size, QImage.Format_ARGB32_Premultiplied)
+  image.fill(Qt.transparent)
+  if len(faces) == 0:
+    return image
+
+  lo, hi = verts.min(axis=0), verts.max(axis=0)
+  extent = hi - lo
+  depth = int(np.argmin(extent))
+  u, v = [a for a in range(3) if a != depth]
+  scale = (size - 4) / max(extent[u], extent[v], 1e-6)
+  px = (verts[:, u] - lo[u]) * scale + (size - extent[u] * scale) / 2
+  py = size - ((verts[:, v] - lo[v]) * scale + (size - extent[v] * scale) / 2)
+
+  tri = verts[faces]
+  normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+  norm = np.linalg.norm(normals, axis=1)
+  facing = np.abs(normals[:, depth]) / np.where(norm > 0, norm, 1)
+  shades = (70 + 185 * facing).astype(int)
+  order = np.argsort(tri[:, :, depth].mean(axis=1))
+
+  painter = QPainter(image)
+  painter.setRenderHint(QPainter.Antialiasing)
+  painter.setPen(Qt.NoPen)
+  for k in order:
+    f = faces[k]
+    painter.setBrush(QColor(shades[k], shades[k], shades[k]))
+    painter.drawPolygon(QPolygonF([QPointF(px[i], py[i]) for i in f]))
+  painter.end()
+  return image
+
+def cache_file(digest, size, cache_dir=CACHE_BASE):
+  return os.path.join(cache_dir, f"{digest}_{size}_v{THUMB_VERSION}.png")
+
+def render_thumbnail(filename, kind, size=THUMB_SIZE, cache_dir=CACHE_BASE):
+  # Thumbnails are stored as PNG keyed by the file fingerprint
+  path = None
+  try:
+    path = cache_file(fingerprint_file(filename), size, cache_dir)
+  except Exception as ex:
+    print(f"Error fingerprinting {filename}:\n{ex}")
+
+  if (not path is None) and os.path.isfile(path):
+    image = QImage(path)
+    if not image.isNull():
+      return image
+
+  if kind == "mesh":
+    image = mesh_thumbnail(filename, size)
+  else:
+    image = image_thumbnail(filename, size)
+
+  if not path is None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if image.save(tmp_file, "PNG"):
+      os.replace(tmp_file, path)
+  return image
+
+class ThumbnailSignals(QObject):
+  done = pyqtSignal(str, object)
+
+class ThumbnailJob(QRunnable):
+  def __init__(self, filename, kind, size=THUMB_SIZE) -> None:
+    super().__init__()
+    self.setAutoDelete(False)
+    self.filename = filename
+    self.kind = kind
+    self.size = size
+    self.signals = ThumbnailSignals()
+
+  def run(self):
+    image = None
+    try:
+      image = render_thumbnail(self.filename, self.kind, self.size)
+    except Exception as ex:
+      print(f"Error rendering thumbnail of {self.filename}:\n{ex}")
+    self.signals.done.emit(self.filename, image)
+
+class ThumbnailProvider(QObject):
+  # Icons for workspace entries: icon() never blocks, missing thumbnails are
+  # rendered on a small pool of their own and ready() tells when to ask again
+  ready = pyqtSignal(str)
+
+  def __init__(self, size=THUMB_SIZE, workers=MAX_WORKERS, parent=None) -> None:
+    super().__init__(parent)
+    self.size = size
+    self.icons = {}
+    self.jobs = {}
+    self.pool = QThreadPool(self)
+    self.pool.setMaxThreadCount(workers)
+
+  def icon(self, entry):
+    info = entry_file(entry)
+    if info is None:
+      return None
+    filename, kind = info
+    if filename in self.icons:
+      return self.icons[filename]
+    self.request(filename, kind)
+    return None
+
+  def request(self, filename, kind):
+    if filename in self.jobs:
+      return
+    job = ThumbnailJob(filename, kind, self.size)
+    job.signals.done.connect(self.on_done)
+    self.jobs[filename] = job
+    self.pool.start(job)
+
+  def on_done(self, filename, image):
+    self.jobs.pop(filename, None)
+    if image is None or image.isNull():
+      self.icons[filename] = None
+    else:
+      self.icons[filename] = QIcon(QPixmap.fromImage(image))
+    self.ready.emit(filename)
+
+_provider = None
+
+def thumbnail_provider():
+  global _provider
+  if _provider is None:
+    _provider = ThumbnailProvider()
+  return _provider
@@ -1,43 +1,99 @@
-from cmath import rect
-from venv import create
 import numpy as np
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout
 from PyQt5.QtWidgets import QLabel, QSizePolicy
 from PyQt5.QtWidgets import QScrollBar
 from PyQt5.QtCore import Qt, pyqtSignal, QPointF
-from PyQt5.QtGui import QImage, QPixmap
-from pyqtgraph.opengl import GLVolumeItem, GLViewWidget, GLLinePlotItem
+from PyQt5.QtGui import QImage, QPixmap, QTransform
+from pyqtgraph.opengl import GLVolumeItem, GLViewWidget, GLLinePlotItem, GLMeshItem, MeshData
 import pyqtgraph as pg
+from .labels import LabelColorTable
+
+GRAY_LUT = np.repeat(np.arange(256, dtype=np.ubyte)[:, None], 3, axis=1)
+
+def window_levels(rng):
+  if rng is None:
+    return None
+  mi, ma = float(rng[0]), float(rng[1])
+  if ma > mi:
+    return [mi, ma]
+  if ma != 0:
+    return [min(0.0, ma), max(0.0, ma)]
+  return [0.0, 1.0]
 
 class ImageView(pg.ImageView):
   onWheelEvent = pyqtSignal(int)
   pointChanged = pyqtSignal(list)
+  levelsChanged = pyqtSignal(list)
   def __init__(self, parent=None):
     super().__init__(parent)
     self.has_image = False
+    self.levels = None
+    self.level_span = 1.0
+    self._drag_levels = None
     self.view = self.getView()
     self.view.wheelEvent = self.wheelEvent
     self.view.mouseClickEvent = self._mouseClickEvent
+    self._view_drag_event = self.view.mouseDragEvent
+    self.view.mouseDragEvent = self._mouseDragEvent
+    # The histogram is hidden, do not let it recompute on every new slice
+    self.getImageItem().sigImageChanged.disconnect(self.ui.histogram.item.imageChanged)
     self.current_point = [0, 0]
     self.point_color = None
     self.current_zoom = [1, 1]
+    self.image_factor = 1
     self.h_line_item = None
     self.v_line_item = None
+    self.overlay_item = None
+    self.overlay_opacity = 0.5
     self.ui.histogram.hide()
     self.ui.roiBtn.hide()
     self.ui.menuBtn.hide()
 
-  def set_image(self, img, reset=False):
+  def set_image(self, img, reset=False, factor=1):
+    # Coarse pyramid levels are stretched by their factor over the same area
+    scale = [z * factor for z in self.current_zoom]
     if self.has_image and (not reset):
       _state = self.getView().getState()
-      self.getImageItem().setImage(img, autoLevels=False, scale=self.current_zoom)
+      self.getImageItem().setImage(img, autoLevels=False, levels=self.levels)
+      if factor != self.image_factor:
+        self.getImageItem().setTransform(QTransform.fromScale(scale[0], scale[1]))
       self.plot_current_point()
       self.getView().setState(_state)
     else:
-      self.setImage(img, autoLevels=False, scale=self.current_zoom)
+      self.setImage(img, autoLevels=False, levels=self.levels, scale=scale)
+      self.getImageItem().setLookupTable(GRAY_LUT)
       self.plot_current_point()
 
     self.has_image = True
+    self.image_factor = factor
+
+  def set_overlay(self, img):
+    # Labels are drawn as an RGBA layer above the image, always in full
+    # resolution voxels
+    if img is None:
+      if not self.overlay_item is None:
+        self.overlay_item.setVisible(False)
+      return
+    if self.overlay_item is None:
+      self.overlay_item = pg.ImageItem()
+      self.overlay_item.setZValue(5)
+      self.overlay_item.setOpacity(self.overlay_opacity)
+      self.view.addItem(self.overlay_item)
+    self.overlay_item.setImage(img, autoLevels=False)
+    self.overlay_item.setTransform(QTransform.fromScale(self.current_zoom[0], self.current_zoom[1]))
+    self.overlay_item.setVisible(True)
+
+  def set_overlay_opacity(self, opacity):
+    self.overlay_opacity = opacity
+    if not self.overlay_item is None:
+      self.overlay_item.setOpacity(opacity)
+
+  def set_levels(self, levels, span=None):
+    self.levels = levels
+    if not span is None:
+      self.level_span = max(span, 1e-6)
+    if self.has_image and (not levels is None):
+      self.getImageItem().setLevels(levels)
 
   def set_point(self, pt):
     self.current_point = pt
@@ -68,13 +124,34 @@ class ImageView(pg.ImageView):
     notches = delta // 120
     self.onWheelEvent.emit(notches)
 
+  def _mouseDragEvent(self, event, axis=None):
+    # Middle or ctrl + left drag changes the window (x) and level (y)
+    is_window = event.button() == Qt.MiddleButton or (event.button() == Qt.LeftButton and bool(event.modifiers() & Qt.ControlModifier))
+    if (not is_window) or self.levels is None:
+      return self._view_drag_event(event, axis)
+
+    event.accept()
+    if event.isStart() or self._drag_levels is None:
+      self._drag_levels = list(self.levels)
+
+    lo, hi = self._drag_levels
+    delta = event.pos() - event.buttonDownPos()
+    step = self.level_span / 500.0
+    width = max((hi - lo) + delta.x() * step, step)
+    center = (hi + lo) / 2.0 - delta.y() * step
+    self.set_levels([center - width / 2.0, center + width / 2.0])
+    self.levelsChanged.emit(list(self.levels))
+
+    if event.isFinish():
+      self._drag_levels = None
+
   def _mouseClickEvent(self, event):
     if event.button() == 1 and self.has_image:
       zm = self.current_zoom
       spt = self.view.mapSceneToView(event.pos())
       spt = QPointF(max(0, int(spt.x() / zm[0])), max(0, int(spt.y() / zm[1])))
       for v in self.view.addedItems:
-        if isinstance(v, pg.ImageItem):
+        if isinstance(v, pg.ImageItem) and not v.image is None:
           spt = QPointF(min(spt.x(), v.width()-1), min(spt.y(), v.height()-1))
 
       if self.current_point[0] != spt.x() or self.current_point[1] != spt.y():
@@ -85,11 +162,31 @@ class ImageView(pg.ImageView):
 class ViewPanel(QWidget):
   sliderValueChanged = pyqtSignal(int)
   pointChanged = pyqtSignal(list)
+  levelsChanged = pyqtSignal(list)
   
   def __init__(self, parent=None) -> None:
     super().__init__(parent)
     self.image = None
     self.range = None
+    self.volume = None
+    self.axis = 2
+    self.index = None
+    self.shown = None
+    self.pyramid = None
+    self.factor = 1
+    self.frame = 0
+    self.projection = None
+    self.slab = 0
+    self.compare = None
+    self.overlay = None
+    self.overlay_image = None
+    self.overlay_shown = None
+    self.color_table = None
+    self.direction = 0
+    self.frame_step = 0
+    self.cache = None
+    self.prefetcher = None
+    self.prefetch_count = 8
     self.bgcolor = "#7a7976"
     self.scale = 2
     self.ignore_changes = False
@@ -100,6 +197,7 @@ class ViewPanel(QWidget):
     self.main_label = ImageView(self)
     self.main_label.onWheelEvent.connect(self.on_wheel_event)
     self.main_label.pointChanged.connect(self.pointChanged)
+    self.main_label.levelsChanged.connect(self.levelsChanged)
     self.main_label.getView().setBackgroundColor('gray')
     
     b_layout = QHBoxLayout()
@@ -120,14 +218,198 @@ class ViewPanel(QWidget):
     self.main_layout.addLayout(b_layout)
     self.setLayout(self.main_layout)
 
-  def set_image(self, image, slices=1, index=1, rng=None):
-    self.ignore_changes = True
-    self.image = image
+  def set_cache(self, cache, prefetcher=None):
+    self.cache = cache
+    self.prefetcher = prefetcher
+
+  def set_volume(self, volume, axis, rng=None, levels=None):
+    self.volume = volume
+    self.axis = axis
+    self.range = rng
+    self.index = None
+    self.direction = 0
+    self.pyramid = None
+    self.factor = 1
+    self.frame = 0
+    self.frame_step = 0
+    self.projection = None
+    self.compare = None
+    span = None if rng is None else float(rng[1]) - float(rng[0])
+    self.main_label.set_levels(window_levels(rng if levels is None else levels), span)
+
+  def set_range(self, rng, levels=None):
+    # The slices are read again, e.g. once a volume finished loading
     self.range = rng
+    self.image = None
+    span = None if rng is None else float(rng[1]) - float(rng[0])
+    self.main_label.set_levels(window_levels(rng if levels is None else levels), span)
+
+  def clear(self):
+    if not self.prefetcher is None:
+      self.prefetcher.cancel(self)
+    self.volume = None
+    self.image = None
+    self.index = None
+    self.shown = None
+    self.overlay_image = None
+    self.overlay_shown = None
+    self.main_label.clear()
+    self.main_label.set_overlay(None)
+    self.main_label.has_image = False
+
+  def set_pyramid(self, pyramid):
+    self.pyramid = pyramid
+
+  def set_factor(self, factor):
+    # Switching between a pyramid level and the full resolution reloads the slice
+    if factor != 1 and (self.pyramid is None or not self.pyramid.ready(factor)):
+      factor = 1
+    if factor != self.factor:
+      self.factor = factor
+      self.image = None
+
+  def set_frame(self, frame):
+    # Frames of a 4D series, the step is used to prefetch during playback
+    if frame != self.frame:
+      self.frame_step = 1 if frame > self.frame else -1
+      self.frame = frame
+      self.image = None
+
+  def set_projection(self, projection, slab=0):
+    # A ready VolumeProjection replaces the slices, None shows the slices
+    if projection is not self.projection or slab != self.slab:
+      self.projection = projection
+      self.slab = slab
+      self.image = None
+
+  def set_compare(self, compare):
+    # A VolumeComparison replaces the slices, None shows the slices
+    if (not compare is None) and compare.volume is not self.volume:
+      compare = None
+    if compare is not self.compare:
+      self.compare = compare
+      self.image = None
+
+  def set_overlay(self, volume, color_table=None):
+    # Segmentation drawn over the slices, it has to be on the same grid
+    if (not volume is None) and (self.volume is None or volume.shape != self.volume.shape):
+      volume = None
+    if not color_table is None:
+      self.color_table = color_table
+    if volume is not self.overlay:
+      self.overlay = volume
+      self.overlay_image = None
+
+  def set_overlay_opacity(self, opacity):
+    self.main_label.set_overlay_opacity(opacity)
+
+  def set_levels(self, levels, span=None):
+    self.main_label.set_levels(window_levels(levels), span)
+
+  def set_slice(self, index):
+    self.update_overlay(index)
+    if index == self.index and (not self.image is None) and not self.loading():
+      return
+
+    slices = self.volume.shape[self.axis]
+    if (not self.index is None) and index != self.index:
+      self.direction = 1 if index > self.index else -1
+      self.frame_step = 0
+
+    self.ignore_changes = True
+    self.index = index
+    self.image = self.get_slice(index)
     self.scroll_bar.setMaximum(slices-1)
     self.scroll_bar.setValue(index)
     self.scroll_text.setText(f"{index + 1}/{slices}")
     self.ignore_changes = False
+    self.prefetch()
+
+  def slice_key(self, index, frame=None):
+    frame = self.frame if frame is None else frame
+    if not self.compare is None:
+      key = (self.volume.uid, self.axis, index) + self.compare.key()
+    elif not self.projection is None:
+      # Every index inside the same slab shares the projected image
+      p = self.projection
+      key = (self.volume.uid, self.axis, p.mode) + p.slab_range(index, self.slab)
+    elif self.factor != 1:
+      key = (self.volume.uid, self.axis, index // self.factor, self.factor)
+    else:
+      key = (self.volume.uid, self.axis, index)
+    if self.volume.frames > 1:
+      key += ("t", frame)
+    return key
+
+  def render_slice(self, volume, axis, index, pyramid=None, factor=1, frame=0, projection=None, slab=0, compare=None):
+    if not compare is None:
+      return self.create_image(compare.slice(axis, index, frame))
+    if not projection is None:
+      return self.create_image(projection.project(*projection.slab_range(index, slab)))
+    if factor != 1:
+      return self.create_image(pyramid.slice(axis, index, factor))
+    return self.create_image(volume.slice(axis, index, frame))
+
+  def slice_loader(self, index, frame=None):
+    volume, axis, pyramid, factor = self.volume, self.axis, self.pyramid, self.factor
+    frame = self.frame if frame is None else frame
+    projection, slab, compare = self.projection, self.slab, self.compare
+    return lambda: self.render_slice(volume, axis, index, pyramid, factor, frame, projection, slab, compare)
+
+  def overlay_key(self, index):
+    return (self.overlay.uid, self.axis, index, "labels", self.color_table.version)
+
+  def overlay_loader(self, index):
+    volume, axis, color_table = self.overlay, self.axis, self.color_table
+    return lambda: color_table.apply(volume.slice(axis, index))
+
+  def update_overlay(self, index):
+    # Colored label slices go through the same slice cache and prefetcher
+    if self.overlay is None or self.color_table is None or not self.overlay.labelled(self.axis, index):
+      self.overlay_image = None
+      return
+    if self.overlay.loading or self.cache is None:
+      self.overlay_image = self.overlay_loader(index)()
+    elif self.overlay_image is None or self.overlay_key(index) != self.overlay_shown:
+      self.overlay_image = self.cache.get(self.overlay_key(index), self.overlay_loader(index))
+
+  def loading(self):
+    return self.volume.loading or ((not self.compare is None) and self.compare.loading)
+
+  def get_slice(self, index):
+    # Slices of a volume still loading are not final and never cached
+    if self.cache is None or self.loading():
+      return self.slice_loader(index)()
+    return self.cache.get(self.slice_key(index), self.slice_loader(index))
+
+  def prefetch(self):
+    # Load the next slices in the scroll direction, or the same slice of the
+    # next frames while a 4D series is played, in the background
+    if self.prefetcher is None or self.loading():
+      return
+
+    jobs = []
+    if self.frame_step != 0:
+      # Projections are only built for the frame shown
+      frames = self.volume.frames if self.projection is None else 1
+      for k in range(1, min(self.prefetch_count, frames - 1) + 1):
+        frame = (self.frame + self.frame_step * k) % frames
+        jobs.append((self.slice_key(self.index, frame), self.slice_loader(self.index, frame)))
+      self.prefetcher.request(self, jobs)
+      return
+
+    if self.direction == 0:
+      return
+    slices = self.volume.shape[self.axis]
+    for k in range(1, self.prefetch_count + 1):
+      index = self.index + self.direction * k
+      if index < 0 or index >= slices:
+        break
+      jobs.append((self.slice_key(index), self.slice_loader(index)))
+      if (not self.overlay is None) and (not self.overlay.loading) and self.overlay.labelled(self.axis, index):
+        jobs.append((self.overlay_key(index), self.overlay_loader(index)))
+
+    self.prefetcher.request(self, jobs)
 
   def set_point(self, point):
     self.main_label.set_point(point)
@@ -139,18 +421,28 @@ class ViewPanel(QWidget):
     self.main_label.set_zoom(zoom)
 
   def update_ui(self, reset=False):
-    if not self.image is None:
-      img = self.image
-      self.main_label.set_image(self.create_image(img), reset=reset)
+    if self.image is None:
+      return
+
+    # Only the cursor moves when the slice shown is still the same
+    key = self.slice_key(self.index) if not self.volume is None else None
+    if reset or key is None or key != self.shown or self.loading():
+      self.main_label.set_image(self.image, reset=reset, factor=self.factor)
+      self.shown = key
+    else:
+      self.main_label.plot_current_point()
+
+    overlay_key = None
+    if not self.overlay_image is None:
+      overlay_key = self.overlay_key(self.index)
+    if reset or overlay_key != self.overlay_shown or (not self.overlay is None and self.overlay.loading):
+      self.main_label.set_overlay(self.overlay_image)
+      self.overlay_shown = overlay_key
   
   def on_slider_value_changed(self):
     if not self.ignore_changes:
       self.sliderValueChanged.emit(self.scroll_bar.value())
 
-  def resizeEvent(self, event):
-    super().resizeEvent(event)
-    self.update_ui()
-
   def wheelEvent(self, event) -> None:
     super().wheelEvent(event)
     notches = event.angleDelta().y() // 120
@@ -166,45 +458,31 @@ class ViewPanel(QWidget):
       if v >= 0 and v <= self.scroll_bar.maximum():
         self.scroll_bar.setValue(v)
 
-  def create_image(self, img_data, is_rgb=False):
-    if not is_rgb:  
-      img = np.zeros(img_data.shape + (3, ))
-      img[:, :, 0] = img_data
-      img[:, :, 1] = img_data
-      img[:, :, 2] = img_data
-      img_data = img
-
-    if not self.range is None:
-      mi, ma = self.range
-    else:
-      ma = img_data.max()
-      mi = img_data.min()
-
-    if ma - mi != 0:
-      img_data = ((img_data - mi) * 1.0) / (ma - mi)
-    elif ma != 0:
-      img_data = (img_data * 1.0) / ma
-
-    return img_data
+  def create_image(self, img_data):
+    # The slice keeps its dtype, pyqtgraph maps it through the levels and
+    # the gray lookup table so no RGB or float copy is made per redraw
+    return np.ascontiguousarray(img_data)
 
 class View3DPanel(QWidget):
   sliderValueChanged = pyqtSignal(int)
+  interacted = pyqtSignal()
   
   def __init__(self, parent=None) -> None:
     super().__init__(parent)
     self.image = None
+    self.image_changed = False
+    self.factor = 1
+    self.offset = (0, 0, 0)
     self.point = (0, 0, 0)
     self.shape = (0, 0, 0)
     self.bgcolor = "#7a7976"
     self.zoom = (1, 1, 1)
     self.scale = 1
-    self.colors = {
-      '0': [0, 0, 0, 0],
-      '1': [255, 0, 0, 255],
-      '2': [0, 255, 0, 255],
-      '3': [0, 0, 255, 255],
-    }
+    self.color_table = LabelColorTable()
     self.ignore_changes = False
+    self.mode = "volume"
+    self.meshes = None
+    self.mesh_items = {}
     self.view_item = None
     self.x_view_line = None
     self.y_view_line = None
@@ -216,16 +494,78 @@ class View3DPanel(QWidget):
     
     self.viewer = GLViewWidget(self)
     self.viewer.setCameraPosition(distance=1000)
+    self._viewer_press_event = self.viewer.mousePressEvent
+    self._viewer_wheel_event = self.viewer.wheelEvent
+    self.viewer.mousePressEvent = self._viewer_mouse_press
+    self.viewer.wheelEvent = self._viewer_wheel
 
     self.main_layout.addWidget(self.viewer)
     self.setLayout(self.main_layout)
 
-  def set_image(self, image):
+  def _viewer_mouse_press(self, event):
+    self.interacted.emit()
+    self._viewer_press_event(event)
+
+  def _viewer_wheel(self, event):
+    self.interacted.emit()
+    self._viewer_wheel_event(event)
+
+  def set_image(self, image, factor=1, shape=None, offset=None):
+    # A coarse pyramid level is drawn scaled by its factor, the cursor stays
+    # in full resolution voxels. A crop of the volume is moved to its offset
+    # (in voxels of the flipped image)
     self.ignore_changes = True
     self.image = np.flip(image, axis=2)
-    self.shape = image.shape
+    self.image_changed = True
+    self.factor = factor
+    self.offset = tuple(offset) if not offset is None else (0, 0, 0)
+    self.shape = tuple(shape) if not shape is None else image.shape
     self.ignore_changes = False
 
+  def set_color_table(self, color_table):
+    self.color_table = color_table
+
+  def set_mode(self, mode):
+    # "volume" draws the labels as a dense RGBA volume, "surface" as meshes
+    self.mode = mode
+    if mode == "surface" and not self.view_item is None:
+      # The dense volume is not kept around while surfaces are shown
+      self.viewer.removeItem(self.view_item)
+      self.view_item = None
+    for item in self.mesh_items.values():
+      item.setVisible(mode == "surface")
+    self.image_changed = True
+
+  def set_meshes(self, meshes, shape=None):
+    for item in self.mesh_items.values():
+      self.viewer.removeItem(item)
+    self.mesh_items = {}
+    self.meshes = meshes
+    if meshes is None:
+      return
+
+    # Meshes are in voxel corner coordinates of the display volume, the
+    # volume item shows it flipped along z so the meshes are flipped as well
+    depth = (shape if not shape is None else self.shape)[2]
+    for label in sorted(meshes):
+      verts, faces = meshes[label]
+      if len(faces) == 0:
+        continue
+      verts = np.array(verts, dtype=np.float32)
+      verts[:, 2] = depth - verts[:, 2]
+      md = MeshData(vertexes=verts, faces=np.ascontiguousarray(faces[:, ::-1]))
+      item = GLMeshItem(meshdata=md, smooth=False, shader='shaded', glOptions='opaque')
+      item.setVisible(self.mode == "surface")
+      self.viewer.addItem(item)
+      self.mesh_items[label] = item
+    self.update_mesh_colors()
+
+  def update_mesh_colors(self):
+    for label, item in self.mesh_items.items():
+      color = self.color_table.color(label)
+      item.setColor(tuple(c / 255.0 for c in color))
+      item.setGLOptions('opaque' if color[3] >= 255 else 'translucent')
+
   def set_point(self, point):
     self.point = point
 
@@ -237,16 +577,25 @@ class View3DPanel(QWidget):
     if not self.image is None:
       self.draw_cursor_lines()
 
+      if self.mode != "volume":
+        return
+
       if self.view_item is None:
         img = self.image
         img = self.create_image(img)
         self.view_item = GLVolumeItem(img, sliceDensity=self.scale, smooth=True, glOptions='translucent')
         self.viewer.addItem(self.view_item)
-      elif reset:
+      elif reset or self.image_changed:
         img = self.image
         img = self.create_image(img)
         self.view_item.setData(img)
 
+      if self.image_changed:
+        self.view_item.resetTransform()
+        self.view_item.scale(self.factor, self.factor, self.factor)
+        self.view_item.translate(*[o * self.factor for o in self.offset])
+        self.image_changed = False
+
   def draw_cursor_lines(self):
     zm = self.zoom
     pt = [p for p in self.point]
@@ -285,14 +634,7 @@ class View3DPanel(QWidget):
     super().wheelEvent(event)
 
   def create_image(self, img_data, is_rgb=False):
-    if not is_rgb: 
-      img = np.empty(img_data.shape + (4, ), dtype=np.ubyte)
-      for k in self.colors:
-        if k == '0':
-          continue
-        ind = np.where(img_data == int(k))
-        img[ind] = self.colors[k]
-      
-      img_data = img
+    if not is_rgb:
+      img_data = self.color_table.apply(img_data)
 
     return img_data
\ No newline at end of file
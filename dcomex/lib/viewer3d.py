@@ -1,14 +1,33 @@
-from datetime import datetime
-import numpy as np
-import nibabel as nb
+import os
 from PyQt5.QtWidgets import QWidget, QPushButton, QVBoxLayout, QDialog, QGridLayout
 from PyQt5.QtWidgets import QHBoxLayout, QLabel, QLineEdit, QComboBox, QCheckBox
-from PyQt5.QtWidgets import QMessageBox, QDateTimeEdit
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QMessageBox, QDateTimeEdit, QListWidget, QListWidgetItem, QColorDialog
+from PyQt5.QtWidgets import QProgressBar, QSlider, QSpinBox, QApplication
+from PyQt5.QtGui import QColor, QPixmap, QIcon
+from PyQt5.QtCore import Qt, QTimer, QThread
 from .viewer import ViewPanel, View3DPanel
+from .volume import volume_manager
+from .loader import VolumeLoader, MeshBuilder, ProjectionBuilder
+from .slicecache import SliceCache, SlicePrefetcher
+from .scheduler import RenderScheduler
+from .pyramid import VolumePyramid, cache_dir_for, needs_pyramid
+from .projection import VolumeProjection, MODES, PROJECTION_BUDGET
+from .compare import VolumeComparison, same_grid, MODES as COMPARE_MODES
+from .labels import LabelColorTable
 from .inputdialog import InputDialog
 from .misc import QHLine
 
+def reload_in_background(volume):
+  # Evicted volumes asked for on the GUI thread are read again by a shared
+  # loader instead of decompressing the whole file inline, other threads
+  # read them at once
+  app = QApplication.instance()
+  if app is None or QThread.currentThread() is not app.thread():
+    return False
+  volume.loading = True
+  VolumeLoader.shared(volume).start()
+  return True
+
 class Viewer3D(QWidget):
   def __init__(self, workspace, parent=None) -> None:
     super().__init__(parent)
@@ -20,7 +39,40 @@ class Viewer3D(QWidget):
     self.scale = 1
     self.workspace = workspace
     self.range = []
+    self.levels = []
     self.seg_image = None
+    self.color_table = LabelColorTable()
+    self.loaders = {}
+    self.reloads = set()
+    self.mesh_builder = None
+    self.meshes = {}
+    self.manager = volume_manager()
+    self.slice_cache = SliceCache()
+    self.prefetcher = SlicePrefetcher(self.slice_cache)
+    self.prefetcher.start()
+    self.destroyed.connect(self.prefetcher.stop)
+    self.scheduler = RenderScheduler(parent=self)
+    self.pyramids = {}
+    self.interacting = False
+    self.interacting_3d = False
+    self.interactive_size = 256
+    self.idle_timer = QTimer(self)
+    self.idle_timer.setSingleShot(True)
+    self.idle_timer.setInterval(200)
+    self.idle_timer.timeout.connect(self.on_idle)
+    self.frame = 0
+    self.play_timer = QTimer(self)
+    self.play_timer.setTimerType(Qt.PreciseTimer)
+    self.play_timer.timeout.connect(self.on_play_tick)
+    self.projection_mode = None
+    self.slab = 0
+    self.projections = SliceCache(PROJECTION_BUDGET)
+    self.projection_builders = {}
+    self.projection_failed = set()
+    self.compare_mode = None
+    self.compare_volume = None
+    self.comparison = None
+    self.compare_levels = None
     self.build_ui()
 
   def build_ui(self):
@@ -44,6 +96,9 @@ class Viewer3D(QWidget):
     self.side_layout.addWidget(btn_load_img)
     self.side_layout.addWidget(btn_load_seg)
 
+    self.loading_layout = QVBoxLayout()
+    self.side_layout.addLayout(self.loading_layout)
+
     i_info_title = QLabel('Information')
     self.side_layout.addWidget(i_info_title, alignment=Qt.AlignCenter)
     self.side_layout.addWidget(QHLine())
@@ -62,14 +117,312 @@ class Viewer3D(QWidget):
 
 
     self.side_layout.addLayout(info_layout)
+
+    self.time_panel = QWidget(self)
+    time_layout = QGridLayout()
+    time_layout.setContentsMargins(0, 0, 0, 0)
+    self.time_panel.setLayout(time_layout)
+    self.time_slider = QSlider(Qt.Horizontal, self)
+    self.time_slider.valueChanged.connect(self.on_frame_changed)
+    self.time_text = QLabel('1/1', self)
+    self.btn_play = QPushButton('Play', self)
+    self.btn_play.setCheckable(True)
+    self.btn_play.toggled.connect(self.on_play_toggled)
+    self.fps_box = QSpinBox(self)
+    self.fps_box.setRange(1, 60)
+    self.fps_box.setValue(10)
+    self.fps_box.setSuffix(' fps')
+    self.fps_box.valueChanged.connect(self.on_fps_changed)
+    time_layout.addWidget(QLabel('Time: ', self), 0, 0, alignment=Qt.AlignRight)
+    time_layout.addWidget(self.time_slider, 0, 1)
+    time_layout.addWidget(self.time_text, 0, 2)
+    time_layout.addWidget(self.btn_play, 1, 0, 1, 2)
+    time_layout.addWidget(self.fps_box, 1, 2)
+    self.time_panel.hide()
+    self.side_layout.addWidget(self.time_panel)
+
+    projection_layout = QGridLayout()
+    self.projection_combo = QComboBox(self)
+    self.projection_combo.addItem('Slice', None)
+    for mode, name in MODES.items():
+      self.projection_combo.addItem(name, mode)
+    self.projection_combo.currentIndexChanged.connect(self.on_projection_changed)
+    self.slab_box = QSpinBox(self)
+    self.slab_box.setRange(0, 9999)
+    self.slab_box.setSpecialValueText('Full')
+    self.slab_box.setSuffix(' slices')
+    self.slab_box.setToolTip('Thickness of the projected slab around the cursor')
+    self.slab_box.valueChanged.connect(self.on_slab_changed)
+    projection_layout.addWidget(QLabel('Projection: ', self), 0, 0, alignment=Qt.AlignRight)
+    projection_layout.addWidget(self.projection_combo, 0, 1)
+    projection_layout.addWidget(QLabel('Slab: ', self), 1, 0, alignment=Qt.AlignRight)
+    projection_layout.addWidget(self.slab_box, 1, 1)
+    self.side_layout.addLayout(projection_layout)
+    self.projection_status = QLabel('', self)
+    self.side_layout.addWidget(self.projection_status)
+
+    compare_layout = QGridLayout()
+    self.compare_combo = QComboBox(self)
+    self.compare_combo.addItem('Off', None)
+    for mode, name in COMPARE_MODES.items():
+      self.compare_combo.addItem(name, mode)
+    self.compare_combo.currentIndexChanged.connect(self.on_compare_changed)
+    self.compare_with_combo = QComboBox(self)
+    self.compare_with_combo.setToolTip('Reference image the shown image is compared with')
+    self.compare_with_combo.currentIndexChanged.connect(self.on_compare_changed)
+    compare_layout.addWidget(QLabel('Compare: ', self), 0, 0, alignment=Qt.AlignRight)
+    compare_layout.addWidget(self.compare_combo, 0, 1)
+    compare_layout.addWidget(QLabel('With: ', self), 1, 0, alignment=Qt.AlignRight)
+    compare_layout.addWidget(self.compare_with_combo, 1, 1)
+    self.side_layout.addLayout(compare_layout)
+    self.compare_status = QLabel('', self)
+    self.side_layout.addWidget(self.compare_status)
+
+    mode_layout = QHBoxLayout()
+    mode_layout.addWidget(QLabel('3D view: ', self))
+    self.mode_combo = QComboBox(self)
+    self.mode_combo.addItem('Volume', 'volume')
+    self.mode_combo.addItem('Surface', 'surface')
+    self.mode_combo.currentIndexChanged.connect(self.on_3d_mode_changed)
+    mode_layout.addWidget(self.mode_combo, stretch=1)
+    self.side_layout.addLayout(mode_layout)
+
+    overlay_layout = QHBoxLayout()
+    overlay_layout.addWidget(QLabel('Overlay: ', self))
+    self.overlay_slider = QSlider(Qt.Horizontal, self)
+    self.overlay_slider.setRange(0, 100)
+    self.overlay_slider.setValue(50)
+    self.overlay_slider.setToolTip('Opacity of the segmentation in the slice views')
+    self.overlay_slider.valueChanged.connect(self.on_overlay_opacity_changed)
+    overlay_layout.addWidget(self.overlay_slider, stretch=1)
+    self.side_layout.addLayout(overlay_layout)
+    self.mesh_status = QLabel('', self)
+    self.side_layout.addWidget(self.mesh_status)
+
+    l_title = QLabel('Labels')
+    self.side_layout.addWidget(l_title, alignment=Qt.AlignCenter)
+    self.side_layout.addWidget(QHLine())
+
+    self.label_list = QListWidget(self)
+    self.label_list.setToolTip('Double click a label to change its color')
+    self.label_list.itemDoubleClicked.connect(self.on_label_double_clicked)
+    self.side_layout.addWidget(self.label_list)
+
     self.side_layout.addStretch(1)
     self.side_panel.setLayout(self.side_layout)
     self.main_layout.addWidget(self.side_panel)
 
-  def update_side_panel(self):
+  def update_side_panel(self, reset=False):
     pt = self.point
     self.i_cord_value.setText(f"({pt[0]},{pt[1]},{pt[2]})")
-    self.i_intensity_value.setText(f"{self.images[self.image_index][pt[0], pt[1], pt[2]]}")
+    img = self.images[self.image_index]
+    self.i_intensity_value.setText(f"{img.value(pt, min(self.frame, img.frames - 1))}")
+
+  def update_time_panel(self):
+    # The time controls are only shown for 4D series
+    frames = self.images[self.image_index].frames if self.image_index >= 0 else 1
+    if frames <= 1:
+      self.btn_play.setChecked(False)
+      self.time_panel.hide()
+      return
+    self.time_slider.blockSignals(True)
+    self.time_slider.setMaximum(frames - 1)
+    self.frame = min(self.frame, frames - 1)
+    self.time_slider.setValue(self.frame)
+    self.time_slider.blockSignals(False)
+    self.time_text.setText(f"{self.frame + 1}/{frames}")
+    self.time_panel.show()
+
+  def on_frame_changed(self, value):
+    if self.image_index < 0:
+      return
+    self.frame = value
+    self.time_text.setText(f"{value + 1}/{self.images[self.image_index].frames}")
+    self.update_image_2d_points()
+
+  def on_play_toggled(self, checked):
+    # Frames are read ahead by the prefetcher, the timer keeps the rate
+    self.btn_play.setText('Pause' if checked else 'Play')
+    if checked:
+      self.play_timer.start(int(1000 / self.fps_box.value()))
+    else:
+      self.play_timer.stop()
+
+  def on_fps_changed(self, value):
+    if self.play_timer.isActive():
+      self.play_timer.setInterval(int(1000 / value))
+
+  def on_projection_changed(self):
+    self.projection_mode = self.projection_combo.currentData()
+    self.update_image_2d_points()
+
+  def on_slab_changed(self, value):
+    self.slab = value
+    self.update_image_2d_points()
+
+  def update_compare_panel(self):
+    # Every loaded image but the shown one can be the reference
+    current = self.compare_volume
+    self.compare_with_combo.blockSignals(True)
+    self.compare_with_combo.clear()
+    for k, volume in enumerate(self.images):
+      if k != self.image_index:
+        self.compare_with_combo.addItem(os.path.basename(volume.filename), volume.uid)
+    index = self.compare_with_combo.findData(current.uid) if not current is None else -1
+    self.compare_with_combo.setCurrentIndex(max(index, 0) if self.compare_with_combo.count() > 0 else -1)
+    self.compare_with_combo.blockSignals(False)
+    self.on_compare_changed()
+
+  def on_compare_changed(self):
+    self.compare_mode = self.compare_combo.currentData()
+    uid = self.compare_with_combo.currentData()
+    self.compare_volume = next((v for v in self.images if v.uid == uid), None)
+    self.update_image_2d_points()
+
+  def get_comparison(self, volume):
+    # Kept while the mode and both volumes stay the same, so the panels
+    # and the slice cache see the same comparison
+    other = self.compare_volume
+    if self.compare_mode is None or other is None or other is volume:
+      self.comparison = None
+      self.compare_status.setText('')
+      return None
+    if not same_grid(volume, other):
+      self.comparison = None
+      self.compare_status.setText('Images have different shapes' if other.shape != volume.shape else 'Images have different affines')
+      return None
+    c = self.comparison
+    if c is None or c.volume is not volume or c.other is not other or c.mode != self.compare_mode:
+      self.comparison = VolumeComparison(volume, other, self.compare_mode)
+      self.compare_levels = self.comparison.levels()
+    self.compare_status.setText('')
+    return self.comparison
+
+  def get_projection(self, volume, axis, frame=0):
+    # Projections are built once per volume, axis, mode and frame on the
+    # thread pool, the slices are shown until they are ready
+    if self.projection_mode is None or not volume.ready:
+      return None
+    key = (volume.uid, axis, self.projection_mode, frame)
+    projection = self.projections.get(key)
+    if projection is None and not key in self.projection_failed:
+      self.build_projection(key, VolumeProjection(volume, axis, self.projection_mode, frame))
+    return projection
+
+  def build_projection(self, key, projection):
+    if key in self.projection_builders:
+      return
+    builder = ProjectionBuilder(projection)
+    builder.signals.completed.connect(lambda result: self.on_projection_built(key, builder))
+    builder.signals.cancelled.connect(lambda: self.on_projection_failed(key, builder))
+    builder.signals.errored.connect(lambda error: self.on_projection_failed(key, builder, error))
+    self.projection_builders[key] = builder
+    self.projection_status.setText('Projecting...')
+    builder.start()
+
+  def on_projection_built(self, key, builder):
+    if not self.projection_builders.get(key) is builder:
+      return
+    self.projection_builders.pop(key)
+    self.projections.put(key, builder.projection)
+    if not self.projections.contains(key):
+      # Larger than the whole projection budget
+      self.projection_failed.add(key)
+    if len(self.projection_builders) == 0:
+      self.projection_status.setText('' if not key in self.projection_failed else 'Volume too large to project')
+    self.update_image_2d_points()
+
+  def on_projection_failed(self, key, builder, error=None):
+    if not self.projection_builders.get(key) is builder:
+      return
+    self.projection_builders.pop(key)
+    if not error is None:
+      self.projection_failed.add(key)
+      self.projection_status.setText('Projection failed')
+    elif len(self.projection_builders) == 0:
+      self.projection_status.setText('')
+
+  def on_play_tick(self):
+    if self.image_index < 0:
+      return
+    frames = self.images[self.image_index].frames
+    self.time_slider.setValue((self.frame + 1) % frames)
+
+  def update_label_list(self, labels):
+    self.label_list.clear()
+    for label in sorted(labels):
+      if label == 0:
+        continue
+      item = QListWidgetItem(f"Label {label} ({labels[label]} voxels)")
+      item.setData(Qt.UserRole, label)
+      item.setIcon(self.color_icon(self.color_table.color(label)))
+      self.label_list.addItem(item)
+
+  def color_icon(self, color):
+    pixmap = QPixmap(12, 12)
+    pixmap.fill(QColor(*color))
+    return QIcon(pixmap)
+
+  def on_label_double_clicked(self, item):
+    label = item.data(Qt.UserRole)
+    color = QColorDialog.getColor(QColor(*self.color_table.color(label)), self, f"Label {label}", QColorDialog.ShowAlphaChannel)
+    if color.isValid():
+      self.color_table.set_color(label, [color.red(), color.green(), color.blue(), color.alpha()])
+      item.setIcon(self.color_icon(self.color_table.color(label)))
+      self.bottom_left_panel.update_mesh_colors()
+      self.update_image_2d_points()
+      if self.bottom_left_panel.mode == "volume":
+        self.update_image_3d_points(reset=True)
+
+  def on_overlay_opacity_changed(self, value):
+    for panel, _ in self.panels_2d:
+      panel.set_overlay_opacity(value / 100.0)
+    self.update_image_2d_points()
+
+  def on_3d_mode_changed(self):
+    mode = self.mode_combo.currentData()
+    self.bottom_left_panel.set_mode(mode)
+    if mode == "surface":
+      self.build_meshes()
+    self.update_image_3d_points(reset=True)
+
+  def build_meshes(self):
+    # Surfaces are extracted once per segmentation, off the GUI thread
+    seg = self.seg_image
+    if seg is None or not seg.ready:
+      return
+    if seg.uid in self.meshes:
+      if self.bottom_left_panel.meshes is not self.meshes[seg.uid]:
+        self.bottom_left_panel.set_meshes(self.meshes[seg.uid], seg.shape)
+      return
+    if (not self.mesh_builder is None) and self.mesh_builder.volume is seg:
+      return
+
+    if not self.mesh_builder is None:
+      self.mesh_builder.cancel()
+    builder = MeshBuilder(seg)
+    builder.signals.completed.connect(lambda meshes: self.on_meshes_built(builder, meshes))
+    builder.signals.cancelled.connect(lambda: self.on_meshes_failed(builder))
+    builder.signals.errored.connect(lambda error: self.on_meshes_failed(builder, error))
+    self.mesh_builder = builder
+    self.mesh_status.setText('Building surfaces...')
+    builder.start()
+
+  def on_meshes_built(self, builder, meshes):
+    if builder is self.mesh_builder:
+      self.mesh_builder = None
+      self.mesh_status.setText('')
+    self.meshes[builder.volume.uid] = meshes
+    if builder.volume is self.seg_image:
+      self.bottom_left_panel.set_meshes(meshes, builder.volume.shape)
+      triangles = sum(len(f) for _, f in meshes.values())
+      self.mesh_status.setText(f"{len(meshes)} surface(s), {triangles} triangles")
+      self.update_image_3d_points()
+
+  def on_meshes_failed(self, builder, error=None):
+    if builder is self.mesh_builder:
+      self.mesh_builder = None
+      self.mesh_status.setText('' if error is None else 'Surface extraction failed')
 
   def on_load_raw_image(self):
     dialog = InputDialog(self.workspace, {"raw_input": {"type": "image", "subtype": "nifti", "display": "Select data"}}, False, self)
@@ -77,8 +430,7 @@ class Viewer3D(QWidget):
       data = dialog.get_last_input_data()
       if "raw_input" in data:
         filename = data.get("raw_input")
-        self.load_image(filename)
-        self.update_image_2d_points(reset=True)
+        self.load_image_async(filename)
 
   def on_load_seg_image(self):
     dialog = InputDialog(self.workspace, {"raw_input": {"type": "image", "subtype": "nifti", "display": "Select data"}}, False, self)
@@ -86,8 +438,7 @@ class Viewer3D(QWidget):
       data = dialog.get_last_input_data()
       if "raw_input" in data:
         filename = data.get("raw_input")
-        self.load_image(filename, is_seg=True)
-        self.update_image_3d_points(reset=True)
+        self.load_image_async(filename, is_seg=True)
 
   def build_viewer(self):
     self.viewer_panel = QWidget(self)
@@ -98,12 +449,23 @@ class Viewer3D(QWidget):
     self.top_left_panel = ViewPanel(self)
     self.top_right_panel = ViewPanel(self)
     self.bottom_left_panel = View3DPanel(self)
+    self.bottom_left_panel.set_color_table(self.color_table)
     self.bottom_right_panel = ViewPanel(self)
 
+    self.panels_2d = ((self.top_left_panel, 2), (self.bottom_right_panel, 1), (self.top_right_panel, 0))
+    for panel, _ in self.panels_2d:
+      panel.set_cache(self.slice_cache, self.prefetcher)
+
     self.top_left_panel.sliderValueChanged.connect(self.on_slider_value_changed(2))
     self.bottom_right_panel.sliderValueChanged.connect(self.on_slider_value_changed(1))
     self.top_right_panel.sliderValueChanged.connect(self.on_slider_value_changed(0))
 
+    self.top_left_panel.levelsChanged.connect(self.on_levels_changed)
+    self.bottom_right_panel.levelsChanged.connect(self.on_levels_changed)
+    self.top_right_panel.levelsChanged.connect(self.on_levels_changed)
+
+    self.bottom_left_panel.interacted.connect(self.on_3d_interaction)
+
     self.top_left_panel.pointChanged.connect(self.on_point_changed(2))
     self.bottom_right_panel.pointChanged.connect(self.on_point_changed(1))
     self.top_right_panel.pointChanged.connect(self.on_point_changed(0))
@@ -119,8 +481,34 @@ class Viewer3D(QWidget):
 
     self.main_layout.addWidget(self.viewer_panel, stretch=1)
 
+  def start_interaction(self):
+    # Panels show a coarse pyramid level until nothing changed for a while
+    self.interacting = True
+    self.idle_timer.start()
+
+  def on_idle(self):
+    self.interacting = False
+    self.interacting_3d = False
+    self.update_image_2d_points()
+    self.update_image_3d_points()
+
+  def on_3d_interaction(self):
+    # Rotating the 3D view swaps its volume to a coarse level, moving the
+    # cursor does not need to upload it again
+    self.interacting_3d = True
+    self.start_interaction()
+    self.update_image_3d_points()
+
+  def display_factor(self, volume, interacting=None):
+    pyramid = self.pyramids.get(volume.uid)
+    interacting = self.interacting if interacting is None else interacting
+    if (not interacting) or pyramid is None:
+      return 1
+    return pyramid.interactive_factor(self.interactive_size)
+
   def on_slider_value_changed(self, index):
     def handler(value):
+      self.start_interaction()
       self.point[index] = value
       self.update_image_2d_points()
       self.update_image_3d_points()
@@ -129,6 +517,7 @@ class Viewer3D(QWidget):
 
   def on_point_changed(self, index):
     def handler(value):
+      self.start_interaction()
       pt = [int(p) for p in value]
       pt.insert(index, self.point[index])
       self.point = pt
@@ -137,56 +526,362 @@ class Viewer3D(QWidget):
 
     return handler
 
+  def on_levels_changed(self, levels):
+    if self.image_index < 0:
+      return
+    if not self.comparison is None:
+      self.compare_levels = levels
+    else:
+      self.levels[self.image_index] = levels
+    for panel in (self.top_left_panel, self.top_right_panel, self.bottom_right_panel):
+      panel.set_levels(levels)
+
+  def build_pyramid(self, volume):
+    # Built in the background, panels keep using the full resolution until
+    # a level is ready
+    if not needs_pyramid(volume):
+      return
+    pyramid = getattr(volume, "pyramid", None)
+    if pyramid is None:
+      pyramid = VolumePyramid(volume, cache_dir_for(getattr(self.workspace, "last_filename", None)))
+      volume.pyramid = pyramid
+      pyramid.start()
+    self.pyramids[volume.uid] = pyramid
+
   def load_image(self, filename, is_seg=False):
-    img = nb.load(filename)
-    img = nb.as_closest_canonical(img)
-    hdr = img.header
-    zooms = hdr.get_zooms()
-    data = img.get_fdata()
-    
-    data = np.flip(data)
-
-    if not is_seg:
-      self.range.append([data.min(), data.max()])
-      self.images.append(data)
-      self.zooms.append(zooms)
+    volume = self.manager.acquire(filename, is_seg=is_seg)
+    if not volume.ready:
+      volume.load()
+      volume.complete()
+    self.add_volume(volume, volume.range)
+    self.complete_volume(volume, volume.range, volume.labels)
+
+  def load_image_async(self, filename, is_seg=False):
+    # Files already opened in another tab are shared through the volume
+    # manager, others are read on the thread pool: images are shown as soon
+    # as the first chunk is in and refreshed while the rest comes in
+    volume = self.manager.acquire(filename, is_seg=is_seg)
+    if volume.ready:
+      self.add_volume(volume, volume.range)
+      self.complete_volume(volume, volume.range, volume.labels)
+      if not is_seg:
+        self.update_image_2d_points(reset=True)
+      return None
+
+    loader = VolumeLoader.shared(volume)
+    loader.signals.opened.connect(lambda: self.on_volume_opened(loader))
+    loader.signals.progress.connect(lambda value: self.on_volume_progress(loader, value))
+    loader.signals.completed.connect(lambda rng: self.on_volume_completed(loader, rng))
+    loader.signals.cancelled.connect(lambda: self.on_volume_failed(loader))
+    loader.signals.errored.connect(lambda error: self.on_volume_failed(loader, error))
+    loader.subscribe()
+    self.add_loading_row(loader)
+    if loader.is_opened:
+      self.on_volume_opened(loader)
+    loader.start()
+    return loader
+
+  def add_loading_row(self, loader):
+    row = QWidget(self)
+    layout = QHBoxLayout()
+    layout.setContentsMargins(0, 0, 0, 0)
+    row.setLayout(layout)
+
+    name = os.path.basename(loader.volume.filename)
+    label = QLabel(name, row)
+    label.setToolTip(loader.volume.filename)
+    label.setMaximumWidth(70)
+    bar = QProgressBar(row)
+    bar.setRange(0, 100)
+    btn_cancel = QPushButton('x', row)
+    btn_cancel.setMaximumWidth(24)
+    btn_cancel.setToolTip(f"Cancel loading {name}")
+    btn_cancel.clicked.connect(lambda: self.cancel_loading(loader))
+
+    layout.addWidget(label)
+    layout.addWidget(bar, stretch=1)
+    layout.addWidget(btn_cancel)
+    self.loading_layout.addWidget(row)
+    self.loaders[loader] = (row, bar)
+
+  def remove_loading_row(self, loader):
+    row, _ = self.loaders.pop(loader, (None, None))
+    if not row is None:
+      self.loading_layout.removeWidget(row)
+      row.deleteLater()
+
+  def detach_loader(self, loader):
+    if loader in self.loaders:
+      self.remove_loading_row(loader)
+      loader.unsubscribe()
+
+  def cancel_loading(self, loader):
+    # Other tabs waiting for the same shared loader keep loading
+    if not loader in self.loaders:
+      return
+    self.detach_loader(loader)
+    self.remove_volume(loader.volume)
+
+  def on_volume_opened(self, loader):
+    volume = loader.volume
+    if not loader in self.loaders:
+      return
+    if not volume.is_seg and not loader.is_cancelled and not volume in self.images:
+      # Statistics cached from an earlier visit give the final window at once
+      rng = volume.range if not volume.range is None else volume.loaded_range()
+      self.add_volume(volume, rng)
+      self.update_image_2d_points(reset=True)
+
+  def on_volume_progress(self, loader, value):
+    if loader in self.loaders:
+      self.loaders[loader][1].setValue(value)
+    volume = loader.volume
+    if volume.loading and volume in self.images and self.images[self.image_index] is volume:
+      self.update_image_2d_points()
+
+  def on_volume_completed(self, loader, rng):
+    if not loader in self.loaders:
+      return
+    self.remove_loading_row(loader)
+    volume = loader.volume
+    if volume.is_seg:
+      self.add_volume(volume, rng)
+    elif not volume in self.images:
+      self.add_volume(volume, rng)
+      self.update_image_2d_points(reset=True)
+    self.complete_volume(volume, rng, volume.labels)
+
+  def on_volume_failed(self, loader, error=None):
+    if not loader in self.loaders:
+      return
+    self.remove_loading_row(loader)
+    self.remove_volume(loader.volume)
+    if not error is None:
+      QMessageBox.critical(self, "Error", f"Unable to load {loader.volume.filename}:\n{error}")
+
+  def add_volume(self, volume, rng):
+    volume.on_evicted = reload_in_background
+    if not volume.is_seg:
+      self.range.append(rng)
+      self.levels.append(volume.window if not volume.window is None else rng)
+      self.images.append(volume)
+      self.zooms.append(volume.zooms)
       self.point = [0, 0, 0]
-      self.image_index += 1
+      self.image_index = len(self.images) - 1
+      self.update_time_panel()
+      self.update_compare_panel()
     else:
-      self.seg_image = data
+      if (not self.seg_image is None) and not self.seg_image is volume:
+        self.release_volume(self.seg_image)
+        self.bottom_left_panel.set_meshes(None)
+      self.seg_image = volume
+
+  def complete_volume(self, volume, rng, labels=None):
+    self.build_pyramid(volume)
+    self.manager.enforce()
+    if volume.is_seg:
+      self.update_label_list(labels if not labels is None else {})
+      if self.bottom_left_panel.mode == "surface":
+        self.build_meshes()
+      self.update_image_2d_points()
+      self.update_image_3d_points(reset=True)
+      return
+
+    # The range known while loading was partial, levels the user did not
+    # change follow the robust window of the full data
+    index = self.images.index(volume)
+    if self.levels[index] is self.range[index] or self.levels[index] is volume.window:
+      self.levels[index] = volume.window if not volume.window is None else rng
+    self.range[index] = rng
+    for panel, _ in self.panels_2d:
+      if panel.volume is volume:
+        panel.set_range(rng, self.levels[index])
+    if index == self.image_index:
+      self.update_image_2d_points()
+
+  def watch_reload(self, volume):
+    # Panels showing an evicted volume are redrawn while it is read again
+    if volume is None:
+      return
+    if volume.evicted and volume.data is None:
+      reload_in_background(volume)
+    loader = VolumeLoader.active(volume)
+    if loader is None or loader in self.loaders or loader in self.reloads:
+      return
+    self.reloads.add(loader)
+    loader.signals.progress.connect(lambda value: self.on_volume_reload_progress(loader))
+    loader.signals.completed.connect(lambda rng: self.on_volume_reloaded(loader))
+    loader.signals.cancelled.connect(lambda: self.on_volume_reloaded(loader))
+    loader.signals.errored.connect(lambda error: self.on_volume_reloaded(loader, error))
+    # Replays the result when the load is already done
+    loader.start()
+
+  def on_volume_reload_progress(self, loader):
+    if loader in self.reloads and loader.volume.loading:
+      self.update_image_2d_points()
+
+  def on_volume_reloaded(self, loader, error=None):
+    if not loader in self.reloads:
+      return
+    self.reloads.discard(loader)
+    volume = loader.volume
+    volume.loading = False
+    if not error is None:
+      QMessageBox.critical(self, "Error", f"Unable to load {volume.filename}:\n{error}")
+      return
+    self.manager.touch(volume)
+    self.manager.enforce()
+    self.update_image_2d_points()
+    if volume is self.seg_image:
+      self.update_image_3d_points(reset=True)
+
+  def release_volume(self, volume):
+    # Pyramids and loads are shared with other tabs, they are only stopped
+    # once no tab uses the volume anymore
+    self.slice_cache.remove(volume.uid)
+    # Comparisons against the volume are cached under the shown volume
+    self.slice_cache.remove_if(lambda key: len(key) > 4 and key[3] in COMPARE_MODES and key[4] == volume.uid)
+    if (not self.comparison is None) and volume in (self.comparison.volume, self.comparison.other):
+      self.comparison = None
+    self.projections.remove(volume.uid)
+    for key in [k for k in self.projection_builders if k[0] == volume.uid]:
+      self.projection_builders.pop(key).cancel()
+    self.pyramids.pop(volume.uid, None)
+    self.meshes.pop(volume.uid, None)
+    if (not self.mesh_builder is None) and self.mesh_builder.volume is volume:
+      self.mesh_builder.cancel()
+      self.mesh_builder = None
+    if self.manager.release(volume) == 0:
+      pyramid = getattr(volume, "pyramid", None)
+      if not pyramid is None:
+        pyramid.cancel()
+        volume.pyramid = None
+      loader = VolumeLoader.active(volume)
+      if not loader is None:
+        loader.cancel()
+
+  def release_volumes(self):
+    # Called when the viewer tab is closed
+    volumes = list(self.images)
+    if not self.seg_image is None:
+      volumes.append(self.seg_image)
+    for loader in list(self.loaders):
+      self.detach_loader(loader)
+      if not loader.volume in volumes:
+        volumes.append(loader.volume)
+
+    for volume in volumes:
+      self.release_volume(volume)
+
+    self.images, self.range, self.levels, self.zooms = [], [], [], []
+    self.comparison, self.compare_volume = None, None
+    self.seg_image = None
+    self.image_index = -1
+    self.play_timer.stop()
+    self.prefetcher.stop()
+    self.slice_cache.clear()
+
+  def remove_volume(self, volume):
+    self.release_volume(volume)
+
+    if volume is self.seg_image:
+      self.seg_image = None
+    if not volume in self.images:
+      self.update_image_2d_points()
+      return
+
+    index = self.images.index(volume)
+    for items in (self.images, self.range, self.levels, self.zooms):
+      items.pop(index)
+    self.image_index = len(self.images) - 1
+    self.update_time_panel()
+    self.update_compare_panel()
+    if self.image_index >= 0:
+      self.update_image_2d_points(reset=True)
+    else:
+      for panel, _ in self.panels_2d:
+        panel.clear()
 
   def update_image_2d_points(self, reset=False):
-    index, point = (self.image_index, self.point)
-    img = self.images[index]
-    rng = self.range[index]
-    zoom = self.zooms[index]
-    sh = img.shape
-
-    # Prepare and show tl
-    self.top_left_panel.set_image(img[:, :, point[2]], sh[2], point[2], rng)
-    self.bottom_right_panel.set_image(img[:, point[1], :], sh[1], point[1], rng)
-    self.top_right_panel.set_image(img[point[0], :, :], sh[0], point[0], rng)
-    
-    # Set cursor point
-    self.top_left_panel.set_point([point[0], point[1]])
-    self.bottom_right_panel.set_point([point[0], point[2]])
-    self.top_right_panel.set_point([point[1], point[2]])
-
-    self.top_left_panel.set_zoom([zoom[0], zoom[1]])
-    self.bottom_right_panel.set_zoom([zoom[0], zoom[2]])
-    self.top_right_panel.set_zoom([zoom[1], zoom[2]])
-
-    self.top_left_panel.update_ui(reset=reset)
-    self.top_right_panel.update_ui(reset=reset)
-    self.bottom_right_panel.update_ui(reset=reset)
-    self.update_side_panel()
+    # Panels are only marked dirty here, bursts of point changes end up in
+    # a single redraw per panel on the next frame
+    if self.image_index < 0:
+      return
+    for panel, axis in self.panels_2d:
+      self.scheduler.mark_dirty(panel, self.render_panel(panel, axis), reset)
+    self.scheduler.mark_dirty(self.side_panel, self.update_side_panel)
+
+  def render_panel(self, panel, axis):
+    def handler(reset):
+      if self.image_index < 0:
+        return
+      index, point = (self.image_index, self.point)
+      img = self.images[index]
+      zoom = self.zooms[index]
+      self.manager.touch(img)
+      self.watch_reload(img)
+      self.watch_reload(self.seg_image)
+      if not self.compare_mode is None:
+        self.watch_reload(self.compare_volume)
+
+      if reset or panel.volume is not img:
+        panel.set_volume(img, axis, self.range[index], self.levels[index])
+        panel.set_pyramid(self.pyramids.get(img.uid))
+      # Pyramids are built for the first frame only
+      frame = min(self.frame, img.frames - 1)
+      # A comparison replaces the projections and pyramid levels
+      compare = self.get_comparison(img)
+      projection = self.get_projection(img, axis, frame) if compare is None else None
+      panel.set_frame(frame)
+      panel.set_projection(projection, self.slab)
+      if compare is not panel.compare:
+        panel.set_compare(compare)
+        levels = self.levels[index] if compare is None else self.compare_levels
+        rng = self.range[index] if compare is None else levels
+        panel.set_levels(levels, None if rng is None else float(rng[1]) - float(rng[0]))
+      # Nothing is sliced from the segmentation while it is fully transparent
+      overlay = self.seg_image if self.overlay_slider.value() > 0 else None
+      panel.set_overlay(overlay, self.color_table)
+      panel.set_factor(self.display_factor(img) if frame == 0 and projection is None and compare is None else 1)
+      panel.set_slice(point[axis])
+      panel.set_point([p for k, p in enumerate(point) if k != axis])
+      panel.set_zoom([z for k, z in enumerate(zoom) if k != axis])
+      panel.update_ui(reset=reset)
+
+    return handler
+
+  def label_crop(self, seg, data, factor=1):
+    # Only the bounding box of the labels is colored and uploaded, the
+    # offset is along the flipped z axis of the 3D panel
+    bbox = seg.bbox
+    if bbox is None or any(lo >= hi for lo, hi in bbox):
+      return data, None
+    lo = [b[0] // factor for b in bbox]
+    hi = [min(-(-b[1] // factor), s) for b, s in zip(bbox, data.shape)]
+    crop = data[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]
+    return crop, (lo[0], lo[1], data.shape[2] - hi[2])
 
   def update_image_3d_points(self, reset=False):
+    if not self.seg_image is None and self.image_index >= 0:
+      self.scheduler.mark_dirty(self.bottom_left_panel, self.render_3d_panel, reset)
+
+  def render_3d_panel(self, reset=False):
+    if self.seg_image is None or self.image_index < 0:
+      return
     index, point = (self.image_index, self.point)
     zoom = self.zooms[index]
-    
-    if not self.seg_image is None:
-      self.bottom_left_panel.set_image(self.seg_image)
-      self.bottom_left_panel.set_point(point)
-      self.bottom_left_panel.set_zoom(zoom)
-      self.bottom_left_panel.update_ui(reset=reset)
\ No newline at end of file
+
+    seg = self.seg_image
+    self.watch_reload(seg)
+    panel = self.bottom_left_panel
+    factor = self.display_factor(seg, self.interacting_3d and panel.mode == "volume")
+    if reset or panel.image is None or factor != panel.factor:
+      if factor != 1:
+        data = seg.scale(self.pyramids[seg.uid].level(factor))
+      else:
+        data = seg.get_data()
+      data, offset = self.label_crop(seg, data, factor)
+      panel.set_image(data, factor, seg.shape, offset)
+    self.bottom_left_panel.set_point(point)
+    self.bottom_left_panel.set_zoom(zoom)
+    self.bottom_left_panel.update_ui(reset=reset)
\ No newline at end of file
@@ -0,0 +1,417 @@
+import itertools, os, threading
+from collections import OrderedDict
+import numpy as np
+import nibabel as nb
+from .fingerprint import stat_key
+from .labels import label_counts, compact_labels
+from .stats import cached_stats, volume_stats
+from .slicecache import SliceCache
+
+_volume_ids = itertools.count(1)
+
+READ_CHUNK_SIZE = 4 << 20
+BUDGET_ENV = "DCOMEX_VOLUME_BUDGET"
+DEFAULT_BUDGET = 4 << 30
+FRAME_BUDGET_ENV = "DCOMEX_FRAME_BUDGET"
+DEFAULT_FRAME_BUDGET = 512 << 20
+
+def is_compressed(filename):
+  ext = os.path.splitext(filename)[1].lower()
+  return ext in nb.openers.ImageOpener.compress_ext_map
+
+class Volume:
+  def __init__(self, filename, is_seg=False, load=True) -> None:
+    # uid identifies the volume in slice caches, ids are never reused
+    self.uid = next(_volume_ids)
+    self.filename = filename
+    self.is_seg = is_seg
+    self.loading = False
+    self.loaded = 0
+    self.total = 0
+    self.ready = False
+    self.range = None
+    self.window = None
+    self.stats = None
+    self.labels = None
+    # Bounding box of the labels of a segmentation in display axes
+    self.bbox = None
+    self.affine = None
+    self.raw = None
+    self.data = None
+    self.on_reload = None
+    # Evicted volumes are read again inline, unless on_evicted(volume) takes
+    # over and returns True (the viewer reads them in the background)
+    self.evicted = False
+    self.on_evicted = None
+    self._load_lock = threading.Lock()
+    if load:
+      self.load()
+
+  def load(self, progress=None, cancelled=None, opened=None):
+    # progress(loaded, total) and opened() are called from the loading thread,
+    # cancelled() is polled between chunks, returns False when cancelled
+    if self.stats is None:
+      self.set_stats(cached_stats(self.filename, self.is_seg))
+
+    img = nb.load(self.filename, mmap=True)
+    dataobj = img.dataobj
+    stream = False
+
+    # Uncompressed files stay memory-mapped in their on-disk dtype, the
+    # scaling is only applied to the slices that are actually shown
+    if hasattr(dataobj, "get_unscaled"):
+      self.slope = float(dataobj.slope)
+      self.inter = float(dataobj.inter)
+      if is_compressed(self.filename):
+        # Compressed files are decompressed chunk by chunk into a zeroed
+        # buffer, the slices that are already read can be shown meanwhile
+        raw = np.zeros(dataobj.shape, dtype=dataobj.dtype, order=dataobj.order)
+        stream = True
+      else:
+        raw = dataobj.get_unscaled()
+    else:
+      raw = np.asanyarray(dataobj)
+      self.slope, self.inter = 1.0, 0.0
+
+    self.set_raw(img, raw)
+    if not stream:
+      self.loading = False
+      self.loaded = self.total = raw.nbytes
+      if not opened is None:
+        opened()
+      return (not self.is_seg) or self.compact(img, cancelled)
+
+    self.loading = True
+    try:
+      if not self._stream(dataobj, raw, progress, cancelled, opened):
+        return False
+      return (not self.is_seg) or self.compact(img, cancelled)
+    finally:
+      self.loading = False
+
+  def _stream(self, dataobj, raw, progress, cancelled, opened):
+    flat = raw.reshape(-1, order=dataobj.order).view(np.uint8)
+    self.total = flat.size
+    self.loaded = 0
+    with nb.openers.ImageOpener(dataobj.file_like) as f:
+      f.seek(dataobj.offset)
+      while self.loaded < self.total:
+        if (not cancelled is None) and cancelled():
+          return False
+        n = f.readinto(flat[self.loaded:self.loaded + READ_CHUNK_SIZE])
+        if not n:
+          raise IOError(f"Unexpected end of file in {self.filename}")
+        first = self.loaded == 0
+        self.loaded += n
+        if first and (not opened is None):
+          opened()
+        if not progress is None:
+          progress(self.loaded, self.total)
+    return True
+
+  def loaded_range(self):
+    # Range of the data read so far, used until the full range is known
+    raw = self.raw
+    if self.loading:
+      count = self.loaded // raw.dtype.itemsize
+      data = raw.reshape(-1, order="F" if raw.flags.f_contiguous else "C")[:count]
+    else:
+      data = raw[(slice(None), slice(None), raw.shape[2] // 2) + (0,) * (raw.ndim - 3)]
+    if data.size == 0:
+      return [0, 0]
+    mi, ma = self.scale(np.nanmin(data)), self.scale(np.nanmax(data))
+    return [min(mi, ma), max(mi, ma)]
+
+  def set_raw(self, img, raw):
+    self.raw = raw
+    self.ndim = raw.ndim
+    self.affine = np.array(img.affine, dtype=float)
+    axes, flips = display_orientation(img.affine)
+    self.axes = axes
+    self.flips = flips
+
+    # The display array is a strided view of the raw array: the axes are
+    # permuted to the closest canonical (RAS) order and every axis is flipped
+    # like the viewer always did (np.flip of the canonical data)
+    view = raw.transpose(axes + list(range(3, raw.ndim)))
+    view = view[tuple(slice(None, None, -1) if f else slice(None) for f in flips)]
+    self.data = view
+    self.evicted = False
+
+    zooms = img.header.get_zooms()
+    self.shape = tuple(view.shape[:3])
+    self.data_shape = view.shape
+    self.frames = view.shape[3] if view.ndim > 3 else 1
+    self.zooms = tuple(float(zooms[a]) for a in axes)
+    self.dtype = raw.dtype
+
+  def compact(self, img, cancelled=None):
+    # Segmentations are held in the smallest unsigned dtype that fits their
+    # labels, the views skip everything outside the labelled bounding box
+    labels, bbox = compact_labels(self.raw, self.scale if self.is_scaled() else None, cancelled=cancelled)
+    if (not cancelled is None) and cancelled():
+      return False
+    if not labels is None:
+      self.slope, self.inter = 1.0, 0.0
+      self.set_raw(img, labels)
+      self.loaded = self.total = labels.nbytes
+    if bbox is None:
+      self.bbox = [(0, 0)] * 3
+      return True
+    # Same permutation and flips as the display view
+    self.bbox = []
+    for d, a in enumerate(self.axes):
+      lo, hi = bbox[a]
+      n = self.raw.shape[a]
+      self.bbox.append((n - hi, n - lo) if self.flips[d] else (lo, hi))
+    return True
+
+  def labelled(self, axis, index):
+    # False for slices without any label, True when it is not known
+    if self.bbox is None:
+      return True
+    lo, hi = self.bbox[axis]
+    return lo <= index < hi
+
+  def set_stats(self, stats):
+    # The display window skips outliers, the range is kept for the levels
+    if stats is None:
+      return
+    self.stats = stats
+    self.range = stats.range()
+    self.window = stats.window()
+
+  def complete(self):
+    # Statistics and label counts need a pass over the data, done once
+    if self.stats is None:
+      self.set_stats(volume_stats(self))
+    if self.is_seg:
+      self.labels = label_counts(self.get_data())
+    self.ready = True
+
+  def resident_size(self):
+    # Memory-mapped files are backed by the page cache, only decompressed
+    # buffers count against the memory budget
+    raw = self.raw
+    if raw is None or isinstance(raw, np.memmap):
+      return 0
+    return raw.nbytes
+
+  def unload(self):
+    with self._load_lock:
+      if self.loading or not self.ready:
+        return False
+      self.raw = None
+      self.data = None
+      self.evicted = True
+      frame_cache().remove(self.uid)
+      return True
+
+  def reload(self):
+    with self._load_lock:
+      data = self.data
+      if data is None:
+        self.load()
+        data = self.data
+    if not self.on_reload is None:
+      self.on_reload(self)
+    return data
+
+  def is_scaled(self):
+    return self.slope != 1.0 or self.inter != 0.0
+
+  def scale(self, data):
+    if not self.is_scaled():
+      return data
+    return np.asarray(data, dtype=np.float32) * self.slope + self.inter
+
+  def resident(self):
+    # Evicted volumes are read again the first time they are needed, zeros
+    # of the same shape stand in while on_evicted reads them in the background
+    data = self.data
+    if data is None:
+      if self.evicted and (not self.on_evicted is None) and self.on_evicted(self):
+        return np.zeros(self.data_shape, dtype=self.dtype)
+      data = self.reload()
+    return data
+
+  def _volume(self):
+    data = self.resident()
+    if self.ndim > 3:
+      return data[(Ellipsis,) + (0,) * (self.ndim - 3)]
+    return data
+
+  def frame_view(self, frame):
+    data = self.resident()
+    if self.ndim == 3:
+      return data
+    return data[(slice(None),) * 3 + (frame,) + (0,) * (self.ndim - 4)]
+
+  def frame(self, frame=0):
+    # Frames of 4D series are read on demand from the memory-mapped file and
+    # kept in a shared LRU cache, 3D volumes are used as they are
+    if self.frames == 1:
+      return self._volume()
+    if self.loading or self.data is None:
+      return self.frame_view(frame)
+    return frame_cache().get((self.uid, frame), lambda: np.array(self.frame_view(frame)))
+
+  def slice(self, axis, index, frame=0):
+    vol = self.frame(frame)
+    if axis == 0:
+      data = vol[index, :, :]
+    elif axis == 1:
+      data = vol[:, index, :]
+    else:
+      data = vol[:, :, index]
+    return self.scale(data)
+
+  def value(self, point, frame=0):
+    vol = self.frame_view(frame)
+    return self.scale(vol[point[0], point[1], point[2]])
+
+  def get_data(self):
+    return self.scale(self._volume())
+
+  def data_range(self, step=16):
+    # Slabs along the last raw axis are contiguous in NIfTI files, so the
+    # range is found without holding more than a slab in memory
+    raw = self.raw
+    if raw is None:
+      self.reload()
+      raw = self.raw
+    if raw.ndim > 3:
+      raw = raw[(Ellipsis,) + (0,) * (raw.ndim - 3)]
+
+    mi, ma = None, None
+    for k in range(0, raw.shape[2], step):
+      slab = np.asarray(raw[:, :, k:k + step])
+      if slab.size == 0:
+        continue
+      if slab.dtype.kind == "f":
+        smi, sma = np.nanmin(slab), np.nanmax(slab)
+      else:
+        smi, sma = slab.min(), slab.max()
+      mi = smi if mi is None else min(mi, smi)
+      ma = sma if ma is None else max(ma, sma)
+
+    if mi is None:
+      return [0, 0]
+
+    mi, ma = self.scale(mi), self.scale(ma)
+    return [min(mi, ma), max(mi, ma)]
+
+class VolumeManager:
+  # Process wide registry shared by the viewer tabs: a file opened twice is
+  # loaded once, and the least recently viewed volumes are dropped from
+  # memory when the budget is exceeded
+  def __init__(self, budget=None) -> None:
+    if budget is None:
+      env = os.environ.get(BUDGET_ENV)
+      budget = int(float(env) * (1 << 20)) if env else DEFAULT_BUDGET
+    self.budget = budget
+    self.volumes = OrderedDict()
+    self.refs = {}
+    self.lock = threading.RLock()
+    self.evictions = 0
+
+  def key(self, filename, is_seg=False):
+    try:
+      return (stat_key(os.stat(filename)), is_seg)
+    except OSError:
+      return None
+
+  def acquire(self, filename, is_seg=False):
+    # Returns a volume that may still have to be loaded, see Volume.ready
+    key = self.key(filename, is_seg)
+    if key is None:
+      return Volume(filename, is_seg=is_seg, load=False)
+
+    with self.lock:
+      volume = self.volumes.get(key)
+      if volume is None:
+        volume = Volume(filename, is_seg=is_seg, load=False)
+        volume.on_reload = self.on_reload
+        volume.manager_key = key
+        self.volumes[key] = volume
+        self.refs[key] = 0
+      self.refs[key] += 1
+      self.volumes.move_to_end(key)
+      return volume
+
+  def release(self, volume):
+    key = getattr(volume, "manager_key", None)
+    with self.lock:
+      if not key in self.refs:
+        return 0
+      self.refs[key] -= 1
+      count = self.refs[key]
+      if count <= 0:
+        self.refs.pop(key)
+        self.volumes.pop(key, None)
+        frame_cache().remove(volume.uid)
+    return max(count, 0)
+
+  def touch(self, volume):
+    key = getattr(volume, "manager_key", None)
+    with self.lock:
+      if key in self.volumes:
+        self.volumes.move_to_end(key)
+
+  def on_reload(self, volume):
+    self.touch(volume)
+    self.enforce()
+
+  def set_budget(self, budget):
+    self.budget = budget
+    self.enforce()
+
+  def resident_size(self):
+    with self.lock:
+      return sum(v.resident_size() for v in self.volumes.values())
+
+  def enforce(self):
+    # The most recently viewed volume always stays in memory
+    with self.lock:
+      size = self.resident_size()
+      keys = list(self.volumes)[:-1]
+      for key in keys:
+        if size <= self.budget:
+          break
+        volume = self.volumes[key]
+        nbytes = volume.resident_size()
+        if nbytes > 0 and volume.unload():
+          size -= nbytes
+          self.evictions += 1
+
+_manager = None
+
+def volume_manager():
+  global _manager
+  if _manager is None:
+    _manager = VolumeManager()
+  return _manager
+
+_frame_cache = None
+
+def frame_cache():
+  # Frames of 4D series shared by all viewers, bounded by its own budget
+  global _frame_cache
+  if _frame_cache is None:
+    env = os.environ.get(FRAME_BUDGET_ENV)
+    _frame_cache = SliceCache(int(float(env) * (1 << 20)) if env else DEFAULT_FRAME_BUDGET)
+  return _frame_cache
+
+def display_orientation(affine):
+  # For display axis j returns the raw axis it reads and whether it is read
+  # backwards, equivalent to np.flip(as_closest_canonical(img).get_fdata())
+  ornt = nb.orientations.io_orientation(affine)
+  if np.any(np.isnan(ornt)):
+    return [0, 1, 2], [True, True, True]
+
+  axes = [0, 0, 0]
+  flips = [True, True, True]
+  for raw_axis, (out_axis, direction) in enumerate(ornt[:3]):
+    axes[int(out_axis)] = raw_axis
+    flips[int(out_axis)] = direction > 0
+  return axes, flips
@@ -1,6 +1,5 @@
 import subprocess, threading, sys, json, tempfile, os
 
-from numpy import searchsorted
 from .utils import executionCode
 from PyQt5.QtCore import QObject, QThread, pyqtSignal, pyqtSlot, QRunnable
 
@@ -1,6 +1,6 @@
-import json, traceback
+import json, traceback, os, re
 from .utils import json_default, json_object_hook
-from .data import DataType
+from .data import DataType, ImageType, Data
 
 class Workspace:
   def __init__(self) -> None:
@@ -9,42 +9,191 @@ class Workspace:
 
   def load(self, filename):
     self.last_filename = filename
-    with open(filename, "r") as json_file:
-      data = json.load(json_file, object_hook=json_object_hook)
-      self.data = data.get("data", [])
+    self.data = [Data.from_dict(d) for d in iter_workspace_entries(filename)]
+
+  def add(self, entry):
+    self.data.append(Data.from_dict(entry))
 
   def get_data_type(self, dtype, subtype=None, isMultiple=False) -> list:
     data = []
     ism = isMultiple if not isMultiple is None else False
+    subtypes = [subtype]
+
+    # DICOM series are converted to NIfTI before they reach a plugin
+    if dtype == DataType.IMAGE.value and subtype == ImageType.NIFTI.value:
+      subtypes.append(ImageType.DICOM.value)
 
     for d in self.data:
       dism = d.get("ismultiple", False)
       if dism is None:
         dism = False
-      if d.get("type") == dtype and ((subtype is None) or (d.get("subtype") == subtype)) and (ism == dism):
+      if d.get("type") == dtype and ((subtype is None) or (d.get("subtype") in subtypes)) and (ism == dism):
         data.append(d)
     return data
 
   def save(self, filename=None):
-    data = {
-      "data": self.data
-    }
-
     if not self.last_filename is None:
       if filename is None:
         filename = self.last_filename
 
     if filename is None:
       return "filename is required!"
-    
+
     self.last_filename = filename
-    with open(filename, "w") as json_file:
+    try:
+      with WorkspaceWriter(filename) as writer:
+        for d in self.data:
+          writer.write(d)
+      return True
+    except Exception as ex:
+      et = traceback.format_exc()
+      print(f"Error: {ex}")
+      print(f"Error trace: {et}")
+      return str(ex)
+
+DELIMITERS = " \t\r\n,:]}"
+
+class WorkspaceReader:
+  # Incremental reader for the {"data": [...]} layout, only one entry is
+  # decoded at a time so workspace files never have to fit in memory
+  def __init__(self, fileobj, chunk_size=1 << 20) -> None:
+    self.fileobj = fileobj
+    self.chunk_size = chunk_size
+    self.decoder = json.JSONDecoder(object_hook=json_object_hook)
+    self.buffer = ""
+    self.pos = 0
+    self.eof = False
+
+  def _fill(self):
+    if self.eof:
+      return False
+    chunk = self.fileobj.read(self.chunk_size)
+    if chunk == "":
+      self.eof = True
+      return False
+    self.buffer = self.buffer[self.pos:] + chunk
+    self.pos = 0
+    return True
+
+  def _peek(self):
+    while True:
+      while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+        self.pos += 1
+      if self.pos < len(self.buffer):
+        return self.buffer[self.pos]
+      if not self._fill():
+        return None
+
+  def _expect(self, char):
+    c = self._peek()
+    if c != char:
+      raise ValueError(f"Invalid workspace file, expected '{char}' but found '{c}'")
+    self.pos += 1
+
+  def _value(self):
+    self._peek()
+    while True:
       try:
-        json.dump(data, json_file, default=json_default)
-        return True
-      except Exception as ex:
-        et = traceback.format_exc()
-        print(f"Error: {ex}")
-        print(f"Error trace: {et}")
-        return str(ex)
+        value, end = self.decoder.raw_decode(self.buffer, self.pos)
+        # A scalar cut by the end of the chunk may decode as a shorter one
+        # ("-7." as -7), so it is only taken once a delimiter follows it
+        if self.eof or isinstance(value, (dict, list)) or (end < len(self.buffer) and self.buffer[end] in DELIMITERS):
+          self.pos = end
+          return value
+      except json.JSONDecodeError:
+        if self.eof:
+          raise
+      self._fill()
+
+  def __iter__(self):
+    self._expect("{")
+    if self._peek() == "}":
+      return
+
+    while True:
+      key = self._value()
+      self._expect(":")
+      if key == "data":
+        self._expect("[")
+        if self._peek() == "]":
+          self.pos += 1
+        else:
+          while True:
+            yield self._value()
+            c = self._peek()
+            self.pos += 1
+            if c == "]":
+              break
+            if c != ",":
+              raise ValueError(f"Invalid workspace file, unexpected '{c}'")
+      else:
+        self._value()
+
+      c = self._peek()
+      self.pos += 1
+      if c == "}":
+        return
+      if c != ",":
+        raise ValueError(f"Invalid workspace file, unexpected '{c}'")
+
+def iter_workspace_entries(filename):
+  with open(filename, "r") as json_file:
+    for entry in WorkspaceReader(json_file):
+      yield entry
+
+class WorkspaceWriter:
+  def __init__(self, filename) -> None:
+    self.filename = filename
+    self.tmp_filename = f"{filename}.tmp"
+    self.count = 0
+    self._file = open(self.tmp_filename, "w")
+    self._file.write('{"data": [')
+
+  def write(self, entry):
+    if isinstance(entry, Data):
+      entry = entry.to_dict()
+    text = json.dumps(entry, default=json_default)
+    if self.count > 0:
+      self._file.write(", ")
+    self._file.write(text)
+    self.count += 1
+
+  def close(self):
+    self._file.write("]}")
+    self._file.close()
+    os.replace(self.tmp_filename, self.filename)
+
+  def abort(self):
+    self._file.close()
+    os.remove(self.tmp_filename)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    if exc_type is None:
+      self.close()
+    else:
+      self.abort()
+
+def entry_paths(entry):
+  if entry.get("type") == DataType.SCALAR.value:
+    return []
+
+  value = entry.get("value")
+  values = value if isinstance(value, list) else [value]
+  return [v for v in values if isinstance(v, str) and v != ""]
+
+def entry_subject(entry, pattern=None):
+  paths = entry_paths(entry)
+  if len(paths) == 0:
+    return None
+
+  if not pattern is None:
+    m = re.search(pattern, paths[0])
+    if m is None:
+      return None
+    return m.group(1) if len(m.groups()) > 0 else m.group(0)
 
+  # Without a pattern the subject is the folder holding the file
+  return os.path.basename(os.path.dirname(os.path.abspath(paths[0])))
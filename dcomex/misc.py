@@ -1,4 +1,4 @@
-import os, json, git, shutil, tempfile
+import os, json, shutil, tempfile
 
 def load_json(filepath):
   data = {}
@@ -15,6 +15,7 @@ def save_json(data, filepath):
     json.dump(data, json_file, indent=2)
 
 def clone_repo(url, folderPath):
+  import git
   repo = git.Repo.clone_from(url, folderPath)
   repo.submodule_update()
   return folderPath
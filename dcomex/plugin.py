@@ -1,7 +1,7 @@
 from __future__ import print_function
 from .misc import load_json, json
 from .lib.plugin_manager import PluginManager, PluginType
-import os, json, git, shutil
+import os, json, shutil
 
 def handle_plugins(args):
   action = args.action
@@ -119,6 +119,7 @@ def handle_install(args):
 
   if is_git:
     plugin_path = os.path.join(os.path.expanduser("~"), ".dcomex", "plugins", name)
+    import git
     repo = git.Repo.clone_from(pth, plugin_path)
     repo.submodule_update()
     pth = plugin_path
@@ -0,0 +1,29 @@
+from __future__ import print_function
+from .lib.qc import workspace_subjects, manifest_subjects, run_qc, write_index, SEG_PATTERN
+import os
+
+def handle_qc(args):
+  source = args.input
+  if not os.path.isfile(source):
+    print(f"File '{source}' not found")
+    return
+
+  if source.lower().endswith((".csv", ".tsv")):
+    subjects = manifest_subjects(source)
+  else:
+    subjects = workspace_subjects(source, args.pattern, args.image, args.seg if not args.seg is None else SEG_PATTERN)
+
+  if len(subjects) == 0:
+    print("No subjects with a NIfTI image found")
+    return
+
+  output_dir = os.path.abspath(args.output) if not args.output is None else os.path.join(os.path.dirname(os.path.abspath(source)), "qc")
+
+  def progress(result, done, total):
+    status = "error: " + result["error"] if not result["error"] is None else "ok"
+    print(f"[{done}/{total}] {result['subject']} {status}")
+
+  results = run_qc(subjects, output_dir, workers=args.workers, size=args.size, opacity=args.opacity, progress=progress)
+  index = write_index(results, output_dir)
+  failed = sum(1 for r in results if not r["error"] is None)
+  print(f"{len(results) - failed} montages, {failed} failed: {index}")
@@ -17,6 +17,15 @@ def main():
     handle_run(args)
   elif submodule == "init":
     handle_init(args)
+  elif submodule == "dicom":
+    from .dicom import handle_dicom
+    handle_dicom(args)
+  elif submodule == "workspace":
+    from .workspace import handle_workspace
+    handle_workspace(args)
+  elif submodule == "qc":
+    from .qc import handle_qc
+    handle_qc(args)
   else:
     print(f"Submodule {submodule} has no handler!")
 
@@ -0,0 +1,175 @@
+from __future__ import print_function
+from .lib.workspace import iter_workspace_entries, WorkspaceWriter, entry_paths, entry_subject
+from .lib.utils import json_default
+from .lib.fingerprint import FingerprintIndex
+import os, json, heapq, hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+def handle_workspace(args):
+  action = args.action
+
+  if action == "split":
+    handle_split(args)
+  elif action == "merge":
+    handle_merge(args)
+  elif action == "verify":
+    handle_verify(args)
+  else:
+    print(f"Action '{action}' not handled!")
+
+def estimate_cost(entry):
+  cost = 0
+  for p in entry_paths(entry):
+    try:
+      if os.path.isdir(p):
+        for root, _, files in os.walk(p):
+          for f in files:
+            cost += os.path.getsize(os.path.join(root, f))
+      else:
+        cost += os.path.getsize(p)
+    except OSError:
+      pass
+  return cost
+
+def assign_shards(weights, count):
+  # Longest processing time first: heaviest subject goes to the lightest shard
+  heap = [(0, k) for k in range(count)]
+  assigned = {}
+  for subject in sorted(weights, key=lambda s: (-weights[s], s)):
+    load, k = heapq.heappop(heap)
+    assigned[subject] = k
+    heapq.heappush(heap, (load + weights[subject], k))
+  return assigned
+
+def handle_split(args):
+  filename = args.workspace
+  count = args.shards
+  if count < 1:
+    print("Number of shards must be at least 1")
+    return
+
+  weights = {}
+  for entry in iter_workspace_entries(filename):
+    subject = entry_subject(entry, args.pattern)
+    if subject is None:
+      continue
+    weight = estimate_cost(entry) if args.by == "cost" else 1
+    weights[subject] = weights.get(subject, 0) + weight
+
+  assigned = assign_shards(weights, count)
+
+  output_dir = os.path.abspath(args.output) if not args.output is None else os.path.dirname(os.path.abspath(filename))
+  os.makedirs(output_dir, exist_ok=True)
+  base = os.path.splitext(os.path.basename(filename))[0]
+  shard_files = [os.path.join(output_dir, f"{base}_shard{k + 1:0{len(str(count))}d}.json") for k in range(count)]
+
+  writers = [WorkspaceWriter(f) for f in shard_files]
+  try:
+    for entry in iter_workspace_entries(filename):
+      subject = entry_subject(entry, args.pattern)
+      if subject is None:
+        # Entries without a subject (scalars, shared files) go to every shard
+        for w in writers:
+          w.write(entry)
+      else:
+        writers[assigned[subject]].write(entry)
+  except Exception:
+    for w in writers:
+      w.abort()
+    raise
+
+  for w in writers:
+    w.close()
+
+  loads = [0] * count
+  subjects = [0] * count
+  for s in assigned:
+    loads[assigned[s]] += weights[s]
+    subjects[assigned[s]] += 1
+
+  unit = "bytes" if args.by == "cost" else "entries"
+  for k in range(count):
+    print(f"{shard_files[k]}: {subjects[k]} subject(s), {writers[k].count} entries, {loads[k]} {unit}")
+
+def parse_remaps(remaps):
+  items = []
+  for r in remaps:
+    if not "=" in r:
+      raise ValueError(f"Invalid remap '{r}', expected OLD=NEW")
+    old, new = r.split("=", 1)
+    items.append((old, new))
+  # Longest prefix wins
+  return sorted(items, key=lambda i: -len(i[0]))
+
+def remap_path(path, remaps):
+  for old, new in remaps:
+    if path == old or path.startswith(old.rstrip(os.sep) + os.sep):
+      return new.rstrip(os.sep) + path[len(old.rstrip(os.sep)):]
+  return path
+
+def remap_entry(entry, remaps):
+  if len(remaps) == 0 or len(entry_paths(entry)) == 0:
+    return entry
+
+  value = entry.get("value")
+  if isinstance(value, list):
+    entry["value"] = [remap_path(v, remaps) if isinstance(v, str) else v for v in value]
+  elif isinstance(value, str):
+    entry["value"] = remap_path(value, remaps)
+  return entry
+
+def digest(data):
+  text = json.dumps(data, sort_keys=True, default=json_default)
+  return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+def handle_merge(args):
+  remaps = parse_remaps(args.remaps)
+  shards = sorted(args.shards)
+  if args.prefer == "last":
+    shards = shards[::-1]
+
+  # Only digests are kept so memory stays small for large cohorts
+  seen = set()
+  by_value = set()
+  duplicates = 0
+  conflicts = 0
+
+  with WorkspaceWriter(args.output) as writer:
+    for shard in shards:
+      for entry in iter_workspace_entries(shard):
+        entry = remap_entry(entry, remaps)
+        key = digest(entry)
+        if key in seen:
+          duplicates += 1
+          continue
+
+        if len(entry_paths(entry)) > 0:
+          value_key = digest([entry.get("type"), entry.get("subtype"), entry.get("value")])
+          if value_key in by_value:
+            # Same file under a different name or metadata, the preferred shard wins
+            conflicts += 1
+            if args.verbose:
+              print(f"Conflict in {shard}: '{entry.get('name')}' -> {entry.get('value')} skipped")
+            continue
+          by_value.add(value_key)
+
+        seen.add(key)
+        writer.write(entry)
+
+  print(f"{args.output}: {writer.count} entries from {len(shards)} shard(s), {duplicates} duplicate(s) and {conflicts} conflict(s) dropped")
+
+def handle_verify(args):
+  counts = {"ok": 0, "new": 0, "changed": 0, "missing": 0}
+
+  files = [(str(entry.get('name')), p) for entry in iter_workspace_entries(args.workspace) for p in entry_paths(entry)]
+
+  # Files are checked in parallel, the index pool is kept for the chunks of
+  # large files
+  with FingerprintIndex(workers=args.workers) as index, ThreadPoolExecutor(max_workers=args.workers) as pool:
+    results = pool.map(lambda f: index.verify(f[1], rehash=args.rehash, update=args.update), files)
+    for (name, p), (status, fp) in zip(files, results):
+      counts[status] += 1
+      if status != "ok" or args.verbose:
+        print("{:<8} {:<25} {}".format(status, name, p))
+
+  print(", ".join([f"{counts[k]} {k}" for k in counts]))
@@ -0,0 +1,69 @@
+import os
+from types import SimpleNamespace
+import numpy as np
+import nibabel as nb
+import pytest
+from dcomex.lib.compare import same_grid, AFFINE_TOLERANCE
+
+def grid(shape=(4, 5, 6), shift=0.0, affine=True):
+  a = np.diag([1.0, 2.0, 3.0, 1.0])
+  a[0, 3] += shift
+  return SimpleNamespace(shape=shape, affine=a if affine else None)
+
+def test_same_grid():
+  assert same_grid(grid(), grid())
+  assert same_grid(grid(), grid(shift=AFFINE_TOLERANCE / 2))
+  assert not same_grid(grid(), grid(shift=2 * AFFINE_TOLERANCE))
+  assert not same_grid(grid(), grid(shape=(4, 5, 7)))
+  assert same_grid(grid(), grid(affine=False))
+  assert not same_grid(grid(), grid(shape=(5, 4, 6), affine=False))
+
+@pytest.fixture(scope="module")
+def app():
+  os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+  from PyQt5.QtWidgets import QApplication
+  return QApplication.instance() or QApplication([])
+
+def save(tmp_path, name, data, shift=0.0):
+  affine = np.diag([1.0, 1.0, 1.0, 1.0])
+  affine[:3, 3] = [shift, 0.0, 0.0]
+  filename = str(tmp_path / name)
+  nb.save(nb.Nifti1Image(data, affine), filename)
+  return filename
+
+def test_viewer_refuses_other_grids(tmp_path, app):
+  from dcomex.lib.volume import Volume
+  from dcomex.lib.workspace import Workspace
+  from dcomex.lib.viewer3d import Viewer3D
+
+  data = np.arange(8 * 8 * 8, dtype=np.int16).reshape(8, 8, 8)
+  v = Viewer3D(Workspace())
+  volumes = [Volume(save(tmp_path, "a.nii", data)), Volume(save(tmp_path, "b.nii", data, shift=2e-3)), Volume(save(tmp_path, "c.nii", data + 1, shift=5e-4))]
+  for volume in volumes:
+    v.add_volume(volume, volume.loaded_range())
+  v.image_index = 0
+  v.update_compare_panel()
+  v.compare_with_combo.setCurrentIndex(v.compare_with_combo.findData(volumes[1].uid))
+  v.compare_combo.setCurrentIndex(v.compare_combo.findData("difference"))
+  v.scheduler.flush()
+  assert v.compare_volume is volumes[1]
+  assert v.get_comparison(volumes[0]) is None
+  assert v.comparison is None
+  assert v.compare_status.text() == "Images have different affines"
+  assert v.top_left_panel.volume is volumes[0]
+  assert v.top_left_panel.compare is None
+
+  # Within the tolerance the comparison is shown
+  v.compare_with_combo.setCurrentIndex(v.compare_with_combo.findData(volumes[2].uid))
+  v.scheduler.flush()
+  comparison = v.get_comparison(volumes[0])
+  assert not comparison is None and comparison.other is volumes[2]
+  assert v.compare_status.text() == ""
+  assert v.top_left_panel.compare is comparison
+
+  v.compare_combo.setCurrentIndex(0)
+  v.scheduler.flush()
+  assert v.top_left_panel.compare is None
+  assert v.get_comparison(volumes[0]) is None
+  assert v.compare_status.text() == ""
+  v.deleteLater()
@@ -0,0 +1,66 @@
+import json
+import pytest
+from dcomex.lib.data import Data
+from dcomex.lib.workspace import Workspace
+
+ENTRY = {"name": "t1", "type": "image", "subtype": "nifti", "ismultiple": False, "value": "/data/sub-01/t1.nii.gz"}
+
+def test_dict_round_trip():
+  data = dict(ENTRY, display="T1 image", required=True)
+  d = Data.from_dict(data)
+  assert d.to_dict() == data
+  assert Data.from_dict(d) is d
+  assert d == data
+  assert d == Data.from_dict(dict(data))
+  assert d != dict(data, value="other.nii")
+
+def test_get_item_and_contains():
+  d = Data.from_dict(dict(ENTRY, display="T1"))
+  assert d["name"] == "t1"
+  assert d.get("value") == ENTRY["value"]
+  assert d["display"] == "T1"
+  assert "type" in d and "display" in d
+  assert not "missing" in d
+  assert d.get("missing") is None
+  assert d.get("missing", 3) == 3
+  with pytest.raises(KeyError):
+    d["missing"]
+
+def test_unknown_keys_go_to_extra():
+  d = Data.from_dict({"name": "x", "display": "X", "required": False})
+  assert d.extra == {"display": "X", "required": False}
+  d["color"] = "red"
+  d["value"] = 5
+  assert d.extra == {"display": "X", "required": False, "color": "red"}
+  assert d.value == 5
+  assert Data.from_dict(ENTRY).extra is None
+
+def test_unset_slots_are_skipped():
+  d = Data.from_dict({"name": "x", "value": None})
+  assert d.keys() == ["name", "value"]
+  assert not "type" in d
+  assert d.get("type") is None
+  with pytest.raises(KeyError):
+    d["subtype"]
+  assert d.to_dict() == {"name": "x", "value": None}
+
+def test_unset_slots_are_not_saved(tmp_path):
+  filename = str(tmp_path / "workspace.json")
+  ws = Workspace()
+  ws.add({"name": "x", "value": 1})
+  ws.add(dict(ENTRY, display="T1"))
+  assert ws.save(filename) is True
+  with open(filename, "r") as json_file:
+    saved = json.load(json_file)["data"]
+  assert saved == [{"name": "x", "value": 1}, dict(ENTRY, display="T1")]
+
+  loaded = Workspace()
+  loaded.load(filename)
+  assert [d.to_dict() for d in loaded.data] == saved
+
+def test_entries_are_not_hashable():
+  assert Data.__hash__ is None
+  with pytest.raises(TypeError):
+    hash(Data.from_dict(ENTRY))
+  with pytest.raises(TypeError):
+    {Data.from_dict(ENTRY)}
@@ -0,0 +1,101 @@
+import os, json, functools
+from argparse import Namespace
+import pytest
+from dcomex.lib.fingerprint import FingerprintIndex, hash_file
+from dcomex.lib.workspace import WorkspaceWriter
+import dcomex.workspace as workspace_cli
+
+def write(path, data, mtime_ns=None):
+  with open(path, "wb") as f:
+    f.write(data)
+  if not mtime_ns is None:
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+  return str(path)
+
+@pytest.fixture
+def index_file(tmp_path):
+  return str(tmp_path / "cache" / "fingerprints.json")
+
+def verify(index_file, path, **kwargs):
+  with FingerprintIndex(index_file) as index:
+    return index.verify(path, **kwargs)[0]
+
+def test_verify_reports_changes_until_update(tmp_path, index_file):
+  path = write(tmp_path / "a.bin", b"first", 1_000_000_000)
+  assert verify(index_file, path) == "new"
+  assert verify(index_file, path) == "ok"
+
+  # Same size, new content and mtime
+  write(path, b"other", 2_000_000_000)
+  assert verify(index_file, path) == "changed"
+  assert verify(index_file, path) == "changed"
+  assert verify(index_file, path, update=True) == "changed"
+  assert verify(index_file, path) == "ok"
+
+def test_verify_touched_file_is_ok(tmp_path, index_file):
+  path = write(tmp_path / "a.bin", b"content", 1_000_000_000)
+  assert verify(index_file, path) == "new"
+  os.utime(path, ns=(3_000_000_000, 3_000_000_000))
+  assert verify(index_file, path) == "ok"
+
+  # The new stats are stored, so the file is not hashed again
+  with FingerprintIndex(index_file) as index:
+    assert index.status(path) == "ok"
+    assert index.lookup(path) == hash_file(path)
+
+def test_verify_folders_and_missing_files(tmp_path, index_file):
+  folder = tmp_path / "folder"
+  folder.mkdir()
+  write(folder / "a", b"a")
+  write(folder / "b", b"b", 1_000_000_000)
+  assert verify(index_file, str(folder)) == "new"
+  assert verify(index_file, str(folder)) == "ok"
+  write(folder / "b", b"c", 2_000_000_000)
+  assert verify(index_file, str(folder)) == "changed"
+  assert verify(index_file, str(tmp_path / "missing")) == "missing"
+
+def test_save_merges_entries_of_other_writers(tmp_path, index_file):
+  a = write(tmp_path / "a.bin", b"a")
+  b = write(tmp_path / "b.bin", b"b", 1_000_000_000)
+  first, second = FingerprintIndex(index_file), FingerprintIndex(index_file)
+  first.fingerprint(a)
+  second.fingerprint(b)
+  first.save()
+  second.save()
+
+  with open(index_file) as json_file:
+    data = json.load(json_file)
+  assert sorted(data["paths"]) == sorted([os.path.abspath(a), os.path.abspath(b)])
+  assert sorted(data["entries"].values()) == sorted([hash_file(a), hash_file(b)])
+
+  # Replaced fingerprints are dropped from the file, the others are kept
+  write(b, b"c", 2_000_000_000)
+  third = FingerprintIndex(index_file)
+  third.fingerprint(b)
+  third.save()
+  with open(index_file) as json_file:
+    data = json.load(json_file)
+  assert sorted(data["entries"].values()) == sorted([hash_file(a), hash_file(b)])
+
+def test_workspace_verify_command(tmp_path, index_file, monkeypatch, capsys):
+  monkeypatch.setattr(workspace_cli, "FingerprintIndex", functools.partial(FingerprintIndex, index_file))
+  a = write(tmp_path / "a.bin", b"first", 1_000_000_000)
+  b = write(tmp_path / "b.bin", b"second", 1_000_000_000)
+  filename = str(tmp_path / "workspace.json")
+  with WorkspaceWriter(filename) as writer:
+    writer.write({"name": "a", "type": "file", "value": a})
+    writer.write({"name": "b", "type": "file", "value": b})
+    writer.write({"name": "n", "type": "scalar", "subtype": "int", "value": 3})
+
+  def run(update=False):
+    capsys.readouterr()
+    workspace_cli.handle_verify(Namespace(workspace=filename, workers=2, rehash=False, update=update, verbose=False))
+    return capsys.readouterr().out.strip().splitlines()[-1]
+
+  assert run() == "0 ok, 2 new, 0 changed, 0 missing"
+  assert run() == "2 ok, 0 new, 0 changed, 0 missing"
+  write(b, b"SECOND", 2_000_000_000)
+  assert run() == "1 ok, 0 new, 1 changed, 0 missing"
+  assert run() == "1 ok, 0 new, 1 changed, 0 missing"
+  assert run(update=True) == "1 ok, 0 new, 1 changed, 0 missing"
+  assert run() == "2 ok, 0 new, 0 changed, 0 missing"
@@ -0,0 +1,54 @@
+import numpy as np
+from dcomex.lib.labels import LabelColorTable, MAX_LUT_SIZE, as_labels, default_color
+
+TRANSPARENT = [0, 0, 0, 0]
+
+def table():
+  t = LabelColorTable(filename=None)
+  # A visible background makes clipped labels show up
+  t.set_color(0, [10, 20, 30, 255])
+  return t
+
+def test_uint8_labels():
+  t = table()
+  data = np.array([[0, 1], [2, 255]], dtype=np.uint8)
+  rgba = t.apply(data)
+  assert rgba.shape == (2, 2, 4)
+  assert rgba[0, 0].tolist() == [10, 20, 30, 255]
+  assert rgba[0, 1].tolist() == default_color(1)
+  assert rgba[1, 1].tolist() == default_color(255)
+
+def test_negative_labels_are_transparent():
+  t = table()
+  data = np.array([[-1, 0], [3, -32768]], dtype=np.int16)
+  rgba = t.apply(data)
+  assert rgba[0, 0].tolist() == TRANSPARENT
+  assert rgba[1, 1].tolist() == TRANSPARENT
+  assert rgba[0, 0].tolist() != t.color(0)
+  assert rgba[0, 1].tolist() == [10, 20, 30, 255]
+  assert rgba[1, 0].tolist() == default_color(3)
+
+def test_labels_above_the_table():
+  t = table()
+  size = len(t.lut)
+  data = np.array([1, size + 5, 2 * size], dtype=np.int32)
+  rgba = t.apply(data)
+  assert rgba[1].tolist() == default_color(size + 5)
+  assert rgba[2].tolist() == default_color(2 * size)
+  assert rgba[1].tolist() != rgba[2].tolist()
+
+def test_sparse_labels_beyond_the_lut_limit():
+  t = table()
+  data = np.array([-5, 0, 7, MAX_LUT_SIZE + 3], dtype=np.int64)
+  rgba = t.apply(data)
+  assert rgba[0].tolist() == TRANSPARENT
+  assert rgba[1].tolist() == [10, 20, 30, 255]
+  assert rgba[2].tolist() == default_color(7)
+  assert rgba[3].tolist() == default_color(MAX_LUT_SIZE + 3)
+
+def test_as_labels_keeps_integer_data():
+  for dtype in (np.uint8, np.uint16, np.int16):
+    data = np.arange(6, dtype=dtype)
+    assert as_labels(data) is data
+  assert as_labels(np.array([1.4, 2.6], dtype=np.float32)).tolist() == [1, 3]
+  assert as_labels(np.array([True, False])).dtype == np.uint8
@@ -0,0 +1,19 @@
+from types import SimpleNamespace
+from dcomex.lib.loader import VolumeLoader
+
+def test_cancel_is_refcounted():
+  loader = VolumeLoader(SimpleNamespace(uid="a", filename="a.nii"))
+  loader.subscribe()
+  loader.subscribe()
+  loader.unsubscribe()
+  assert not loader.is_cancelled
+  loader.unsubscribe()
+  assert loader.is_cancelled
+  loader.unsubscribe()
+  assert loader.subscribers == 0
+
+def test_forced_cancel():
+  loader = VolumeLoader(SimpleNamespace(uid="b", filename="b.nii"))
+  loader.subscribe()
+  loader.cancel()
+  assert loader.is_cancelled
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+from stl import Mode, mesh as stl_mesh
+from dcomex.lib import mesh as mesh_lib
+from dcomex.lib.mesh import voxel_surface, cluster_vertices, decimate, label_meshes, read_stl, index_triangles, is_binary_stl
+
+def cube_labels():
+  data = np.zeros((6, 6, 6), dtype=np.uint8)
+  data[1:3, 1:3, 1:3] = 1
+  data[4, 4, 4] = 2
+  return data
+
+def sphere(radius=12):
+  g = np.indices((2 * radius + 4,) * 3) - (radius + 2)
+  return (g ** 2).sum(axis=0) <= radius ** 2
+
+def signed_volume(verts, faces):
+  v = verts[faces].astype(np.float64)
+  return float(np.einsum("ij,ij->i", v[:, 0], np.cross(v[:, 1], v[:, 2])).sum() / 6.0)
+
+def edge_counts(faces):
+  edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+  directed = {tuple(e) for e in edges.tolist()}
+  return len(edges), len(directed), all((b, a) in directed for a, b in directed)
+
+def test_cube_face_counts():
+  verts, faces = voxel_surface(cube_labels() == 1)
+  # 6 sides of 2x2 quads, two triangles each, corners of a 3x3x3 grid but the center
+  assert len(faces) == 48
+  assert len(verts) == 26
+  assert verts.min(axis=0).tolist() == [1, 1, 1]
+  assert verts.max(axis=0).tolist() == [3, 3, 3]
+  # Closed, consistently oriented outwards
+  assert signed_volume(verts, faces) == pytest.approx(8.0)
+  total, directed, paired = edge_counts(faces)
+  assert total == directed and paired
+
+def test_single_voxel_and_offset():
+  verts, faces = voxel_surface(np.ones((1, 1, 1), dtype=bool), offset=(10, 20, 30))
+  assert len(faces) == 12 and len(verts) == 8
+  assert verts.min(axis=0).tolist() == [10, 20, 30]
+  assert signed_volume(verts, faces) == pytest.approx(1.0)
+
+def test_empty_mask():
+  verts, faces = voxel_surface(np.zeros((3, 3, 3), dtype=bool))
+  assert verts.shape == (0, 3) and faces.shape == (0, 3)
+
+def test_label_meshes():
+  meshes = label_meshes(cube_labels())
+  assert sorted(meshes) == [1, 2]
+  assert len(meshes[1][1]) == 48 and len(meshes[2][1]) == 12
+  assert meshes[2][0].min(axis=0).tolist() == [4, 4, 4]
+  assert label_meshes(np.zeros((3, 3, 3), dtype=np.uint8)) == {}
+
+def test_cluster_vertices():
+  verts, faces = voxel_surface(sphere())
+  # Cells smaller than a voxel keep the mesh
+  v, f = cluster_vertices(verts, faces, 0.5)
+  assert len(v) == len(verts) and len(f) == len(faces)
+  v, f = cluster_vertices(verts, faces, 3.0)
+  assert 0 < len(f) < len(faces)
+  assert f.max() < len(v)
+  assert not np.any((f[:, 0] == f[:, 1]) | (f[:, 1] == f[:, 2]) | (f[:, 0] == f[:, 2]))
+  # One cell for everything leaves no triangle
+  v, f = cluster_vertices(verts, faces, 1000.0)
+  assert len(v) == 1 and len(f) == 0
+
+@pytest.mark.parametrize("budget", [200, 1000, 5000])
+def test_decimate_respects_budget(budget):
+  verts, faces = voxel_surface(sphere())
+  assert len(faces) > 5000
+  v, f = decimate(verts, faces, budget)
+  assert 0 < len(f) <= budget
+  assert f.min() >= 0 and f.max() < len(v)
+  # Unused vertices are dropped
+  assert len(np.unique(f)) == len(v)
+  assert signed_volume(v, f) > 0
+
+def test_decimate_under_budget_is_unchanged():
+  verts, faces = voxel_surface(cube_labels() == 1)
+  v, f = decimate(verts, faces, 48)
+  assert v is verts and f is faces
+
+def test_index_triangles_merges_corners():
+  corners = np.array([[[0, 0, 0], [1, 0, 0], [0, 1, 0]], [[-0.0, 0, 0], [0, 1, 0], [1, 0, 0]]], dtype=np.float32)
+  verts, faces = index_triangles(corners)
+  assert len(verts) == 3
+  assert np.array_equal(verts[faces], corners + np.float32(0))
+
+@pytest.fixture
+def triangles():
+  verts, faces = voxel_surface(sphere(6), offset=(-8.5, 0.25, 3))
+  return verts[faces]
+
+def save_stl(filename, triangles, mode):
+  data = stl_mesh.Mesh(np.zeros(len(triangles), dtype=stl_mesh.Mesh.dtype))
+  data.vectors[:] = triangles
+  data.save(str(filename), mode=mode)
+  return str(filename)
+
+def test_read_binary_stl(tmp_path, triangles, monkeypatch):
+  filename = save_stl(tmp_path / "mesh.stl", triangles, Mode.BINARY)
+  assert is_binary_stl(filename)
+  verts, faces = read_stl(filename)
+  assert np.array_equal(verts[faces], triangles)
+
+  # The same file through numpy-stl
+  monkeypatch.setattr(mesh_lib, "is_binary_stl", lambda f: False)
+  v, f = read_stl(filename)
+  assert np.array_equal(v, verts) and np.array_equal(f, faces)
+
+def test_read_ascii_stl(tmp_path, triangles):
+  filename = save_stl(tmp_path / "mesh.stl", triangles, Mode.ASCII)
+  assert not is_binary_stl(filename)
+  verts, faces = read_stl(filename)
+  assert np.array_equal(verts[faces], triangles)
+  assert len(verts) == len(np.unique(triangles.reshape(-1, 3), axis=0))
+
+def test_read_empty_binary_stl(tmp_path):
+  filename = tmp_path / "empty.stl"
+  filename.write_bytes(b"\0" * 84)
+  verts, faces = read_stl(str(filename))
+  assert verts.shape == (0, 3) and faces.shape == (0, 3)
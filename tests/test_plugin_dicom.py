@@ -0,0 +1,125 @@
+import os, json, functools
+import numpy as np
+import nibabel as nb
+import pytest
+import pydicom
+from pydicom.dataset import FileDataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+from dcomex.lib import dicom
+from dcomex.lib.dicom import DicomIndex, dicom_to_nifti
+from dcomex.lib.plugin import Plugin
+
+MR_STORAGE = "1.2.840.10008.5.1.4.1.1.4"
+
+def write_series(folder, count, description, number, shape=(8, 6)):
+  # Slices are written in reverse instance order, the index sorts them back
+  # by position along the slice normal
+  os.makedirs(folder, exist_ok=True)
+  uid = generate_uid()
+  for k in range(count):
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = MR_STORAGE
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    filename = os.path.join(folder, f"{description}_{count - k}.dcm")
+    ds = FileDataset(filename, {}, file_meta=meta, preamble=b"\0" * 128)
+    if int(pydicom.__version__.split(".")[0]) < 3:
+      # Older pydicom does not take the encoding from the transfer syntax
+      ds.is_little_endian, ds.is_implicit_VR = True, False
+    ds.SOPClassUID = MR_STORAGE
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.PatientID = "P1"
+    ds.StudyInstanceUID = "1.2.3"
+    ds.SeriesInstanceUID = uid
+    ds.SeriesNumber = number
+    ds.SeriesDescription = description
+    ds.Modality = "MR"
+    ds.InstanceNumber = count - k
+    ds.Rows, ds.Columns = shape
+    ds.ImagePositionPatient = [0, 0, float(k) * 2]
+    ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    ds.PixelSpacing = [0.5, 0.7]
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated, ds.BitsStored, ds.HighBit, ds.PixelRepresentation = 16, 16, 15, 1
+    ds.PixelData = np.full(shape, k, dtype=np.int16).tobytes()
+    ds.save_as(filename)
+  return uid
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+  cache = str(tmp_path / "cache")
+  monkeypatch.setattr(dicom, "dicom_to_nifti", functools.partial(dicom_to_nifti, cache_dir=cache))
+  return cache
+
+@pytest.fixture
+def dicom_dir(tmp_path):
+  root = tmp_path / "dicom"
+  write_series(str(root / "a"), 5, "T1", 1)
+  write_series(str(root / "a" / "b"), 3, "FLAIR", 2)
+  (root / "a" / "notdicom.txt").write_text("not a dicom file")
+  return str(root)
+
+def make_plugin(tmp_path, input_data, ismultiple=False):
+  settings = tmp_path / "settings.json"
+  settings.write_text(json.dumps({"inputs": {"image": {"type": "image", "subtype": "nifti", "ismultiple": ismultiple}}}))
+  plugin = Plugin({"settings": str(settings), "type": "python", "path": str(tmp_path)})
+  plugin.set_inputs(input_data)
+  return plugin
+
+def test_index_groups_and_orders_series(dicom_dir, cache_dir):
+  series = DicomIndex(dicom_dir, cache_dir=cache_dir).scan()
+  assert sorted((s["description"], len(s["files"])) for s in series) == [("FLAIR", 3), ("T1", 5)]
+  for s in series:
+    positions = [p[2] for p in s["positions"]]
+    assert positions == sorted(positions)
+
+  # A second scan is answered from the cached index
+  again = DicomIndex(dicom_dir, cache_dir=cache_dir).scan()
+  assert [s["files"] for s in again] == [s["files"] for s in series]
+
+def test_conversion_largest_series_first(dicom_dir, cache_dir):
+  files = dicom.dicom_to_nifti(dicom_dir)
+  assert len(files) == 2
+  data = np.asanyarray(nb.load(files[0]).dataobj)
+  assert data.shape == (8, 6, 5)
+  assert [int(data[0, 0, k]) for k in range(5)] == [0, 1, 2, 3, 4]
+  assert nb.load(files[1]).shape == (8, 6, 3)
+
+def test_prepare_inputs_converts_folders(tmp_path, dicom_dir, cache_dir):
+  plugin = make_plugin(tmp_path, {"image": dicom_dir, "other": 1})
+  inputs = plugin.prepare_inputs()
+  assert inputs["image"].endswith(".nii.gz") and os.path.isfile(inputs["image"])
+  assert inputs["other"] == 1
+  assert plugin.input_data == {"image": dicom_dir, "other": 1}
+
+  plugin = make_plugin(tmp_path, {"image": [dicom_dir, "x.nii.gz"]}, ismultiple=True)
+  inputs = plugin.prepare_inputs()
+  assert len(inputs["image"]) == 3 and inputs["image"][-1] == "x.nii.gz"
+
+def test_prepare_inputs_without_series(tmp_path, cache_dir):
+  empty = tmp_path / "empty"
+  empty.mkdir()
+  (empty / "notdicom.txt").write_text("not a dicom file")
+  plugin = make_plugin(tmp_path, {"image": str(empty)})
+  assert plugin.prepare_inputs() is None
+  assert "No DICOM series" in plugin.last_error
+  assert plugin.input_data == {"image": str(empty)}
+
+  # The plugin is not started with the folder as input
+  started = []
+  plugin.run_python = lambda input_data=None: started.append(input_data)
+  plugin.run()
+  assert started == []
+
+def test_prepare_inputs_rejects_single_files(tmp_path, dicom_dir, cache_dir):
+  single = os.path.join(dicom_dir, "a", "T1_1.dcm")
+  plugin = make_plugin(tmp_path, {"image": single})
+  assert plugin.prepare_inputs() is None
+  assert "single DICOM file" in plugin.last_error
+
+  # NIfTI files are passed on as they are
+  nifti = str(tmp_path / "image.nii.gz")
+  nb.save(nb.Nifti1Image(np.zeros((2, 2, 2), dtype=np.int16), np.eye(4)), nifti)
+  plugin = make_plugin(tmp_path, {"image": nifti})
+  assert plugin.prepare_inputs() == {"image": nifti}
@@ -0,0 +1,18 @@
+from dcomex.lib.qc import safe_name, unique_names
+
+def test_safe_names_keep_plain_subjects():
+  assert safe_name("sub-01") == "sub-01"
+  assert safe_name("sub_01.a") == "sub_01.a"
+
+def test_replaced_characters_do_not_collide():
+  names = [safe_name(s) for s in ("a b", "a/b", "a_b", "a:b")]
+  assert len(set(names)) == 4
+  assert names[2] == "a_b"
+  assert all(n.startswith("a_b") for n in names)
+  assert safe_name("///").startswith("subject_")
+
+def test_unique_names():
+  names = unique_names(["s1", "s1", "S1", "a b", "a b"])
+  assert names[:3] == ["s1", "s1_2", "S1_3"]
+  assert names[3] != names[4]
+  assert len({n.lower() for n in names}) == 5
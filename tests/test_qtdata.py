@@ -0,0 +1,74 @@
+from PyQt5.QtCore import Qt
+from dcomex.lib.qtdata import TableModel
+
+def records(n):
+  return [{"name": f"item{k:04d}", "size": (k * 37) % 101, "kind": "seg" if k % 3 == 0 else "img"} for k in range(n)]
+
+def row_data(record):
+  return [record["name"], record["size"], record["kind"]]
+
+def model(data):
+  return TableModel(data, ["Name", "Size", "Kind"], row_data=row_data)
+
+def display(m, row, column):
+  return m.data(m.index(row, column), Qt.DisplayRole)
+
+def fetch_all(m):
+  counts = [m.rowCount()]
+  while m.canFetchMore():
+    m.fetchMore()
+    counts.append(m.rowCount())
+  return counts
+
+def test_rows_are_fetched_in_batches():
+  size = TableModel.BATCH_SIZE
+  m = model(records(2 * size + 10))
+  assert m.rowCount() == size
+  assert fetch_all(m) == [size, 2 * size, 2 * size + 10]
+  assert not m.canFetchMore()
+  m.fetchMore()
+  assert m.rowCount() == 2 * size + 10
+  assert display(m, 2 * size + 9, 0) == f"item{2 * size + 9:04d}"
+
+def test_small_tables_are_loaded_at_once():
+  m = model(records(5))
+  assert m.rowCount() == 5
+  assert not m.canFetchMore()
+  assert m.columnCount() == 3
+
+def test_filter_then_sort_maps_to_records():
+  data = records(3 * TableModel.BATCH_SIZE)
+  m = model(data)
+  m.set_filter("SEG")
+  m.sort(1, Qt.DescendingOrder)
+  fetch_all(m)
+  expected = sorted((r for r in data if r["kind"] == "seg"), key=lambda r: r["size"], reverse=True)
+  assert m.rowCount() == len(expected)
+  assert [display(m, k, 1) for k in range(m.rowCount())] == [r["size"] for r in expected]
+  for k in range(m.rowCount()):
+    record = m.record(k)
+    assert record is data[m.source_row(k)]
+    assert record["kind"] == "seg"
+    assert display(m, k, 0) == record["name"]
+
+  m.sort(-1)
+  m.set_filter("")
+  assert m.source_row(7) == 7
+  assert m.record(7) is data[7]
+
+def test_set_records_resets_rows():
+  size = TableModel.BATCH_SIZE
+  m = model(records(3 * size))
+  fetch_all(m)
+  assert m.rowCount() == 3 * size
+  resets = []
+  m.modelReset.connect(lambda: resets.append(True))
+  data = records(10)
+  m.set_records(data)
+  assert resets == [True]
+  assert m.rowCount() == 10
+  assert not m.canFetchMore()
+  assert m.record(3) is data[3]
+  m.set_records(records(size + 1))
+  assert m.rowCount() == size
+  assert m.canFetchMore()
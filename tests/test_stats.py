@@ -0,0 +1,93 @@
+import numpy as np
+import nibabel as nb
+import pytest
+from dcomex.lib.volume import Volume
+from dcomex.lib.stats import Histogram, IntensityStats, compute_stats, WINDOW
+
+PERCENTILES = [0.5, 1, 5, 25, 50, 75, 95, 99, 99.5]
+
+def volume(tmp_path, data, slope=None, inter=None):
+  img = nb.Nifti1Image(data, np.eye(4))
+  if not slope is None:
+    img.header.set_slope_inter(slope, inter)
+  filename = str(tmp_path / "image.nii")
+  nb.save(img, filename)
+  return Volume(filename)
+
+def check(stats, values, exact):
+  values = values.astype(np.float64)
+  expected = np.percentile(values, PERCENTILES)
+  found = np.array([stats.percentile(p) for p in PERCENTILES])
+  if exact:
+    # One bin per value, interpolated inside [v, v + 1)
+    assert np.all(np.abs(found - expected) <= 1.0)
+  else:
+    assert found == pytest.approx(expected, rel=0.004)
+  window = np.percentile(values, WINDOW)
+  assert stats.window() == pytest.approx(window, rel=0.004, abs=1.0 if exact else 0.0)
+  assert stats.min == values.min() and stats.max == values.max()
+  assert stats.mean == pytest.approx(values.mean())
+  assert stats.std == pytest.approx(values.std(), rel=1e-6)
+  assert stats.count == values.size
+  assert sum(stats.hist_counts) == values.size
+
+@pytest.fixture
+def rng():
+  return np.random.default_rng(7)
+
+def test_int16(tmp_path, rng):
+  data = rng.normal(300, 400, (40, 36, 50)).astype(np.int16)
+  stats = compute_stats(volume(tmp_path, data))
+  check(stats, data, exact=True)
+
+def test_uint8(tmp_path, rng):
+  data = rng.integers(0, 256, (40, 36, 50)).astype(np.uint8)
+  stats = compute_stats(volume(tmp_path, data))
+  check(stats, data, exact=True)
+
+def test_float32_with_negative_values(tmp_path, rng):
+  data = rng.normal(-20, 100, (40, 36, 50)).astype(np.float32)
+  # Outliers far away do not cost precision elsewhere
+  data[0, 0, :4] = [-3e8, 2e9, 1e-12, -1e-12]
+  stats = compute_stats(volume(tmp_path, data))
+  check(stats, data, exact=False)
+
+def test_nan_values_are_skipped(tmp_path, rng):
+  data = rng.normal(-20, 100, (40, 36, 50)).astype(np.float32)
+  data[rng.random(data.shape) < 0.05] = np.nan
+  data[0, 0, :3] = [np.inf, -np.inf, np.nan]
+  stats = compute_stats(volume(tmp_path, data))
+  finite = data[np.isfinite(data)]
+  assert stats.nonfinite == data.size - finite.size
+  check(stats, finite, exact=False)
+
+def test_scaled_int16(tmp_path, rng):
+  data = rng.normal(0, 1000, (30, 30, 40)).astype(np.int16)
+  stats = compute_stats(volume(tmp_path, data, slope=0.25, inter=-100.0))
+  check(stats, data.astype(np.float64) * 0.25 - 100.0, exact=False)
+
+def test_float_bins_are_ordered():
+  hist = Histogram(np.float32)
+  assert not hist.exact
+  values = np.array([-np.inf, -1e30, -5.0, -1e-30, 0.0, 1e-30, 0.75, 1.0, 7e3, 1e30, np.inf], dtype=np.float32)
+  keys = hist.keys(values)
+  assert np.all(np.diff(keys) >= 0)
+  assert keys[2] < keys[3] < keys[5] < keys[6] < keys[8]
+  for v, k in zip(values[1:-1], keys[1:-1]):
+    assert hist.edge(k) <= v <= hist.edge(k + 1)
+  # Bins are about 0.4% wide around their center
+  k = int(hist.keys(np.array([1234.5], dtype=np.float32))[0])
+  lo, hi = hist.edge(k), hist.edge(k + 1)
+  assert (hi - lo) / (hi + lo) < 0.004
+
+def test_exact_bins():
+  hist = Histogram(np.int16)
+  assert hist.exact and len(hist.counts) == 1 << 16
+  hist.add(np.array([-32768, -1, 0, 0, 32767], dtype=np.int16))
+  assert hist.counts[0] == 1 and hist.counts[32768] == 2 and hist.counts[-1] == 1
+  assert hist.edge(0) == -32768 and hist.edge(32768) == 0
+
+def test_window_falls_back_to_range():
+  stats = IntensityStats({"min": 0.0, "max": 10.0, "quantiles": [0.0] * 200 + [10.0]})
+  assert stats.window() == [0.0, 10.0]
+  assert IntensityStats({"min": -1.0, "max": 1.0}).window() == [-1.0, 1.0]
@@ -0,0 +1,31 @@
+import io, json
+import pytest
+from dcomex.lib.workspace import WorkspaceReader
+
+VALUES = [1, 23, 456, -7.5e10, "ab", True, False, None, 0.125, [1, -20, 3e-5], {"a": -1.5, "b": [12, "x"]}]
+
+def read(text, chunk_size):
+  return list(WorkspaceReader(io.StringIO(text), chunk_size=chunk_size))
+
+@pytest.mark.parametrize("chunk_size", range(1, 40))
+def test_list_values_across_chunks(chunk_size):
+  text = json.dumps({"data": VALUES})
+  assert read(text, chunk_size) == VALUES
+
+@pytest.mark.parametrize("chunk_size", range(1, 12))
+@pytest.mark.parametrize("value", VALUES)
+def test_scalar_values_across_chunks(chunk_size, value):
+  text = json.dumps({"name": value, "data": [value], "other": value})
+  assert read(text, chunk_size) == [value]
+
+@pytest.mark.parametrize("chunk_size", range(1, 8))
+def test_compact_layout(chunk_size):
+  assert read('{"data":[1,23,456,-7.5e10,"ab"]}', chunk_size) == [1, 23, 456, -7.5e10, "ab"]
+
+def test_empty_data():
+  assert read('{"data": []}', 3) == []
+  assert read('{}', 3) == []
+
+def test_invalid_file():
+  with pytest.raises(ValueError):
+    read('{"data": [1 2]}', 2)
@@ -0,0 +1,120 @@
+import os, json
+from argparse import Namespace
+import pytest
+from dcomex.lib.workspace import WorkspaceWriter, iter_workspace_entries
+from dcomex.workspace import assign_shards, handle_split, handle_merge, parse_remaps, remap_path
+
+def write_workspace(filename, entries):
+  with WorkspaceWriter(str(filename)) as writer:
+    for entry in entries:
+      writer.write(entry)
+  return str(filename)
+
+def read_workspace(filename):
+  return list(iter_workspace_entries(str(filename)))
+
+def image(name, path, **extra):
+  return dict({"name": name, "type": "image", "subtype": "nifti", "value": str(path)}, **extra)
+
+def as_set(entries):
+  return sorted(json.dumps(e, sort_keys=True) for e in entries)
+
+@pytest.fixture
+def cohort(tmp_path):
+  entries = []
+  for k, size in enumerate([9000, 100, 4000, 3000, 2000, 500]):
+    folder = tmp_path / "data" / f"sub-{k}"
+    folder.mkdir(parents=True)
+    for name, n in (("t1", size), ("seg", size // 10)):
+      path = folder / f"{name}.nii.gz"
+      path.write_bytes(b"x" * n)
+      entries.append(image(name, path))
+  entries.append({"name": "threshold", "type": "scalar", "subtype": "float", "value": 0.5})
+  entries.append(image("template", tmp_path / "missing" / "template.nii.gz", display="Template"))
+  return write_workspace(tmp_path / "cohort.json", entries), entries
+
+def split(filename, shards, output, by="subject"):
+  handle_split(Namespace(workspace=filename, shards=shards, output=str(output), by=by, pattern=None))
+  return sorted(os.path.join(str(output), f) for f in os.listdir(str(output)))
+
+def merge(output, shards, remaps=(), prefer="first"):
+  handle_merge(Namespace(output=str(output), shards=list(shards), remaps=list(remaps), prefer=prefer, verbose=False))
+  return read_workspace(output)
+
+def test_assign_shards_balances_weights():
+  weights = {"a": 10, "b": 7, "c": 5, "d": 4, "e": 3, "f": 1}
+  assigned = assign_shards(weights, 2)
+  loads = [sum(w for s, w in weights.items() if assigned[s] == k) for k in range(2)]
+  assert sorted(loads) == [15, 15]
+
+  assigned = assign_shards({f"s{k}": 1 for k in range(10)}, 3)
+  counts = [list(assigned.values()).count(k) for k in range(3)]
+  assert sorted(counts) == [3, 3, 4]
+  assert assign_shards({}, 4) == {}
+
+def test_split_keeps_subjects_together(tmp_path, cohort):
+  filename, entries = cohort
+  shards = split(filename, 3, tmp_path / "shards", by="cost")
+  assert [os.path.basename(s) for s in shards] == ["cohort_shard1.json", "cohort_shard2.json", "cohort_shard3.json"]
+
+  seen = {}
+  for k, shard in enumerate(shards):
+    for entry in read_workspace(shard):
+      if entry["type"] == "scalar":
+        continue
+      subject = os.path.basename(os.path.dirname(entry["value"]))
+      if subject == "missing":
+        continue
+      assert seen.setdefault(subject, k) == k
+  assert len(seen) == 6
+  # sub-0 alone outweighs all others
+  assert list(seen.values()).count(seen["sub-0"]) == 1
+
+def test_entries_without_subject_go_to_every_shard(tmp_path, cohort):
+  filename, entries = cohort
+  names = [[e["name"] for e in read_workspace(s)] for s in split(filename, 4, tmp_path / "shards")]
+  assert all("threshold" in n for n in names)
+  # The template has a path, its folder is its subject
+  assert sum("template" in n for n in names) == 1
+
+def test_split_then_merge_round_trips(tmp_path, cohort, capsys):
+  filename, entries = cohort
+  shards = split(filename, 3, tmp_path / "shards")
+  merged = merge(tmp_path / "merged.json", shards)
+  assert as_set(merged) == as_set(entries)
+  assert "2 duplicate(s) and 0 conflict(s)" in capsys.readouterr().out
+
+def test_merge_drops_duplicates_by_digest(tmp_path):
+  a = image("t1", "/data/sub-0/t1.nii.gz", display="T1")
+  # Key order does not change the digest
+  b = {"value": "/data/sub-0/t1.nii.gz", "display": "T1", "subtype": "nifti", "type": "image", "name": "t1"}
+  s1 = write_workspace(tmp_path / "s1.json", [a, image("t1", "/data/sub-1/t1.nii.gz")])
+  s2 = write_workspace(tmp_path / "s2.json", [b, image("t1", "/data/sub-2/t1.nii.gz")])
+  merged = merge(tmp_path / "merged.json", [s2, s1])
+  assert [e["value"] for e in merged] == ["/data/sub-0/t1.nii.gz", "/data/sub-1/t1.nii.gz", "/data/sub-2/t1.nii.gz"]
+
+@pytest.mark.parametrize("prefer, name", [("first", "t1_a"), ("last", "t1_b")])
+def test_merge_conflicts_follow_prefer(tmp_path, capsys, prefer, name):
+  s1 = write_workspace(tmp_path / "a.json", [image("t1_a", "/data/sub-0/t1.nii.gz"), image("seg", "/data/sub-0/seg.nii.gz", display="A")])
+  s2 = write_workspace(tmp_path / "b.json", [image("t1_b", "/data/sub-0/t1.nii.gz"), image("seg", "/data/sub-0/seg.nii.gz", display="B")])
+  merged = merge(tmp_path / "merged.json", [s2, s1], prefer=prefer)
+  assert [e["name"] for e in merged] == [name, "seg"]
+  assert merged[1]["display"] == ("A" if prefer == "first" else "B")
+  assert "0 duplicate(s) and 2 conflict(s)" in capsys.readouterr().out
+
+def test_merge_remaps_paths(tmp_path, capsys):
+  s1 = write_workspace(tmp_path / "a.json", [image("t1", "/scratch/job1/sub-0/t1.nii.gz"), image("ref", "/scratch/other/ref.nii.gz"), {"name": "n", "type": "scalar", "value": "/scratch/job1"}])
+  s2 = write_workspace(tmp_path / "b.json", [image("t1", "/data/sub-0/t1.nii.gz"), image("t2", "/scratch/job1x/t2.nii.gz")])
+  merged = merge(tmp_path / "merged.json", [s1, s2], remaps=["/scratch=/mnt", "/scratch/job1=/data/"])
+  assert [e["value"] for e in merged] == ["/data/sub-0/t1.nii.gz", "/mnt/other/ref.nii.gz", "/scratch/job1", "/mnt/job1x/t2.nii.gz"]
+  assert "1 duplicate(s)" in capsys.readouterr().out
+
+def test_remaps():
+  remaps = parse_remaps(["/a=/x", "/a/b=/y"])
+  assert remaps == [("/a/b", "/y"), ("/a", "/x")]
+  assert remap_path("/a/b/c", remaps) == "/y/c"
+  assert remap_path("/a/bc", remaps) == "/x/bc"
+  assert remap_path("/a", remaps) == "/x"
+  assert remap_path("/ab", remaps) == "/ab"
+  with pytest.raises(ValueError):
+    parse_remaps(["/a:/b"])